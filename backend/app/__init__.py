@@ -4,24 +4,42 @@ from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from app.config import Config
+from app.services.compression import ResponseCompressor
+from app.services.executor import AnalysisExecutor
+from app.services.jobs import JobQueue
+from app.services.renderer import ChartRenderer
+from app.services.result_cache import ResultCache
+from app.services.serialization import JSON_PROVIDERS
 
 # Initialize extensions
 db = SQLAlchemy()
 migrate = Migrate()
 cors = CORS()
 jwt = JWTManager()
+jobs = JobQueue()
+result_cache = ResultCache()
+analysis_executor = AnalysisExecutor()
+chart_renderer = ChartRenderer()
+compressor = ResponseCompressor()
 
 
 def create_app(config_class=Config):
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.json = JSON_PROVIDERS[app.config['JSON_PROVIDER']](app)
 
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
     cors.init_app(app)
     jwt.init_app(app)
+    jobs.init_app(app)
+    result_cache.init_app(app)
+    analysis_executor.init_app(app, cache=result_cache)
+    chart_renderer.init_app(app)
+    # Registered before the other response hooks, so it encodes their final output
+    compressor.init_app(app)
 
     # Register blueprints
     from app.routes.auth import auth_bp
@@ -36,6 +54,17 @@ def create_app(config_class=Config):
     app.register_blueprint(analysis_bp, url_prefix='/api/analysis')
     app.register_blueprint(reports_bp, url_prefix='/api/reports')
 
+    # Register background job tasks
+    from app.services import ingest, reports  # noqa: F401
+
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+
+    # Cache-Control and validators for API responses
+    from app.services.http_cache import register_cache_policies
+    register_cache_policies(app)
+
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app import db, jobs
+from app.models import UploadSession
+from app.services.chunked_upload import remove_session_files
+from app.services.query_plans import check_plans
+from app.services.response_benchmark import run_benchmark
+
+jobs_cli = AppGroup('jobs', help='Background job queue commands')
+queries_cli = AppGroup('queries', help='Database query commands')
+responses_cli = AppGroup('responses', help='API response commands')
+uploads_cli = AppGroup('uploads', help='Upload storage commands')
+
+
+@jobs_cli.command('worker')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty')
+def run_worker(burst):
+    """Run queued jobs from Redis"""
+    click.echo(f'Worker listening on {jobs.app.config["REDIS_URL"]}')
+    jobs.work(burst=burst)
+
+
+@queries_cli.command('check-plans')
+def check_query_plans():
+    """Fail if a listing query scans a whole table or sorts its rows"""
+    failures = 0
+    for name, problems in check_plans(db.session):
+        if problems:
+            failures += 1
+            click.echo(f'FAIL  {name}: ' + '; '.join(problems))
+        else:
+            click.echo(f'ok    {name}')
+    if failures:
+        raise click.ClickException(f'{failures} listing queries are not served by an index in order')
+
+
+@responses_cli.command('benchmark')
+@click.option('--user-id', type=int, required=True, help='User whose latest project data is requested')
+@click.option('--repeat', type=int, default=20, show_default=True, help='Requests timed per variant')
+def benchmark_responses(user_id, repeat):
+    """Compare response bytes and CPU time per endpoint across JSON encoders, formats and compression"""
+    click.echo(f'{"endpoint":<16} {"variant":<20} {"bytes":>10} {"saved":>7} {"cpu ms":>8} {"saved":>7}')
+    baseline = {}
+    for name, variant, size, cpu in run_benchmark(current_app._get_current_object(), user_id, repeat):
+        base_size, base_cpu = baseline.setdefault(name, (size, cpu))
+        click.echo(f'{name:<16} {variant:<20} {size:>10} {1 - size / base_size:>7.0%} '
+                   f'{cpu * 1000:>8.2f} {1 - cpu / base_cpu:>7.0%}')
+
+
+@uploads_cli.command('purge-sessions')
+def purge_upload_sessions():
+    """Delete resumable upload sessions left open longer than UPLOAD_SESSION_TTL, and their files"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['UPLOAD_SESSION_TTL'])
+    expired = UploadSession.query.filter(UploadSession.status == 'open', UploadSession.created_at < cutoff).all()
+    for upload_session in expired:
+        remove_session_files(upload_session)
+        db.session.delete(upload_session)
+    db.session.commit()
+    click.echo(f'Purged {len(expired)} upload sessions')
+
+
+def register_commands(app):
+    """Attach CLI command groups to the app"""
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(queries_cli)
+    app.cli.add_command(responses_cli)
+    app.cli.add_command(uploads_cli)
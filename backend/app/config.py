@@ -21,20 +21,79 @@ class Config:
     # Redis settings
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     
+    # Background job settings (local, redis or eager)
+    JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND') or 'local'
+    JOB_QUEUE_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS') or 2)
+    
+    # Analysis execution settings (process or eager)
+    ANALYSIS_EXECUTOR = os.environ.get('ANALYSIS_EXECUTOR') or 'process'
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS') or 2)
+    ANALYSIS_MAX_RUNNING_PER_USER = int(os.environ.get('ANALYSIS_MAX_RUNNING_PER_USER') or 1)
+    ANALYSIS_MAX_QUEUED_PER_USER = int(os.environ.get('ANALYSIS_MAX_QUEUED_PER_USER') or 10)
+    ANALYSIS_TIMEOUT = int(os.environ.get('ANALYSIS_TIMEOUT') or 300)  # seconds
+    
+    # Analysis result cache settings (redis, local or none); redis falls back to local
+    RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND') or 'redis'
+    RESULT_CACHE_TTL = 7 * 24 * 3600  # seconds
+    RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # local disk bound
+    RESULT_CACHE_MEMORY_ITEMS = 128
+    
     # File upload settings
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads')
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max request body (appends, JSON)
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE') or 10 * 1024 ** 3)  # streamed uploads
+    
+    # Resumable uploads: clients pick a chunk size within these bounds; sessions
+    # not completed UPLOAD_SESSION_TTL seconds after they start can be purged
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+    UPLOAD_CHUNK_MIN_SIZE = 1024 * 1024
+    UPLOAD_CHUNK_MAX_SIZE = 64 * 1024 * 1024
+    UPLOAD_SESSION_TTL = 7 * 24 * 3600
+    
+    # Worker processes profiling the sheets of one workbook at a time; 1 profiles them in the job itself
+    EXCEL_SHEET_WORKERS = int(os.environ.get('EXCEL_SHEET_WORKERS') or min(4, os.cpu_count() or 1))
+    
+    # Cache-Control of each blueprint's GET responses. no-cache lets clients keep a
+    # copy and revalidate it by ETag; URLs naming a content version (?v=) are
+    # cached for IMMUTABLE_MAX_AGE seconds instead.
+    CACHE_CONTROL = {
+        'auth': 'no-store',
+        'projects': 'private, no-cache',
+        'data': 'private, no-cache',
+        'analysis': 'private, no-cache',
+        'reports': 'private, no-cache'
+    }
+    IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+    
+    # Response encoding settings (JSON_PROVIDER is orjson or default, the standard library)
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER') or 'orjson'
+    COMPRESS_MIMETYPES = ['application/json']
+    COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are sent as they are
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4  # favours speed; 11 is for static files
     
     # CORS settings
     CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+    CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']  # readable by the SPA, for If-Match
     
-    # Chart generation settings
+    # Chart generation settings (print output; screen previews use CHART_SCREEN_DPI)
     CHART_DPI = 300
     CHART_FORMAT = 'png'
+    CHART_SCREEN_DPI = 100
+    CHART_RENDERER = os.environ.get('CHART_RENDERER') or 'process'  # process or eager
+    CHART_WORKERS = int(os.environ.get('CHART_WORKERS') or 2)
+    CHART_RENDER_TIMEOUT = 120  # seconds per batch
+    CHART_CACHE_MAX_BYTES = 1024 * 1024 * 1024
     
     # Report settings
     REPORTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'reports')
     
+    # Local result cache folder, used when Redis is unavailable
+    RESULT_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache')
+    
+    # Rendered chart images, keyed by content
+    CHART_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'charts')
+    
     @staticmethod
     def init_app(app):
         """Initialize application-specific configuration"""
@@ -63,6 +122,11 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    JOB_QUEUE_BACKEND = 'eager'
+    ANALYSIS_EXECUTOR = 'eager'
+    RESULT_CACHE_BACKEND = 'none'
+    CHART_RENDERER = 'eager'
+    EXCEL_SHEET_WORKERS = 1
 
 
 config = {
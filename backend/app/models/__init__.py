@@ -1,8 +1,16 @@
-from datetime import datetime
+from datetime import date, datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import JSONB
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
 
+# Values of the native enum types (PostgreSQL); other databases store them as short strings
+DMAIC_STAGES = ('define', 'measure', 'analyze', 'improve', 'control')
+PROJECT_STATUSES = ('active', 'completed', 'on_hold', 'cancelled')
+ANALYSIS_STATUSES = ('pending', 'running', 'completed', 'failed', 'cancelled')
+
+# JSON stored as jsonb on PostgreSQL, so documents can be patched in place
+JSONDocument = db.JSON().with_variant(JSONB(), 'postgresql')
 
 class User(db.Model):
     """User model for authentication and project ownership"""
@@ -52,6 +60,31 @@ class Project(db.Model):
     """DMAIC Project model"""
     
     __tablename__ = 'projects'
+    __table_args__ = (
+        # Keyset pagination of a user's projects by (updated_at, id), unfiltered
+        # or filtered by stage or status
+        db.Index('ix_projects_user_updated', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_projects_user_stage_updated', 'user_id', 'current_stage', 'updated_at', 'id'),
+        db.Index('ix_projects_user_status_updated', 'user_id', 'status', 'updated_at', 'id'),
+    )
+    
+    # Fields the project list returns unless others are requested
+    SUMMARY_FIELDS = [
+        'id', 'title', 'description', 'current_stage', 'status', 'start_date',
+        'target_completion_date', 'actual_completion_date', 'created_at', 'updated_at'
+    ]
+    
+    # Every field of to_dict(); any of them can be requested from the list
+    FIELDS = SUMMARY_FIELDS + [
+        'problem_statement', 'project_goals', 'project_scope', 'stakeholders', 'sipoc_data',
+        'success_metrics', 'baseline_data', 'root_causes', 'hypothesis_results', 'improvement_ideas',
+        'improvement_plan', 'control_plan', 'monitoring_metrics', 'owner', 'version'
+    ]
+    
+    # JSON documents edited by the stage tools, which clients patch rather than replace
+    DOCUMENT_FIELDS = [
+        'sipoc_data', 'baseline_data', 'root_causes', 'hypothesis_results', 'improvement_ideas', 'monitoring_metrics'
+    ]
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -59,43 +92,49 @@ class Project(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     # DMAIC Stage tracking
-    current_stage = db.Column(db.String(20), default='define')  # define, measure, analyze, improve, control
+    current_stage = db.Column(db.Enum(*DMAIC_STAGES, name='dmaic_stage'), default='define')
     
     # Define stage data
     problem_statement = db.Column(db.Text)
     project_goals = db.Column(db.Text)
     project_scope = db.Column(db.Text)
     stakeholders = db.Column(db.Text)
-    sipoc_data = db.Column(db.JSON)  # Store SIPOC diagram data
+    sipoc_data = db.Column(JSONDocument)  # Store SIPOC diagram data
     
     # Measure stage data
     success_metrics = db.Column(db.Text)
-    baseline_data = db.Column(db.JSON)
+    baseline_data = db.Column(JSONDocument)
     
     # Analyze stage data
-    root_causes = db.Column(db.JSON)  # Store fishbone and 5 whys data
-    hypothesis_results = db.Column(db.JSON)
+    root_causes = db.Column(JSONDocument)  # Store fishbone and 5 whys data
+    hypothesis_results = db.Column(JSONDocument)
     
     # Improve stage data
-    improvement_ideas = db.Column(db.JSON)
+    improvement_ideas = db.Column(JSONDocument)
     improvement_plan = db.Column(db.Text)
     
     # Control stage data
     control_plan = db.Column(db.Text)
-    monitoring_metrics = db.Column(db.JSON)
+    monitoring_metrics = db.Column(JSONDocument)
     
     # Project metadata
     start_date = db.Column(db.Date)
     target_completion_date = db.Column(db.Date)
     actual_completion_date = db.Column(db.Date)
-    status = db.Column(db.String(20), default='active')  # active, completed, on_hold, cancelled
+    status = db.Column(db.Enum(*PROJECT_STATUSES, name='project_status'), default='active')
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Incremented by every update; clients send it back (as the ETag) to detect concurrent edits
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+    
     # Relationships
     data_uploads = db.relationship('DataUpload', backref='project', lazy='dynamic', cascade='all, delete-orphan')
     analyses = db.relationship('Analysis', backref='project', lazy='dynamic', cascade='all, delete-orphan')
+    reports = db.relationship('Report', backref='project', lazy='dynamic', cascade='all, delete-orphan')
+    upload_sessions = db.relationship('UploadSession', backref='project', lazy='dynamic', cascade='all, delete-orphan')
     
     def to_dict(self):
         """Convert project to dictionary"""
@@ -123,9 +162,27 @@ class Project(db.Model):
             'actual_completion_date': self.actual_completion_date.isoformat() if self.actual_completion_date else None,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'owner': self.owner.to_dict() if self.owner else None
+            'owner': self.owner.to_dict() if self.owner else None,
+            'version': self.version
         }
     
+    def to_summary_dict(self, fields=None):
+        """Convert project to a list entry holding only the given fields"""
+        summary = {}
+        for field in fields or self.SUMMARY_FIELDS:
+            value = getattr(self, field)
+            if field == 'owner':
+                value = value.to_dict() if value else None
+            elif isinstance(value, date):
+                value = value.isoformat()
+            summary[field] = value
+        return summary
+    
+    @property
+    def etag(self):
+        """Entity tag of the project's current version"""
+        return f'project-{self.id}-v{self.version}'
+    
     def __repr__(self):
         return f'<Project {self.title}>'
 
@@ -134,14 +191,25 @@ class DataUpload(db.Model):
     """Data upload and dataset management"""
     
     __tablename__ = 'data_uploads'
+    __table_args__ = (
+        # Keyset pagination of a project's uploads by (created_at, id)
+        db.Index('ix_data_uploads_project_created', 'project_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
-    file_path = db.Column(db.String(500), nullable=False)
-    file_size = db.Column(db.Integer)
+    file_path = db.Column(db.String(500), nullable=False, index=True)  # Shared by uploads with the same contents
+
+    # Worksheets of a multi-sheet workbook are uploads of their own under the workbook's
+    parent_id = db.Column(db.Integer, db.ForeignKey('data_uploads.id', ondelete='CASCADE'), index=True)
+    sheet_name = db.Column(db.String(255))
+    sheet_index = db.Column(db.Integer)
+    sheet_names = db.Column(db.JSON)  # All worksheets, on the workbook's upload
+    file_size = db.Column(db.BigInteger)
     file_type = db.Column(db.String(50))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the contents, chained across appends
     
     # Data characteristics
     row_count = db.Column(db.Integer)
@@ -150,47 +218,135 @@ class DataUpload(db.Model):
     column_types = db.Column(db.JSON)
     data_summary = db.Column(db.JSON)  # Basic statistics
     
+    # Typed Parquet copy used for all reads after ingestion
+    columnar_path = db.Column(db.String(500))
+    columnar_schema = db.Column(db.JSON)
+    row_index_path = db.Column(db.String(500))  # Byte offsets of CSV rows for paging
+    
     # Upload metadata
     upload_stage = db.Column(db.String(20))  # Which DMAIC stage this data belongs to
     description = db.Column(db.Text)
     is_primary = db.Column(db.Boolean, default=False)  # Is this the main dataset for the project
     
+    # Ingestion status
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    progress = db.Column(db.Float, default=0.0)  # Fraction of the file processed by the ingestion job
+    job_id = db.Column(db.String(36), index=True)
+    error_message = db.Column(db.Text)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
+
+    sheets = db.relationship('DataUpload', backref=db.backref('parent', remote_side=[id]), lazy='dynamic',
+                             cascade='all, delete-orphan', order_by='DataUpload.sheet_index')
+
     def to_dict(self):
         """Convert data upload to dictionary"""
         return {
             'id': self.id,
             'project_id': self.project_id,
+            'parent_id': self.parent_id,
+            'sheet_name': self.sheet_name,
+            'sheet_index': self.sheet_index,
+            'sheet_names': self.sheet_names,
             'filename': self.filename,
             'original_filename': self.original_filename,
             'file_size': self.file_size,
             'file_type': self.file_type,
+            'content_hash': self.content_hash,
             'row_count': self.row_count,
             'column_count': self.column_count,
             'column_names': self.column_names,
             'column_types': self.column_types,
             'data_summary': self.data_summary,
+            'columnar_schema': self.columnar_schema,
             'upload_stage': self.upload_stage,
             'description': self.description,
             'is_primary': self.is_primary,
+            'status': self.status,
+            'progress': self.progress,
+            'job_id': self.job_id,
+            'error_message': self.error_message,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
     
+    def mark_failed(self, error_message):
+        """Record a failed ingestion on the upload and on its worksheets still being read"""
+        self.status = 'failed'
+        self.error_message = error_message
+        for sheet in self.sheets.filter_by(status='running'):
+            sheet.status = 'failed'
+            sheet.error_message = error_message
+    
     def __repr__(self):
         return f'<DataUpload {self.original_filename}>'
 
 
+class UploadSession(db.Model):
+    """A resumable upload whose file is sent in separately checksummed chunks"""
+    
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)  # Unguessable; names the session in URLs
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)  # Chunks are written in place at their offsets
+    file_type = db.Column(db.String(50))
+    file_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    
+    # Metadata for the DataUpload created on completion
+    upload_stage = db.Column(db.String(20))
+    description = db.Column(db.Text)
+    is_primary = db.Column(db.Boolean, default=False)
+    
+    status = db.Column(db.String(20), default='open')  # open, completed
+    data_upload_id = db.Column(db.Integer, db.ForeignKey('data_uploads.id', ondelete='SET NULL'))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def chunk_count(self):
+        return max(-(-self.file_size // self.chunk_size), 1)
+    
+    def to_dict(self):
+        """Convert upload session to dictionary"""
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'original_filename': self.original_filename,
+            'file_type': self.file_type,
+            'file_size': self.file_size,
+            'chunk_size': self.chunk_size,
+            'chunk_count': self.chunk_count,
+            'upload_stage': self.upload_stage,
+            'description': self.description,
+            'is_primary': self.is_primary,
+            'status': self.status,
+            'data_upload_id': self.data_upload_id,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<UploadSession {self.original_filename}>'
+
+
 class Analysis(db.Model):
     """Store analysis results and configurations"""
     
     __tablename__ = 'analyses'
+    __table_args__ = (
+        # A project's analyses newest first, and its completed analyses oldest first
+        db.Index('ix_analyses_project_created', 'project_id', 'created_at', 'id'),
+        db.Index('ix_analyses_project_status_created', 'project_id', 'status', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
-    data_upload_id = db.Column(db.Integer, db.ForeignKey('data_uploads.id'))
+    data_upload_id = db.Column(db.Integer, db.ForeignKey('data_uploads.id'), index=True)
     
     # Analysis metadata
     analysis_type = db.Column(db.String(50), nullable=False)  # descriptive, anova, regression, control_chart, etc.
@@ -204,9 +360,10 @@ class Analysis(db.Model):
     results = db.Column(db.JSON)  # Store analysis results
     charts = db.Column(db.JSON)  # Store chart file paths and metadata
     summary = db.Column(db.Text)  # Plain-English summary
+    incremental_state = db.Column(db.JSON)  # Running statistics for appending data
     
     # Status
-    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    status = db.Column(db.Enum(*ANALYSIS_STATUSES, name='analysis_status'), default='pending')
     error_message = db.Column(db.Text)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -235,4 +392,65 @@ class Analysis(db.Model):
         }
     
     def __repr__(self):
-        return f'<Analysis {self.analysis_type} for Project {self.project_id}>'
\ No newline at end of file
+        return f'<Analysis {self.analysis_type} for Project {self.project_id}>'
+
+
+class Report(db.Model):
+    """Generated project report files"""
+    
+    __tablename__ = 'reports'
+    __table_args__ = (
+        # A project's reports newest first
+        db.Index('ix_reports_project_created', 'project_id', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    
+    # Report metadata
+    report_type = db.Column(db.String(20), nullable=False)  # pdf, xlsx
+    title = db.Column(db.String(200))
+    options = db.Column(db.JSON)  # What to include, e.g. which datasets an export contains
+    
+    # Generated file
+    file_path = db.Column(db.String(500))
+    file_size = db.Column(db.Integer)
+    page_count = db.Column(db.Integer)
+    
+    # Generation status
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    progress = db.Column(db.Float, default=0.0)  # Fraction of the report written by the generation job
+    job_id = db.Column(db.String(36), index=True)
+    error_message = db.Column(db.Text)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Convert report to dictionary"""
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'report_type': self.report_type,
+            'title': self.title,
+            'options': self.options,
+            'file_size': self.file_size,
+            'page_count': self.page_count,
+            'status': self.status,
+            'progress': self.progress,
+            'job_id': self.job_id,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+    
+    def mark_failed(self, error_message):
+        """Record a failed generation on the report"""
+        self.status = 'failed'
+        self.error_message = error_message
+    
+    def __repr__(self):
+        return f'<Report {self.report_type} for Project {self.project_id}>'
@@ -1,15 +1,471 @@
-from flask import Blueprint
+import numpy as np
+from flask import Blueprint, request, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import Schema, fields, ValidationError, validate, validates_schema
+from app import db, analysis_executor, chart_renderer, result_cache
+from app.models import Project, DataUpload, Analysis
+from app.services.columnar import load_columns
+from app.services.downsample import METHODS, downsample
+from app.services.executor import TooManyAnalyses
+from app.services.http_cache import not_modified, version_tag, with_validators
+from app.services.hypothesis import CORRECTIONS, TESTS
+from app.services.listings import project_analyses
+from app.services.pagination import keyset_query
+from app.services.renderer import FORMATS, PURPOSES
+from app.services.result_cache import cache_key
+from app.services.serialization import RECORDS, points_json, response_format
+from app.services.spc import CHART_TYPES, RULES, chart_series, required_columns
 
 analysis_bp = Blueprint('analysis', __name__)
 
-# Statistical analysis routes will be implemented here
+# Statistical analysis routes
+# - Control charts (X-bar/R, X-bar/S, I-MR, p, np, c, u)
 # - Descriptive statistics
-# - Control charts (X-bar R, p-chart)  
-# - Hypothesis testing (t-test, chi-square)
-# - ANOVA
+# - Hypothesis testing (t-test, chi-square, ANOVA) in batches
 # - Linear regression
 # - Chart generation
 
-@analysis_bp.route('/test', methods=['GET'])
-def test():
-    return {'message': 'Analysis routes coming soon'}
\ No newline at end of file
+DMAIC_STAGES = ['define', 'measure', 'analyze', 'improve', 'control']
+
+
+class ControlChartSchema(Schema):
+    """Schema for control chart requests"""
+    data_upload_id = fields.Int(required=True)
+    chart_type = fields.Str(required=True, validate=validate.OneOf(CHART_TYPES))
+    column = fields.Str(required=True)
+    subgroup_size = fields.Int(validate=validate.Range(min=2))
+    subgroup_column = fields.Str()
+    sample_size = fields.Float(validate=validate.Range(min=0, min_inclusive=False))
+    sample_size_column = fields.Str()
+    rules = fields.List(fields.Int(validate=validate.OneOf(list(RULES))))
+    analysis_name = fields.Str(missing=None)
+    dmaic_stage = fields.Str(missing=None, validate=validate.OneOf(DMAIC_STAGES))
+
+
+class HypothesisTestSchema(Schema):
+    """Schema for one test in a hypothesis test batch"""
+    test = fields.Str(missing='auto', validate=validate.OneOf(TESTS))
+    factor = fields.Str(required=True)
+    response = fields.Str(required=True)
+    groups = fields.List(fields.Raw(), validate=validate.Length(equal=2))
+
+
+class HypothesisBatchSchema(Schema):
+    """Schema for hypothesis test batch requests"""
+    data_upload_id = fields.Int(required=True)
+    tests = fields.List(fields.Nested(HypothesisTestSchema))
+    factors = fields.List(fields.Str())
+    responses = fields.List(fields.Str())
+    test = fields.Str(validate=validate.OneOf(TESTS))
+    correction = fields.Str(missing='holm', validate=validate.OneOf(list(CORRECTIONS)))
+    alpha = fields.Float(missing=0.05, validate=validate.Range(min=0, max=1, min_inclusive=False, max_inclusive=False))
+    analysis_name = fields.Str(missing=None)
+    dmaic_stage = fields.Str(missing=None, validate=validate.OneOf(DMAIC_STAGES))
+
+    @validates_schema
+    def validate_tests(self, data, **kwargs):
+        if not data.get('tests') and not (data.get('factors') and data.get('responses')):
+            raise ValidationError('Provide tests, or factors and responses')
+
+
+class ChartBatchSchema(Schema):
+    """Schema for chart rendering requests"""
+    analysis_ids = fields.List(fields.Int())
+    purpose = fields.Str(missing='screen', validate=validate.OneOf(PURPOSES))
+    format = fields.Str(missing=None, validate=validate.OneOf(list(FORMATS)))
+
+
+def get_owned_upload(upload_id, user_id):
+    """Get a data upload if it belongs to one of the user's projects"""
+    return DataUpload.query.join(Project).filter(
+        DataUpload.id == upload_id,
+        Project.user_id == user_id
+    ).first()
+
+
+def get_owned_analysis(analysis_id, user_id):
+    """Get an analysis if it belongs to one of the user's projects"""
+    return Analysis.query.join(Project).filter(
+        Analysis.id == analysis_id,
+        Project.user_id == user_id
+    ).first()
+
+
+def downsampled_chart(series, width, method, fmt=RECORDS):
+    """JSON-ready points of one control chart series, reduced to the requested width
+
+    Limits that are the same for every point are returned once; limits that
+    vary with subgroup or sample size are returned per point.
+    """
+    values = series['values']
+    indices = downsample(values, width, method, keep=series['out_of_control'])
+
+    if series['labels'] is not None:
+        x = [series['labels'][index] for index in indices]
+    else:
+        x = (indices + series['offset']).tolist()
+    columns = {'x': x, 'value': values[indices].tolist(),
+               'out_of_control': series['out_of_control'][indices].tolist()}
+
+    chart = {
+        'total_points': int(values.size),
+        'returned_points': int(indices.size),
+        'out_of_control_points': int(series['out_of_control'].sum())
+    }
+    for key in ('center', 'ucl', 'lcl'):
+        limit = series[key]
+        if limit.size and np.ptp(limit) == 0:
+            chart[key] = float(limit[0])
+        else:
+            columns[key] = limit[indices].tolist()
+    chart['points'] = points_json(columns, fmt)
+    return chart
+
+
+def queue_analysis(analysis, user_id, data_upload, message):
+    """Save an analysis, reusing a cached result or handing it to the process pool"""
+    key = cache_key(data_upload.content_hash, analysis.analysis_type, analysis.configuration)
+    cached = result_cache.get(key)
+    if cached is not None:
+        for field, value in cached.items():
+            setattr(analysis, field, value)
+        analysis.status = 'completed'
+        db.session.add(analysis)
+        db.session.commit()
+        return jsonify({
+            'message': 'Analysis reused from cache',
+            'cached': True,
+            'analysis': analysis.to_dict()
+        }), 201
+
+    db.session.add(analysis)
+    db.session.commit()
+
+    try:
+        analysis_executor.submit(analysis, user_id, data_upload, cache_key=key)
+    except TooManyAnalyses as e:
+        db.session.delete(analysis)
+        db.session.commit()
+        return jsonify({'error': 'Too many analyses in progress', 'details': str(e)}), 429
+
+    db.session.refresh(analysis)
+    return jsonify({
+        'message': message,
+        'cached': False,
+        'analysis': analysis.to_dict()
+    }), 202
+
+
+@analysis_bp.route('/control-chart/<int:project_id>', methods=['POST'])
+@jwt_required()
+def create_control_chart(project_id):
+    """Queue a control chart of a project dataset"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        # Verify project ownership
+        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+
+        # Validate input data
+        schema = ControlChartSchema()
+        data = schema.load(request.json)
+
+        data_upload = get_owned_upload(data['data_upload_id'], current_user_id)
+        if not data_upload or data_upload.project_id != project_id:
+            return jsonify({'error': 'Data upload not found'}), 404
+
+        if data_upload.status != 'completed':
+            return jsonify({'error': 'Data upload is still being processed'}), 409
+
+        configuration = {
+            key: value for key, value in data.items()
+            if key not in ('data_upload_id', 'analysis_name', 'dmaic_stage')
+        }
+        analysis = Analysis(
+            project_id=project_id,
+            data_upload_id=data_upload.id,
+            analysis_type='control_chart',
+            analysis_name=data.get('analysis_name') or f"{data['chart_type']} chart of {data['column']}",
+            dmaic_stage=data.get('dmaic_stage') or project.current_stage,
+            configuration=configuration,
+            status='pending'
+        )
+        return queue_analysis(analysis, current_user_id, data_upload, 'Control chart queued')
+
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create control chart', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/hypothesis-tests/<int:project_id>', methods=['POST'])
+@jwt_required()
+def create_hypothesis_tests(project_id):
+    """Queue a batch of hypothesis tests on a project dataset"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        # Verify project ownership
+        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+
+        # Validate input data
+        schema = HypothesisBatchSchema()
+        data = schema.load(request.json)
+
+        data_upload = get_owned_upload(data['data_upload_id'], current_user_id)
+        if not data_upload or data_upload.project_id != project_id:
+            return jsonify({'error': 'Data upload not found'}), 404
+
+        if data_upload.status != 'completed':
+            return jsonify({'error': 'Data upload is still being processed'}), 409
+
+        configuration = {
+            key: value for key, value in data.items()
+            if key not in ('data_upload_id', 'analysis_name', 'dmaic_stage')
+        }
+        analysis = Analysis(
+            project_id=project_id,
+            data_upload_id=data_upload.id,
+            analysis_type='hypothesis_tests',
+            analysis_name=data.get('analysis_name') or 'Hypothesis tests',
+            dmaic_stage=data.get('dmaic_stage') or project.current_stage,
+            configuration=configuration,
+            status='pending'
+        )
+        return queue_analysis(analysis, current_user_id, data_upload, 'Hypothesis tests queued')
+
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to run hypothesis tests', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/charts/<int:project_id>', methods=['POST'])
+@jwt_required()
+def render_project_charts(project_id):
+    """Render the charts of a project's completed analyses in one batch"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        # Verify project ownership
+        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+
+        # Validate input data
+        schema = ChartBatchSchema()
+        data = schema.load(request.json or {})
+
+        # Oldest first
+        query, order = project_analyses(project_id, status='completed')
+        if data.get('analysis_ids'):
+            query = query.filter(Analysis.id.in_(data['analysis_ids']))
+        analyses = query.order_by(*order).all()
+
+        charts, errors = chart_renderer.render_analyses(analyses, data['purpose'], data['format'])
+        db.session.commit()
+
+        return jsonify({
+            'charts': {str(analysis_id): entries for analysis_id, entries in charts.items()},
+            'errors': {str(analysis_id): messages for analysis_id, messages in errors.items()}
+        }), 200
+
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to render charts', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/<int:project_id>', methods=['GET'])
+@jwt_required()
+def get_project_analyses(project_id):
+    """Get all analyses for a project"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        # Verify project ownership
+        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+
+        analyses = keyset_query(*project_analyses(project_id)).all()
+
+        return jsonify({
+            'analyses': [analysis.to_dict() for analysis in analyses]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get analyses', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/result/<int:analysis_id>', methods=['GET'])
+@jwt_required()
+def get_analysis(analysis_id):
+    """Get a specific analysis"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        analysis = get_owned_analysis(analysis_id, current_user_id)
+        if not analysis:
+            return jsonify({'error': 'Analysis not found'}), 404
+
+        return jsonify({
+            'analysis': analysis.to_dict()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get analysis', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/result/<int:analysis_id>/chart-data', methods=['GET'])
+@jwt_required()
+def get_chart_data(analysis_id):
+    """Get control chart points downsampled to a pixel width"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        analysis = get_owned_analysis(analysis_id, current_user_id)
+        if not analysis:
+            return jsonify({'error': 'Analysis not found'}), 404
+
+        if analysis.analysis_type != 'control_chart':
+            return jsonify({'error': 'Chart data is only available for control charts'}), 400
+        if analysis.status != 'completed':
+            return jsonify({'error': f'Analysis is {analysis.status}'}), 409
+        if not analysis.data_upload:
+            return jsonify({'error': 'Data upload not found'}), 404
+
+        # The points depend only on the results and the data, so an unchanged pair skips loading the data
+        etag = version_tag('chart-data', analysis.id, analysis.updated_at, analysis.data_upload.content_hash)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+
+        # Get query parameters
+        width = int(request.args.get('width', 800))
+        method = request.args.get('method', 'minmax')
+        chart = request.args.get('chart')
+        fmt = response_format()
+        if method not in METHODS:
+            return jsonify({'error': f"method must be one of {', '.join(METHODS)}"}), 400
+        if chart and chart not in analysis.results['charts']:
+            return jsonify({'error': f'Unknown chart: {chart}'}), 400
+
+        df = load_columns(analysis.data_upload, required_columns(analysis.configuration))
+        series = chart_series(df, analysis.results, analysis.configuration)
+        names = [chart] if chart else list(series)
+
+        response = jsonify({
+            'analysis_id': analysis.id,
+            'chart_type': analysis.results['chart_type'],
+            'width': width,
+            'method': method,
+            'format': fmt,
+            'charts': {name: downsampled_chart(series[name], width, method, fmt) for name in names}
+        })
+        return with_validators(response, etag), 200
+
+    except ValueError as e:
+        return jsonify({'error': 'Invalid chart data request', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to get chart data', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/result/<int:analysis_id>/charts/<name>', methods=['GET'])
+@jwt_required()
+def get_chart_image(analysis_id, name):
+    """Get a rendered chart image, drawing it if it is not cached"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        analysis = get_owned_analysis(analysis_id, current_user_id)
+        if not analysis:
+            return jsonify({'error': 'Analysis not found'}), 404
+        if analysis.status != 'completed':
+            return jsonify({'error': f'Analysis is {analysis.status}'}), 409
+
+        purpose = request.args.get('purpose', 'screen')
+        image_format = request.args.get('format')
+        charts, errors = chart_renderer.render_analyses([analysis], purpose, image_format, names=[name])
+        db.session.commit()
+
+        if errors:
+            return jsonify({'error': 'Failed to render chart', 'details': errors[analysis.id]}), 500
+        if not charts[analysis.id]:
+            return jsonify({'error': f'Unknown chart: {name}'}), 404
+
+        # Image keys are derived from everything drawn, so they identify the image
+        entry = charts[analysis.id][0]
+        return send_file(
+            chart_renderer.image_path(entry['key'], entry['format']),
+            mimetype=FORMATS[entry['format']],
+            etag=entry['key'],
+            conditional=True
+        )
+
+    except ValueError as e:
+        return jsonify({'error': 'Invalid chart request', 'details': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to get chart', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/result/<int:analysis_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_analysis(analysis_id):
+    """Cancel a queued or running analysis"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        analysis = get_owned_analysis(analysis_id, current_user_id)
+        if not analysis:
+            return jsonify({'error': 'Analysis not found'}), 404
+
+        if analysis.status not in ('pending', 'running'):
+            return jsonify({'error': f'Analysis is already {analysis.status}'}), 409
+
+        # Mark first so a result arriving meanwhile is discarded
+        analysis.status = 'cancelled'
+        analysis.error_message = 'Analysis cancelled'
+        db.session.commit()
+        analysis_executor.cancel(analysis.id)
+
+        return jsonify({
+            'message': 'Analysis cancelled',
+            'analysis': analysis.to_dict()
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to cancel analysis', 'details': str(e)}), 500
+
+
+@analysis_bp.route('/result/<int:analysis_id>', methods=['DELETE'])
+@jwt_required()
+def delete_analysis(analysis_id):
+    """Delete a specific analysis"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        analysis = get_owned_analysis(analysis_id, current_user_id)
+        if not analysis:
+            return jsonify({'error': 'Analysis not found'}), 404
+
+        analysis_executor.cancel(analysis.id)
+        db.session.delete(analysis)
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Analysis deleted successfully'
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to delete analysis', 'details': str(e)}), 500
@@ -1,94 +1,252 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, current_app, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import EXCLUDE, Schema, fields, validate, ValidationError
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import get_input_stream
 import pandas as pd
 import os
+from sqlalchemy import func
 import uuid
 from datetime import datetime
-from app import db
-from app.models import User, Project, DataUpload
+from app import db, jobs, result_cache
+from app.models import User, Project, DataUpload, UploadSession
 from app.config import Config
+from app.services.chunked_upload import (
+    chunk_digest, chunk_length, create_session_files, missing_chunks, parse_content_digest,
+    received_chunks, remove_session_files, write_chunk
+)
+from app.services.column_types import apply_column_types
+from app.services.columnar import has_columnar_copy, load_columns, read_rows
+from app.services.dataset_query import AGGREGATES, MAX_PAGE_ROWS, OPERATORS, run_query
+from app.services.downsample import METHODS, downsample
+from app.services.http_cache import not_modified, version_tag, versioned, with_validators
+from app.services.ingest import (
+    append_to_upload, find_duplicate, ingest_stream, remove_stored_files, share_stored_data
+)
+from app.services.listings import project_uploads
+from app.services.pagination import keyset_page, list_totals, page_size
+from app.services.row_index import read_page
+from app.services.serialization import frame_json, points_json, response_format
+from app.services.upload_stream import UploadReceiver
 
 data_bp = Blueprint('data', __name__)
 
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 
 
+class UploadSessionCreateSchema(Schema):
+    """Schema for starting a resumable upload"""
+    filename = fields.Str(required=True, validate=validate.Length(min=1, max=255))
+    size = fields.Int(required=True, validate=validate.Range(min=0))
+    chunk_size = fields.Int(missing=None)
+    description = fields.Str(missing='')
+    upload_stage = fields.Str(missing=None)
+    is_primary = fields.Bool(missing=False)
+
+
+class QueryFilterSchema(Schema):
+    """Schema for one predicate of a dataset query"""
+    column = fields.Str(required=True)
+    op = fields.Str(required=True, validate=validate.OneOf(list(OPERATORS)))
+    value = fields.Raw(missing=None, allow_none=True)
+
+
+class QuerySortSchema(Schema):
+    """Schema for one sort key of a dataset query"""
+    column = fields.Str(required=True)
+    descending = fields.Bool(missing=False)
+
+
+class QueryAggregateSchema(Schema):
+    """Schema for one aggregate of a grouped dataset query"""
+    function = fields.Str(required=True, validate=validate.OneOf(list(AGGREGATES)))
+    column = fields.Str(missing=None)
+    name = fields.Str(missing=None)
+
+
+class DataPreviewSchema(Schema):
+    """Schema for the page of rows a data preview returns"""
+    offset = fields.Int(missing=0, validate=validate.Range(min=0))
+    limit = fields.Int(missing=100, validate=validate.Range(min=1, max=MAX_PAGE_ROWS))
+
+
+class DatasetQuerySchema(Schema):
+    """Schema for dataset queries"""
+    columns = fields.List(fields.Str(), missing=None)
+    filters = fields.List(fields.Nested(QueryFilterSchema), missing=list)
+    sort = fields.List(fields.Nested(QuerySortSchema), missing=list)
+    group_by = fields.List(fields.Str(), missing=list)
+    aggregates = fields.List(fields.Nested(QueryAggregateSchema), missing=list)
+    offset = fields.Int(missing=0, validate=validate.Range(min=0))
+    limit = fields.Int(missing=100, validate=validate.Range(min=1, max=MAX_PAGE_ROWS))
+
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def analyze_dataset(file_path, file_type):
-    """Analyze uploaded dataset and return summary statistics"""
+def get_owned_session(session_id, user_id):
+    """Get an upload session if it belongs to one of the user's projects"""
+    return UploadSession.query.join(Project).filter(
+        UploadSession.id == session_id,
+        Project.user_id == user_id
+    ).first()
+
+
+def discard_upload(receiver, data_upload=None):
+    """Remove the files of an upload that was not recorded"""
+    if data_upload is not None and data_upload in db.session:
+        return
+    receiver.abort()
+    if data_upload is not None:
+        remove_stored_files(data_upload)
+
+
+def save_upload(data_upload):
+    """Record a new upload and start its profiling job if it has one"""
+    # If this is set as primary, update other uploads
+    if data_upload.is_primary:
+        DataUpload.query.filter_by(project_id=data_upload.project_id).update({'is_primary': False})
+    
+    db.session.add(data_upload)
+    db.session.commit()
+    list_totals.invalidate(f'uploads:{data_upload.project_id}:')
+    
+    if data_upload.job_id:
+        jobs.enqueue('ingest_upload', data_upload.id, job_id=data_upload.job_id)
+        db.session.refresh(data_upload)
+
+
+def data_version(data_upload):
+    """Content hash of an ingested upload, or None while its data may still change"""
+    return data_upload.content_hash if data_upload.status == 'completed' else None
+
+
+def data_etag(data_upload):
+    """Entity tag of an upload's data: its content hash once ingested, else its last update"""
+    return data_version(data_upload) or version_tag('upload', data_upload.id, data_upload.updated_at)
+
+
+def requested_sheet(data_upload):
+    """The upload, or its worksheet named by the ``sheet`` parameter (None if it has no such sheet)"""
+    name = request.args.get('sheet')
+    if name is None:
+        return data_upload
+    return data_upload.sheets.filter_by(sheet_name=name).first()
+
+
+@data_bp.route('/upload/<int:project_id>', methods=['POST'])
+@jwt_required()
+def upload_data(project_id):
+    """Upload CSV/Excel data to a project
+
+    The multipart body is read as it arrives, saving and hashing the file in
+    the same pass. CSV files are profiled on the way too, so they are ready
+    when the request completes; Excel files are profiled by a background job.
+    A file the user has uploaded before shares the earlier upload's data.
+    """
     try:
-        # Read data based on file type
-        if file_type == 'csv':
-            df = pd.read_csv(file_path)
-        elif file_type in ['xlsx', 'xls']:
-            df = pd.read_excel(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_type}")
-        
-        # Basic dataset information
-        row_count, column_count = df.shape
-        column_names = df.columns.tolist()
-        column_types = df.dtypes.astype(str).to_dict()
-        
-        # Generate summary statistics
-        summary = {
-            'numeric_columns': [],
-            'categorical_columns': [],
-            'missing_values': df.isnull().sum().to_dict(),
-            'data_types': column_types
-        }
+        current_user_id = get_jwt_identity()
         
-        # Analyze numeric columns
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        for col in numeric_cols:
-            col_summary = {
-                'column': col,
-                'count': int(df[col].count()),
-                'mean': float(df[col].mean()) if not df[col].empty else None,
-                'std': float(df[col].std()) if not df[col].empty else None,
-                'min': float(df[col].min()) if not df[col].empty else None,
-                'max': float(df[col].max()) if not df[col].empty else None,
-                'median': float(df[col].median()) if not df[col].empty else None,
-                'quartiles': {
-                    'q1': float(df[col].quantile(0.25)) if not df[col].empty else None,
-                    'q3': float(df[col].quantile(0.75)) if not df[col].empty else None
-                }
-            }
-            summary['numeric_columns'].append(col_summary)
-        
-        # Analyze categorical columns
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
-        for col in categorical_cols:
-            col_summary = {
-                'column': col,
-                'unique_count': int(df[col].nunique()),
-                'most_frequent': df[col].mode().iloc[0] if not df[col].mode().empty else None,
-                'top_values': df[col].value_counts().head(5).to_dict()
-            }
-            summary['categorical_columns'].append(col_summary)
-        
-        return {
-            'row_count': row_count,
-            'column_count': column_count,
-            'column_names': column_names,
-            'column_types': column_types,
-            'summary': summary
-        }
+        # Verify project ownership
+        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        if request.mimetype != 'multipart/form-data' or 'boundary' not in request.mimetype_params:
+            return jsonify({'error': 'Expected a multipart/form-data upload'}), 400
+        
+        # Read the body directly, bounded by the upload limit rather than MAX_CONTENT_LENGTH
+        stream = get_input_stream(request.environ, max_content_length=current_app.config['MAX_UPLOAD_SIZE'])
+        receiver = UploadReceiver(stream, request.mimetype_params['boundary'].encode('ascii'), Config.UPLOAD_FOLDER)
+        
+        # Check if file is present
+        filename = receiver.start()
+        if filename is None:
+            return jsonify({'error': 'No file provided'}), 400
+        if filename == '':
+            receiver.abort()
+            return jsonify({'error': 'No file selected'}), 400
+        
+        if not allowed_file(filename):
+            receiver.abort()
+            return jsonify({'error': 'File type not allowed. Please upload CSV or Excel files.'}), 400
         
+        file_extension = filename.rsplit('.', 1)[1].lower()
+        data_upload = DataUpload(
+            project_id=project_id,
+            filename=os.path.basename(receiver.file_path),
+            original_filename=filename,
+            file_path=receiver.file_path,
+            file_type=file_extension,
+            status='pending',
+            progress=0.0
+        )
+        
+        # Profile CSV files as they arrive; the rest of the body holds any remaining form fields
+        if file_extension == 'csv':
+            try:
+                ingest_stream(data_upload, receiver)
+            except ValueError as e:
+                receiver.abort()
+                return jsonify({'error': 'Upload failed', 'details': str(e)}), 400
+        receiver.finish()
+        data_upload.file_size = receiver.size
+        data_upload.content_hash = receiver.hexdigest()
+        
+        # Get additional metadata
+        data_upload.description = receiver.fields.get('description', '')
+        data_upload.upload_stage = receiver.fields.get('upload_stage', project.current_stage)
+        data_upload.is_primary = receiver.fields.get('is_primary', 'false').lower() == 'true'
+        
+        # Store identical contents once
+        duplicate = find_duplicate(data_upload, current_user_id)
+        if duplicate:
+            remove_stored_files(data_upload)
+            share_stored_data(data_upload, duplicate)
+        elif data_upload.status != 'completed':
+            data_upload.job_id = uuid.uuid4().hex
+        
+        save_upload(data_upload)
+        
+        if data_upload.job_id:
+            return jsonify({
+                'message': 'File uploaded, processing started',
+                'job_id': data_upload.job_id,
+                'data_upload': data_upload.to_dict()
+            }), 202
+        
+        return jsonify({
+            'message': 'File uploaded and processed',
+            'deduplicated': duplicate is not None,
+            'data_upload': data_upload.to_dict()
+        }), 201
+        
+    except HTTPException as e:
+        db.session.rollback()
+        if 'receiver' in locals():
+            discard_upload(receiver, locals().get('data_upload'))
+        return jsonify({'error': 'Upload failed', 'details': e.description}), e.code
     except Exception as e:
-        raise Exception(f"Failed to analyze dataset: {str(e)}")
+        db.session.rollback()
+        # Clean up files if database operation fails
+        if 'receiver' in locals():
+            discard_upload(receiver, locals().get('data_upload'))
+        return jsonify({'error': 'Upload failed', 'details': str(e)}), 500
 
 
-@data_bp.route('/upload/<int:project_id>', methods=['POST'])
+@data_bp.route('/upload/<int:project_id>/sessions', methods=['POST'])
 @jwt_required()
-def upload_data(project_id):
-    """Upload CSV/Excel data to a project"""
+def create_upload_session(project_id):
+    """Start a resumable upload, sent afterwards in chunks
+
+    The file is allocated at its full size up front; chunk ``i`` covers bytes
+    ``i * chunk_size`` up to the next chunk and may be sent in any order,
+    in parallel, and again if its transfer failed.
+    """
     try:
         current_user_id = get_jwt_identity()
         
@@ -97,6 +255,253 @@ def upload_data(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
+        data = UploadSessionCreateSchema().load(request.json or {})
+        if not allowed_file(data['filename']):
+            return jsonify({'error': 'File type not allowed. Please upload CSV or Excel files.'}), 400
+        if data['size'] > current_app.config['MAX_UPLOAD_SIZE']:
+            return jsonify({'error': 'File is larger than the upload limit'}), 413
+        chunk_size = data['chunk_size'] or current_app.config['UPLOAD_CHUNK_SIZE']
+        if not current_app.config['UPLOAD_CHUNK_MIN_SIZE'] <= chunk_size <= current_app.config['UPLOAD_CHUNK_MAX_SIZE']:
+            return jsonify({'error': 'Validation failed', 'details': {'chunk_size': [
+                f"Must be between {current_app.config['UPLOAD_CHUNK_MIN_SIZE']} and "
+                f"{current_app.config['UPLOAD_CHUNK_MAX_SIZE']} bytes."
+            ]}}), 400
+        
+        file_extension = data['filename'].rsplit('.', 1)[1].lower()
+        upload_session = UploadSession(
+            id=uuid.uuid4().hex,
+            project_id=project_id,
+            original_filename=data['filename'],
+            file_path=os.path.join(Config.UPLOAD_FOLDER, f'{uuid.uuid4()}.{file_extension}'),
+            file_type=file_extension,
+            file_size=data['size'],
+            chunk_size=chunk_size,
+            description=data['description'],
+            upload_stage=data['upload_stage'] or project.current_stage,
+            is_primary=data['is_primary'],
+            status='open'
+        )
+        try:
+            create_session_files(upload_session)
+        except OSError as e:
+            return jsonify({'error': 'Not enough storage for the upload', 'details': str(e)}), 507
+        
+        db.session.add(upload_session)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Upload session started',
+            'upload_session': upload_session.to_dict()
+        }), 201
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        if 'upload_session' in locals():
+            remove_session_files(upload_session)
+        return jsonify({'error': 'Failed to start upload session', 'details': str(e)}), 500
+
+
+@data_bp.route('/upload/sessions/<session_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(session_id):
+    """Get an upload session and the chunks it still needs, to resume it"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        upload_session = get_owned_session(session_id, current_user_id)
+        if not upload_session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        missing = missing_chunks(upload_session) if upload_session.status == 'open' else []
+        return jsonify({
+            'upload_session': upload_session.to_dict(),
+            'missing_chunks': missing
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get upload session', 'details': str(e)}), 500
+
+
+@data_bp.route('/upload/sessions/<session_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def put_upload_chunk(session_id, index):
+    """Upload one chunk as the raw request body
+
+    The body must match its ``Content-Digest: sha-256=:<base64>:`` header
+    (RFC 9530). A chunk already received with the same digest is not written
+    again.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        
+        upload_session = get_owned_session(session_id, current_user_id)
+        if not upload_session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        if upload_session.status != 'open':
+            return jsonify({'error': 'Upload session is already complete'}), 409
+        if not 0 <= index < upload_session.chunk_count:
+            return jsonify({'error': f'Chunk index must be below {upload_session.chunk_count}'}), 400
+        
+        expected = parse_content_digest(request.headers.get('Content-Digest'))
+        if expected is None:
+            return jsonify({'error': 'A Content-Digest header with a sha-256 digest is required'}), 400
+        
+        if chunk_digest(upload_session, index) != expected:
+            # Read the body directly, bounded by the chunk's size rather than MAX_CONTENT_LENGTH
+            stream = get_input_stream(request.environ,
+                                      max_content_length=chunk_length(upload_session, index))
+            write_chunk(upload_session, index, stream, expected)
+        
+        return jsonify({
+            'index': index,
+            'received': len(received_chunks(upload_session)),
+            'chunk_count': upload_session.chunk_count
+        }), 200
+        
+    except HTTPException as e:
+        return jsonify({'error': 'Chunk upload failed', 'details': e.description}), e.code
+    except Exception as e:
+        return jsonify({'error': 'Chunk upload failed', 'details': str(e)}), 500
+
+
+@data_bp.route('/upload/sessions/<session_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload_session(session_id):
+    """Finish an upload once every chunk is received and start profiling it
+
+    The assembled file becomes the DataUpload's file as it is; profiling runs
+    as a background job, like Excel uploads.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        
+        upload_session = get_owned_session(session_id, current_user_id)
+        if not upload_session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        if upload_session.status == 'open':
+            missing = missing_chunks(upload_session)
+            if missing:
+                return jsonify({'error': 'Chunks are missing', 'missing_chunks': missing}), 409
+            
+            # Only one request completes the session, however many arrive together
+            claimed = UploadSession.query.filter_by(id=session_id, status='open').update(
+                {'status': 'completed', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+            if claimed:
+                data_upload = DataUpload(
+                    project_id=upload_session.project_id,
+                    filename=os.path.basename(upload_session.file_path),
+                    original_filename=upload_session.original_filename,
+                    file_path=upload_session.file_path,
+                    file_size=upload_session.file_size,
+                    file_type=upload_session.file_type,
+                    description=upload_session.description,
+                    upload_stage=upload_session.upload_stage,
+                    is_primary=upload_session.is_primary,
+                    status='pending',
+                    progress=0.0,
+                    job_id=uuid.uuid4().hex
+                )
+                save_upload(data_upload)
+                upload_session.data_upload_id = data_upload.id
+                db.session.commit()
+                remove_session_files(upload_session, keep_file=True)
+                
+                return jsonify({
+                    'message': 'Upload complete, processing started',
+                    'job_id': data_upload.job_id,
+                    'data_upload': data_upload.to_dict(),
+                    'upload_session': upload_session.to_dict()
+                }), 202
+            db.session.rollback()
+            db.session.refresh(upload_session)
+        
+        # Completed before; report the upload it created
+        data_upload = DataUpload.query.get(upload_session.data_upload_id) if upload_session.data_upload_id else None
+        return jsonify({
+            'message': 'Upload already complete',
+            'job_id': data_upload.job_id if data_upload else None,
+            'data_upload': data_upload.to_dict() if data_upload else None,
+            'upload_session': upload_session.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to complete upload', 'details': str(e)}), 500
+
+
+@data_bp.route('/upload/sessions/<session_id>', methods=['DELETE'])
+@jwt_required()
+def delete_upload_session(session_id):
+    """Abandon an upload session, removing what was received"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        upload_session = get_owned_session(session_id, current_user_id)
+        if not upload_session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        # A completed session's file belongs to its upload now
+        remove_session_files(upload_session, keep_file=upload_session.status != 'open')
+        db.session.delete(upload_session)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Upload session deleted successfully'
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to delete upload session', 'details': str(e)}), 500
+
+
+@data_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_ingestion_job(job_id):
+    """Get status and progress of an ingestion job"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        data_upload = DataUpload.query.join(Project).filter(
+            DataUpload.job_id == job_id,
+            Project.user_id == current_user_id
+        ).first()
+        
+        if not data_upload:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': data_upload.status,
+            'progress': data_upload.progress,
+            'error_message': data_upload.error_message,
+            'data_upload': data_upload.to_dict()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get job status', 'details': str(e)}), 500
+
+
+@data_bp.route('/upload/<int:upload_id>/append', methods=['POST'])
+@jwt_required()
+def append_data(upload_id):
+    """Append new rows to an existing data upload"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        data_upload = DataUpload.query.join(Project).filter(
+            DataUpload.id == upload_id,
+            Project.user_id == current_user_id
+        ).first()
+        
+        if not data_upload:
+            return jsonify({'error': 'Data upload not found'}), 404
+        
+        if data_upload.status != 'completed':
+            return jsonify({'error': 'Data upload is still being processed'}), 409
+        
         # Check if file is present
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -108,66 +513,29 @@ def upload_data(project_id):
         if not allowed_file(file.filename):
             return jsonify({'error': 'File type not allowed. Please upload CSV or Excel files.'}), 400
         
-        # Get additional metadata
-        description = request.form.get('description', '')
-        upload_stage = request.form.get('upload_stage', project.current_stage)
-        is_primary = request.form.get('is_primary', 'false').lower() == 'true'
-        
-        # Generate unique filename
+        # Stage the new rows next to the uploads until they are merged in
         file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
-        
-        # Save file
-        file.save(file_path)
-        file_size = os.path.getsize(file_path)
+        staged_path = os.path.join(Config.UPLOAD_FOLDER, f"{uuid.uuid4()}.append.{file_extension}")
+        file.save(staged_path)
         
-        # Analyze dataset
         try:
-            analysis_result = analyze_dataset(file_path, file_extension)
-        except Exception as e:
-            # Clean up file if analysis fails
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({'error': f'Dataset analysis failed: {str(e)}'}), 400
-        
-        # If this is set as primary, update other uploads
-        if is_primary:
-            DataUpload.query.filter_by(project_id=project_id).update({'is_primary': False})
-        
-        # Create database record
-        data_upload = DataUpload(
-            project_id=project_id,
-            filename=unique_filename,
-            original_filename=file.filename,
-            file_path=file_path,
-            file_size=file_size,
-            file_type=file_extension,
-            row_count=analysis_result['row_count'],
-            column_count=analysis_result['column_count'],
-            column_names=analysis_result['column_names'],
-            column_types=analysis_result['column_types'],
-            data_summary=analysis_result['summary'],
-            upload_stage=upload_stage,
-            description=description,
-            is_primary=is_primary
-        )
-        
-        db.session.add(data_upload)
-        db.session.commit()
+            rows_appended, analyses = append_to_upload(data_upload, staged_path, file_extension)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': 'Append failed', 'details': str(e)}), 400
+        finally:
+            os.remove(staged_path)
         
         return jsonify({
-            'message': 'File uploaded successfully',
+            'message': 'Data appended successfully',
+            'rows_appended': rows_appended,
             'data_upload': data_upload.to_dict(),
-            'analysis': analysis_result
-        }), 201
+            'analyses': [analysis.to_dict() for analysis in analyses]
+        }), 200
         
     except Exception as e:
         db.session.rollback()
-        # Clean up file if database operation fails
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
-        return jsonify({'error': 'Upload failed', 'details': str(e)}), 500
+        return jsonify({'error': 'Append failed', 'details': str(e)}), 500
 
 
 @data_bp.route('/<int:project_id>', methods=['GET'])
@@ -182,12 +550,32 @@ def get_project_data(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        data_uploads = DataUpload.query.filter_by(project_id=project_id).order_by(DataUpload.created_at.desc()).all()
+        cursor = request.args.get('cursor')
+        per_page = page_size(request.args.get('per_page'))
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        
+        # Newest first; continues after the cursor's (created_at, id)
+        query, order = project_uploads(project_id)
+        data_uploads, next_cursor = keyset_page(query, order, cursor, per_page)
+        
+        pagination = {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+        if include_total:
+            pagination['total'] = list_totals.get(
+                f'uploads:{project_id}:',
+                lambda: query.with_entities(func.count(DataUpload.id)).scalar()
+            )
         
         return jsonify({
-            'data_uploads': [upload.to_dict() for upload in data_uploads]
+            'data_uploads': [upload.to_dict() for upload in data_uploads],
+            'pagination': pagination
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': 'Invalid pagination parameters', 'details': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get project data', 'details': str(e)}), 500
 
@@ -207,14 +595,43 @@ def get_data_upload(upload_id):
         if not data_upload:
             return jsonify({'error': 'Data upload not found'}), 404
         
-        return jsonify({
+        etag = version_tag('upload', data_upload.id, data_upload.updated_at)
+        unchanged = not_modified(etag, data_upload.updated_at)
+        if unchanged:
+            return unchanged
+        
+        response = jsonify({
             'data_upload': data_upload.to_dict()
-        }), 200
+        })
+        return with_validators(response, etag, data_upload.updated_at), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get data upload', 'details': str(e)}), 500
 
 
+@data_bp.route('/upload/<int:upload_id>/sheets', methods=['GET'])
+@jwt_required()
+def get_data_sheets(upload_id):
+    """Get the worksheets of a multi-sheet workbook upload"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        data_upload = DataUpload.query.join(Project).filter(
+            DataUpload.id == upload_id,
+            Project.user_id == current_user_id
+        ).first()
+        
+        if not data_upload:
+            return jsonify({'error': 'Data upload not found'}), 404
+        
+        return jsonify({
+            'sheets': [sheet.to_dict() for sheet in data_upload.sheets]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get sheets', 'details': str(e)}), 500
+
+
 @data_bp.route('/upload/<int:upload_id>/data', methods=['GET'])
 @jwt_required()
 def get_data_preview(upload_id):
@@ -230,33 +647,191 @@ def get_data_preview(upload_id):
         if not data_upload:
             return jsonify({'error': 'Data upload not found'}), 404
         
-        # Get query parameters
-        limit = int(request.args.get('limit', 100))
-        offset = int(request.args.get('offset', 0))
+        data_upload = requested_sheet(data_upload)
+        if not data_upload:
+            return jsonify({'error': 'Sheet not found'}), 404
         
-        # Read data
-        if data_upload.file_type == 'csv':
-            df = pd.read_csv(data_upload.file_path, skiprows=offset, nrows=limit)
+        # Answer from the client's copy without reading the file when the data is unchanged
+        etag = data_etag(data_upload)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return versioned(unchanged, data_version(data_upload))
+        
+        # Get query parameters
+        page = DataPreviewSchema().load(request.args, unknown=EXCLUDE)
+        limit = page['limit']
+        offset = page['offset']
+        fmt = response_format()
+        
+        # Read only the requested page: through the CSV row index, the
+        # columnar copy's row groups, or (for legacy uploads) a parse that
+        # keeps the header row
+        if data_upload.row_index_path and os.path.exists(data_upload.row_index_path):
+            df = read_page(data_upload.file_path, data_upload.row_index_path, offset, limit)
+        elif has_columnar_copy(data_upload):
+            df = read_rows(data_upload, offset, limit)
+        elif data_upload.file_type == 'csv':
+            df = pd.read_csv(data_upload.file_path, skiprows=range(1, offset + 1), nrows=limit)
         elif data_upload.file_type in ['xlsx', 'xls']:
-            df = pd.read_excel(data_upload.file_path, skiprows=offset, nrows=limit)
+            df = pd.read_excel(data_upload.file_path, sheet_name=data_upload.sheet_name or 0,
+                               skiprows=range(1, offset + 1), nrows=limit)
         else:
             return jsonify({'error': 'Unsupported file type'}), 400
+        df = apply_column_types(df, dict(data_upload.column_types or {}))
         
-        # Convert to JSON format
-        data = df.to_dict(orient='records')
-        
-        return jsonify({
-            'data': data,
+        response = jsonify({
+            'data': frame_json(df, fmt),
+            'format': fmt,
             'columns': df.columns.tolist(),
             'total_rows': data_upload.row_count,
-            'showing_rows': len(data),
+            'showing_rows': len(df),
             'offset': offset
-        }), 200
+        })
+        return versioned(with_validators(response, etag), data_version(data_upload)), 200
         
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid preview request', 'details': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get data preview', 'details': str(e)}), 500
 
 
+@data_bp.route('/upload/<int:upload_id>/series', methods=['GET'])
+@jwt_required()
+def get_data_series(upload_id):
+    """Get a column as a chart series downsampled to a pixel width"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        data_upload = DataUpload.query.join(Project).filter(
+            DataUpload.id == upload_id,
+            Project.user_id == current_user_id
+        ).first()
+        
+        if not data_upload:
+            return jsonify({'error': 'Data upload not found'}), 404
+        
+        data_upload = requested_sheet(data_upload)
+        if not data_upload:
+            return jsonify({'error': 'Sheet not found'}), 404
+        
+        etag = data_etag(data_upload)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return versioned(unchanged, data_version(data_upload))
+        
+        # Get query parameters
+        column = request.args.get('column')
+        x_column = request.args.get('x')
+        width = int(request.args.get('width', 800))
+        method = request.args.get('method', 'lttb')
+        fmt = response_format()
+        if not column:
+            return jsonify({'error': 'column is required'}), 400
+        if method not in METHODS:
+            return jsonify({'error': f"method must be one of {', '.join(METHODS)}"}), 400
+        
+        columns = [column] + ([x_column] if x_column and x_column != column else [])
+        df = load_columns(data_upload, columns)
+        
+        values = pd.to_numeric(df[column], errors='coerce')
+        if values.notna().sum() == 0:
+            return jsonify({'error': f'{column} has no numeric values'}), 400
+        
+        # Position on the x axis: the x column as numbers or timestamps, else the row number
+        if x_column:
+            x_values = df[x_column]
+            if x_values.dtype.kind == 'M':
+                x_numeric = (x_values - x_values.min()).dt.total_seconds()
+            else:
+                x_numeric = pd.to_numeric(x_values, errors='coerce')
+                if x_numeric.isna().all():
+                    timestamps = pd.to_datetime(x_values, errors='coerce')
+                    x_numeric = (timestamps - pd.Timestamp(0)).dt.total_seconds()
+            valid = values.notna() & x_numeric.notna()
+            # Draw in x order so line charts don't double back
+            ordered = x_numeric[valid].sort_values(kind='stable')
+            values = values[ordered.index]
+            valid = pd.Series(True, index=ordered.index)
+            order = ordered.to_numpy(dtype='float64')
+            labels = x_values[ordered.index]
+        else:
+            valid = values.notna()
+            order = None
+            labels = pd.Series(valid[valid].index, index=valid[valid].index)
+        y = values[valid].to_numpy(dtype='float64')
+        
+        indices = downsample(y, width, method, x=order)
+        x = labels.iloc[indices]
+        if x.dtype.kind == 'M':
+            x = [None if pd.isna(value) else value.isoformat() for value in x]
+        else:
+            x = x.astype(str).tolist() if x.dtype == object else x.tolist()
+        
+        response = jsonify({
+            'column': column,
+            'x': x_column,
+            'width': width,
+            'method': method,
+            'total_points': int(y.size),
+            'returned_points': int(indices.size),
+            'format': fmt,
+            'points': points_json({'x': x, 'value': y[indices].tolist()}, fmt)
+        })
+        return versioned(with_validators(response, etag), data_version(data_upload)), 200
+        
+    except ValueError as e:
+        return jsonify({'error': 'Invalid series request', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to get data series', 'details': str(e)}), 500
+
+
+@data_bp.route('/upload/<int:upload_id>/query', methods=['POST'])
+@jwt_required()
+def query_data(upload_id):
+    """Filter, sort, project and group an upload's rows and return a page of the result"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        data_upload = DataUpload.query.join(Project).filter(
+            DataUpload.id == upload_id,
+            Project.user_id == current_user_id
+        ).first()
+        
+        if not data_upload:
+            return jsonify({'error': 'Data upload not found'}), 404
+        
+        data_upload = requested_sheet(data_upload)
+        if not data_upload:
+            return jsonify({'error': 'Sheet not found'}), 404
+        
+        if data_upload.status != 'completed':
+            return jsonify({'error': 'Data upload is still being processed'}), 409
+        
+        schema = DatasetQuerySchema()
+        query = schema.load(request.json or {})
+        fmt = response_format()
+        
+        df, total = run_query(data_upload, **query)
+        
+        return jsonify({
+            'data': frame_json(df, fmt),
+            'format': fmt,
+            'columns': df.columns.tolist(),
+            'total_rows': total,
+            'showing_rows': len(df),
+            'offset': query['offset']
+        }), 200
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid query', 'details': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to query data', 'details': str(e)}), 500
+
+
 @data_bp.route('/upload/<int:upload_id>/download', methods=['GET'])
 @jwt_required()
 def download_data(upload_id):
@@ -275,11 +850,14 @@ def download_data(upload_id):
         if not os.path.exists(data_upload.file_path):
             return jsonify({'error': 'File not found on server'}), 404
         
-        return send_file(
+        response = send_file(
             data_upload.file_path,
             as_attachment=True,
-            download_name=data_upload.original_filename
+            download_name=data_upload.original_filename,
+            etag=data_etag(data_upload),
+            conditional=True
         )
+        return versioned(response, data_version(data_upload))
         
     except Exception as e:
         return jsonify({'error': 'Failed to download file', 'details': str(e)}), 500
@@ -299,14 +877,25 @@ def delete_data_upload(upload_id):
         
         if not data_upload:
             return jsonify({'error': 'Data upload not found'}), 404
-        
-        # Delete file from filesystem
-        if os.path.exists(data_upload.file_path):
-            os.remove(data_upload.file_path)
+        if data_upload.parent_id is not None:
+            return jsonify({'error': 'Sheets are deleted with their workbook'}), 400
+        
+        # Delete file and its copies from filesystem, unless an upload with the same contents shares them
+        remove_stored_files(data_upload)
+        uploads = [data_upload] + data_upload.sheets.all()
+        for upload in uploads:
+            same_contents = DataUpload.query.filter(
+                DataUpload.content_hash == upload.content_hash,
+                DataUpload.id.notin_([other.id for other in uploads])
+            ).first()
+            if same_contents is None:
+                result_cache.invalidate(upload.content_hash)
         
         # Delete database record
+        project_id = data_upload.project_id
         db.session.delete(data_upload)
         db.session.commit()
+        list_totals.invalidate(f'uploads:{project_id}:')
         
         return jsonify({
             'message': 'Data upload deleted successfully'
@@ -1,9 +1,17 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from marshmallow import Schema, fields, ValidationError
+from marshmallow import Schema, fields, validate, ValidationError
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm.exc import StaleDataError
 from datetime import datetime, date
 from app import db
-from app.models import User, Project
+from app.models import DMAIC_STAGES, PROJECT_STATUSES, User, Project
+from app.services.http_cache import not_modified, with_validators
+from app.services.json_patch import InvalidPatch, PatchConflict
+from app.services.listings import user_projects
+from app.services.pagination import keyset_page, list_totals, page_size
+from app.services.project_patch import JSON_PATCH, MERGE_PATCH, VersionConflict, patch_project, patched_fields
 
 projects_bp = Blueprint('projects', __name__)
 
@@ -24,8 +32,8 @@ class ProjectUpdateSchema(Schema):
     """Schema for project update validation"""
     title = fields.Str(validate=lambda x: len(x.strip()) > 0)
     description = fields.Str()
-    current_stage = fields.Str(validate=lambda x: x in ['define', 'measure', 'analyze', 'improve', 'control'])
-    status = fields.Str(validate=lambda x: x in ['active', 'completed', 'on_hold', 'cancelled'])
+    current_stage = fields.Str(validate=validate.OneOf(DMAIC_STAGES))
+    status = fields.Str(validate=validate.OneOf(PROJECT_STATUSES))
     problem_statement = fields.Str()
     project_goals = fields.Str()
     project_scope = fields.Str()
@@ -44,6 +52,53 @@ class ProjectUpdateSchema(Schema):
     actual_completion_date = fields.Date()
 
 
+class ProjectFilterSchema(Schema):
+    """Schema for project list filters"""
+    stage = fields.Str(missing=None, validate=validate.OneOf(DMAIC_STAGES))
+    status = fields.Str(missing=None, validate=validate.OneOf(PROJECT_STATUSES))
+
+
+def parse_list_fields(value):
+    """Fields requested with a comma-separated ``fields`` parameter (the summary by default)"""
+    if not value:
+        return list(Project.SUMMARY_FIELDS)
+    requested = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in Project.FIELDS]
+    if unknown:
+        raise ValidationError({'fields': [f"Unknown fields: {', '.join(unknown)}"]})
+    return ['id'] + [field for field in dict.fromkeys(requested) if field != 'id']
+
+
+def summarize_projects(user_id, today):
+    """Counts of a user's projects by stage and status, aggregated in one GROUP BY query"""
+    overdue = case(
+        (and_(
+            Project.target_completion_date < today,
+            Project.actual_completion_date.is_(None),
+            Project.status.notin_(['completed', 'cancelled'])
+        ), 1),
+        else_=0
+    )
+    rows = db.session.query(
+        Project.current_stage, Project.status, func.count(Project.id), func.sum(overdue)
+    ).filter(Project.user_id == user_id).group_by(Project.current_stage, Project.status).all()
+    
+    summary = {
+        'total_projects': 0,
+        'by_stage': dict.fromkeys(DMAIC_STAGES, 0),
+        'by_status': dict.fromkeys(PROJECT_STATUSES, 0),
+        'overdue': 0,
+        'overdue_by_stage': dict.fromkeys(DMAIC_STAGES, 0)
+    }
+    for stage, status, count, overdue_count in rows:
+        summary['total_projects'] += count
+        summary['by_stage'][stage] = summary['by_stage'].get(stage, 0) + count
+        summary['by_status'][status] = summary['by_status'].get(status, 0) + count
+        summary['overdue'] += overdue_count or 0
+        summary['overdue_by_stage'][stage] = summary['overdue_by_stage'].get(stage, 0) + (overdue_count or 0)
+    return summary
+
+
 @projects_bp.route('', methods=['POST'])
 @jwt_required()
 def create_project():
@@ -70,6 +125,7 @@ def create_project():
         
         db.session.add(project)
         db.session.commit()
+        list_totals.invalidate(f'projects:{current_user_id}:')
         
         return jsonify({
             'message': 'Project created successfully',
@@ -91,36 +147,45 @@ def get_projects():
         current_user_id = get_jwt_identity()
         
         # Get query parameters
-        stage = request.args.get('stage')
-        status = request.args.get('status')
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
-        
-        # Build query
-        query = Project.query.filter_by(user_id=current_user_id)
-        
-        if stage:
-            query = query.filter_by(current_stage=stage)
-        if status:
-            query = query.filter_by(status=status)
-        
-        # Paginate results
-        projects = query.order_by(Project.updated_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Unknown values are rejected here, as the enum columns cannot be compared with them
+        filters = ProjectFilterSchema().load({key: request.args[key] for key in ('stage', 'status') if request.args.get(key)})
+        stage = filters['stage']
+        status = filters['status']
+        cursor = request.args.get('cursor')
+        per_page = page_size(request.args.get('per_page'))
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        list_fields = parse_list_fields(request.args.get('fields'))
+        
+        # Load only the requested columns (plus the sort key), and the owner in the same query when asked for
+        columns = [getattr(Project, field) for field in list_fields if field != 'owner']
+        options = [load_only(*columns, Project.updated_at)]
+        if 'owner' in list_fields:
+            options.append(joinedload(Project.owner))
+        
+        # Newest first; continues after the cursor's (updated_at, id)
+        query, order = user_projects(current_user_id, stage, status)
+        projects, next_cursor = keyset_page(query.options(*options), order, cursor, per_page)
+        
+        pagination = {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+        if include_total:
+            pagination['total'] = list_totals.get(
+                f'projects:{current_user_id}:{stage}:{status}',
+                lambda: query.with_entities(func.count(Project.id)).scalar()
+            )
         
         return jsonify({
-            'projects': [project.to_dict() for project in projects.items],
-            'pagination': {
-                'page': projects.page,
-                'pages': projects.pages,
-                'per_page': projects.per_page,
-                'total': projects.total,
-                'has_next': projects.has_next,
-                'has_prev': projects.has_prev
-            }
+            'projects': [project.to_summary_dict(list_fields) for project in projects],
+            'pagination': pagination
         }), 200
         
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except ValueError as e:
+        return jsonify({'error': 'Invalid pagination parameters', 'details': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get projects', 'details': str(e)}), 500
 
@@ -132,19 +197,41 @@ def get_project(project_id):
     try:
         current_user_id = get_jwt_identity()
         
-        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        # Check the client's copy against the version before loading the whole project
+        project = Project.query.options(load_only(Project.id, Project.version, Project.updated_at)).filter_by(
+            id=project_id, user_id=current_user_id
+        ).first()
         
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        return jsonify({
+        unchanged = not_modified(project.etag, project.updated_at)
+        if unchanged:
+            return unchanged
+        
+        project = Project.query.populate_existing().get(project_id)
+        response = jsonify({
             'project': project.to_dict()
-        }), 200
+        })
+        return with_validators(response, project.etag, project.updated_at), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get project', 'details': str(e)}), 500
 
 
+def version_mismatch(project):
+    """412 response if the request's If-Match names another version of the project"""
+    if request.headers.get('If-Match') and not request.if_match.contains(project.etag):
+        response = jsonify({
+            'error': 'Project was modified',
+            'details': 'Reload the project and apply the change to its current version',
+            'version': project.version
+        })
+        response.set_etag(project.etag)
+        return response, 412
+    return None
+
+
 @projects_bp.route('/<int:project_id>', methods=['PUT'])
 @jwt_required()
 def update_project(project_id):
@@ -157,6 +244,11 @@ def update_project(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
+        # Optional If-Match: refuse to overwrite changes the client has not seen
+        mismatch = version_mismatch(project)
+        if mismatch:
+            return mismatch
+        
         # Validate input data
         schema = ProjectUpdateSchema()
         data = schema.load(request.json)
@@ -167,14 +259,82 @@ def update_project(project_id):
                 setattr(project, field, value)
         
         db.session.commit()
+        list_totals.invalidate(f'projects:{current_user_id}:')
         
-        return jsonify({
+        response = jsonify({
             'message': 'Project updated successfully',
             'project': project.to_dict()
-        }), 200
+        })
+        response.set_etag(project.etag)
+        return response, 200
         
     except ValidationError as e:
         return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Project was modified', 'details': 'Reload the project and retry'}), 412
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update project', 'details': str(e)}), 500
+
+
+@projects_bp.route('/<int:project_id>', methods=['PATCH'])
+@jwt_required()
+def patch_project_fields(project_id):
+    """Apply a JSON Patch or JSON Merge Patch to a project, returning only what changed"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        # application/json is treated as a merge patch
+        patch_format = JSON_PATCH if request.mimetype == JSON_PATCH else MERGE_PATCH
+        if request.mimetype not in (JSON_PATCH, MERGE_PATCH, 'application/json'):
+            return jsonify({'error': f'Unsupported patch format; use {JSON_PATCH} or {MERGE_PATCH}'}), 415
+        patch = request.get_json(force=True, silent=True)
+        
+        schema = ProjectUpdateSchema()
+        fields = patched_fields(patch_format, patch, schema.fields)
+        
+        # The patched fields are loaded (or patched in the database) later, not here
+        project = Project.query.options(load_only(Project.id, Project.version)).filter_by(
+            id=project_id, user_id=current_user_id
+        ).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        # Patches are deltas against one version, so the version is required
+        if not request.headers.get('If-Match'):
+            return jsonify({'error': 'If-Match header with the project ETag is required'}), 428
+        mismatch = version_mismatch(project)
+        if mismatch:
+            return mismatch
+        
+        changed = patch_project(project, patch_format, patch, fields, schema)
+        db.session.flush()
+        
+        # Documents are not echoed back: the client already holds the patched version.
+        # Built before the commit expires the project, which would reload every column.
+        scalars = [field for field in changed if field not in Project.DOCUMENT_FIELDS]
+        response = jsonify({
+            'message': 'Project updated successfully',
+            'project': project.to_summary_dict(['id', 'version', 'updated_at'] + scalars),
+            'changed': changed
+        })
+        response.set_etag(project.etag)
+        db.session.commit()
+        list_totals.invalidate(f'projects:{current_user_id}:')
+        return response, 200
+        
+    except InvalidPatch as e:
+        return jsonify({'error': 'Invalid patch', 'details': str(e)}), 400
+    except ValidationError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except PatchConflict as e:
+        db.session.rollback()
+        return jsonify({'error': 'Patch does not apply to the current project', 'details': str(e)}), 409
+    except (VersionConflict, StaleDataError):
+        db.session.rollback()
+        return jsonify({'error': 'Project was modified', 'details': 'Reload the project and retry'}), 412
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update project', 'details': str(e)}), 500
@@ -194,6 +354,7 @@ def delete_project(project_id):
         
         db.session.delete(project)
         db.session.commit()
+        list_totals.invalidate(f'projects:{current_user_id}:')
         
         return jsonify({
             'message': 'Project deleted successfully'
@@ -224,6 +385,7 @@ def update_project_stage(project_id):
         
         project.current_stage = new_stage
         db.session.commit()
+        list_totals.invalidate(f'projects:{current_user_id}:')
         
         return jsonify({
             'message': f'Project stage updated to {new_stage}',
@@ -242,30 +404,11 @@ def get_projects_summary():
     try:
         current_user_id = get_jwt_identity()
         
-        projects = Project.query.filter_by(user_id=current_user_id).all()
-        
-        summary = {
-            'total_projects': len(projects),
-            'by_stage': {
-                'define': 0,
-                'measure': 0,
-                'analyze': 0,
-                'improve': 0,
-                'control': 0
-            },
-            'by_status': {
-                'active': 0,
-                'completed': 0,
-                'on_hold': 0,
-                'cancelled': 0
-            }
-        }
-        
-        for project in projects:
-            summary['by_stage'][project.current_stage] += 1
-            summary['by_status'][project.status] += 1
+        # Counted on every request: a per-process cache would serve other
+        # workers' stale counts, and the GROUP BY reads only this user's rows
+        summary = summarize_projects(current_user_id, date.today())
         
         return jsonify(summary), 200
         
     except Exception as e:
-        return jsonify({'error': 'Failed to get projects summary', 'details': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to get projects summary', 'details': str(e)}), 500
@@ -1,12 +1,170 @@
-from flask import Blueprint
+import os
+import uuid
+from flask import Blueprint, request, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import Schema, fields, validate, ValidationError
+from app import db, jobs
+from app.models import Project, Report
+from app.services.listings import project_reports
+from app.services.pagination import keyset_query
 
 reports_bp = Blueprint('reports', __name__)
 
-# Report generation routes will be implemented here
-# - PDF export
-# - Excel export  
-# - DMAIC project summary reports
+REPORT_TYPES = {
+    'pdf': 'application/pdf',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
 
-@reports_bp.route('/test', methods=['GET'])
-def test():
-    return {'message': 'Reports routes coming soon'}
\ No newline at end of file
+
+class ReportCreateSchema(Schema):
+    """Schema for report generation requests"""
+    report_type = fields.Str(missing='pdf', validate=validate.OneOf(list(REPORT_TYPES)))
+    title = fields.Str(missing=None)
+    # Excel exports: which datasets to include as sheets (default: all completed)
+    include_data = fields.Bool(missing=True)
+    data_upload_ids = fields.List(fields.Int(), missing=None)
+
+
+def get_owned_report(report_id, user_id):
+    """Get a report if it belongs to one of the user's projects"""
+    return Report.query.join(Project).filter(
+        Report.id == report_id,
+        Project.user_id == user_id
+    ).first()
+
+
+@reports_bp.route('/project/<int:project_id>', methods=['POST'])
+@jwt_required()
+def create_report(project_id):
+    """Queue generation of a project report"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        # Verify project ownership
+        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+
+        # Validate input data
+        schema = ReportCreateSchema()
+        data = schema.load(request.json or {})
+
+        report = Report(
+            project_id=project_id,
+            user_id=current_user_id,
+            report_type=data['report_type'],
+            title=data['title'] or f"{project.title} - {'DMAIC report' if data['report_type'] == 'pdf' else 'data export'}",
+            options={'include_data': data['include_data'], 'data_upload_ids': data['data_upload_ids']},
+            job_id=uuid.uuid4().hex
+        )
+        db.session.add(report)
+        db.session.commit()
+
+        # Write the file in the background; clients poll the report for progress
+        jobs.enqueue('generate_report', report.id, job_id=report.job_id)
+
+        return jsonify({
+            'message': 'Report generation started',
+            'report': report.to_dict()
+        }), 202
+
+    except ValidationError as e:
+        return jsonify({'error': 'Validation failed', 'details': e.messages}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to start report generation', 'details': str(e)}), 500
+
+
+@reports_bp.route('/project/<int:project_id>', methods=['GET'])
+@jwt_required()
+def get_project_reports(project_id):
+    """Get all reports for a project"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        # Verify project ownership
+        project = Project.query.filter_by(id=project_id, user_id=current_user_id).first()
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+
+        reports = keyset_query(*project_reports(project_id)).all()
+
+        return jsonify({
+            'reports': [report.to_dict() for report in reports]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get reports', 'details': str(e)}), 500
+
+
+@reports_bp.route('/<int:report_id>', methods=['GET'])
+@jwt_required()
+def get_report(report_id):
+    """Get a report and its generation progress"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        report = get_owned_report(report_id, current_user_id)
+        if not report:
+            return jsonify({'error': 'Report not found'}), 404
+
+        return jsonify({
+            'report': report.to_dict()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to get report', 'details': str(e)}), 500
+
+
+@reports_bp.route('/<int:report_id>/download', methods=['GET'])
+@jwt_required()
+def download_report(report_id):
+    """Download a generated report file"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        report = get_owned_report(report_id, current_user_id)
+        if not report:
+            return jsonify({'error': 'Report not found'}), 404
+
+        if report.status != 'completed':
+            return jsonify({'error': f'Report is {report.status}'}), 409
+
+        if not os.path.exists(report.file_path):
+            return jsonify({'error': 'File not found on server'}), 404
+
+        # Sent from disk in blocks, never loaded whole
+        return send_file(
+            report.file_path,
+            mimetype=REPORT_TYPES[report.report_type],
+            as_attachment=True,
+            download_name=f'{report.title}.{report.report_type}',
+            conditional=True
+        )
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to download report', 'details': str(e)}), 500
+
+
+@reports_bp.route('/<int:report_id>', methods=['DELETE'])
+@jwt_required()
+def delete_report(report_id):
+    """Delete a report and its file"""
+    try:
+        current_user_id = get_jwt_identity()
+
+        report = get_owned_report(report_id, current_user_id)
+        if not report:
+            return jsonify({'error': 'Report not found'}), 404
+
+        if report.file_path and os.path.exists(report.file_path):
+            os.remove(report.file_path)
+
+        db.session.delete(report)
+        db.session.commit()
+
+        return jsonify({'message': 'Report deleted successfully'}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to delete report', 'details': str(e)}), 500
@@ -0,0 +1,108 @@
+"""Matplotlib drawings of analysis results
+
+Functions here run inside chart worker processes and return encoded image
+bytes. Only the Agg backend is used, so no display is needed.
+"""
+import io
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+from app.services.columnar import load_columns  # noqa: E402
+from app.services.downsample import downsample  # noqa: E402
+
+FIGURE_WIDTH = 10  # inches
+
+# Hypothesis test charts show at most this many tests, most significant first
+MAX_TESTS_SHOWN = 40
+
+CHART_TITLES = {
+    'xbar': 'X-bar', 'range': 'Range', 'std': 'Standard deviation',
+    'individuals': 'Individuals', 'moving_range': 'Moving range',
+    'p': 'Proportion defective', 'np': 'Number defective', 'c': 'Defects', 'u': 'Defects per unit'
+}
+
+
+def warm_up():
+    """Import and exercise the drawing stack so the first real chart is fast"""
+    figure = plt.figure(figsize=(1, 1))
+    figure.add_subplot().plot([0, 1], [0, 1])
+    figure.savefig(io.BytesIO(), format='png')
+    figure.savefig(io.BytesIO(), format='svg')
+    plt.close(figure)
+
+
+def chart_names(analysis_type, results):
+    """Names of the charts an analysis produces"""
+    if analysis_type == 'control_chart':
+        return list(results['charts'])
+    if analysis_type == 'hypothesis_tests':
+        return ['p_values']
+    return []
+
+
+def _encode(figure, image_format, dpi):
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=image_format, dpi=dpi, bbox_inches='tight')
+    plt.close(figure)
+    return buffer.getvalue()
+
+
+def _control_chart(source, results, configuration, name, dpi):
+    from app.services.spc import chart_series, required_columns
+
+    df = load_columns(source, required_columns(configuration))
+    series = chart_series(df, results, configuration)[name]
+
+    # Never draw more points than the figure has pixels
+    width = int(min(max(FIGURE_WIDTH * dpi, 10), 10_000))
+    indices = downsample(series['values'], width, 'minmax', keep=series['out_of_control'])
+    x = indices + series['offset']
+    values = series['values'][indices]
+    flagged = series['out_of_control'][indices]
+
+    figure, axes = plt.subplots(figsize=(FIGURE_WIDTH, 3.5))
+    axes.plot(x, values, color='#1f4e79', linewidth=0.8, marker='o' if indices.size <= 200 else None,
+              markersize=3)
+    for key, style in (('center', '-'), ('ucl', '--'), ('lcl', '--')):
+        axes.step(x, series[key][indices], where='mid', linestyle=style, linewidth=1,
+                  color='#2e7d32' if key == 'center' else '#c62828', label=key.upper())
+    if flagged.any():
+        axes.scatter(x[flagged], values[flagged], color='#c62828', s=14, zorder=3, label='Out of control')
+
+    axes.set_title(f"{CHART_TITLES.get(name, name)} chart of {results['column']}")
+    axes.set_xlabel('Subgroup' if results['chart_type'] in ('xbar_r', 'xbar_s') else 'Sample')
+    axes.legend(loc='upper right', fontsize=8)
+    axes.grid(alpha=0.3)
+    return figure
+
+
+def _hypothesis_tests(results):
+    tests = [test for test in results['tests'] if test.get('p_adjusted') is not None]
+    tests = sorted(tests, key=lambda test: test['p_adjusted'])[:MAX_TESTS_SHOWN][::-1]
+    scores = [-np.log10(max(test['p_adjusted'], 1e-300)) for test in tests]
+    labels = [f"{test['factor']} → {test['response']}" for test in tests]
+    colors = ['#c62828' if test['significant'] else '#90a4ae' for test in tests]
+
+    figure, axes = plt.subplots(figsize=(FIGURE_WIDTH, max(2.5, 0.3 * len(tests) + 1)))
+    axes.barh(labels, scores, color=colors)
+    axes.axvline(-np.log10(results['alpha']), color='#37474f', linestyle='--', linewidth=1,
+                 label=f"alpha = {results['alpha']:g}")
+    axes.set_xlabel(f"-log10 adjusted p-value ({results['correction']})")
+    axes.set_title('Hypothesis tests')
+    axes.legend(loc='lower right', fontsize=8)
+    axes.grid(axis='x', alpha=0.3)
+    return figure
+
+
+def render(source, analysis_type, results, configuration, name, image_format, dpi):
+    """Draw one chart of an analysis and return the encoded image"""
+    if analysis_type == 'control_chart':
+        figure = _control_chart(source, results, configuration, name, dpi)
+    elif analysis_type == 'hypothesis_tests':
+        figure = _hypothesis_tests(results)
+    else:
+        raise ValueError(f'No charts for {analysis_type} analyses')
+    return _encode(figure, image_format, dpi)
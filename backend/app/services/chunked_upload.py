@@ -0,0 +1,134 @@
+"""Storage for resumable uploads sent in chunks
+
+The file is created at its final size when the session starts, and each
+chunk is written in place at its offset, so chunks can arrive in any order
+or in parallel and nothing is copied when the upload completes. Once a
+chunk's bytes are written, synced and match its checksum, a marker file
+holding the checksum records it as received. A chunk without a marker is
+missing and is simply sent again.
+"""
+import base64
+import hashlib
+import os
+import re
+import shutil
+
+from werkzeug.exceptions import BadRequest
+
+from app.services.storage import atomic_write
+
+# Bytes read from the request body at a time
+WRITE_BLOCK_BYTES = 1024 * 1024
+
+# RFC 9530 Content-Digest: sha-256=:<base64 digest>:
+CONTENT_DIGEST = re.compile(r'(?:^|,)\s*sha-256=:([A-Za-z0-9+/]+=*):')
+
+
+def session_folder(upload_session):
+    """Folder holding a session's chunk markers"""
+    return os.path.join(os.path.dirname(upload_session.file_path), 'sessions', upload_session.id)
+
+
+def _marker_path(upload_session, index):
+    return os.path.join(session_folder(upload_session), f'{index}.sha256')
+
+
+def chunk_length(upload_session, index):
+    """Expected size of a chunk; the last one holds the remainder"""
+    return min(upload_session.chunk_size, upload_session.file_size - index * upload_session.chunk_size)
+
+
+def parse_content_digest(header):
+    """Hex SHA-256 from a Content-Digest header, or None without one"""
+    match = CONTENT_DIGEST.search(header or '')
+    if not match:
+        return None
+    try:
+        digest = base64.b64decode(match.group(1), validate=True)
+    except ValueError:
+        return None
+    return digest.hex() if len(digest) == hashlib.sha256().digest_size else None
+
+
+def create_session_files(upload_session):
+    """Allocate the session's file at its full size; raises OSError if the disk cannot hold it"""
+    os.makedirs(session_folder(upload_session), exist_ok=True)
+    fd = os.open(upload_session.file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        if upload_session.file_size and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, upload_session.file_size)
+        else:
+            os.ftruncate(fd, upload_session.file_size)
+    except OSError:
+        os.close(fd)
+        remove_session_files(upload_session)
+        raise
+    os.close(fd)
+
+
+def write_chunk(upload_session, index, stream, expected_sha256):
+    """Write one chunk at its offset and mark it received if its checksum matches
+
+    Raises BadRequest for a chunk of the wrong size or checksum; its bytes
+    may have been written, but without a marker it still counts as missing.
+    """
+    length = chunk_length(upload_session, index)
+    offset = index * upload_session.chunk_size
+    digest = hashlib.sha256()
+    written = 0
+
+    # A chunk sent again with other contents is missing until they are verified
+    marker = _marker_path(upload_session, index)
+    if os.path.exists(marker):
+        os.remove(marker)
+
+    fd = os.open(upload_session.file_path, os.O_WRONLY)
+    try:
+        for block in iter(lambda: stream.read(WRITE_BLOCK_BYTES), b''):
+            if written + len(block) > length:
+                raise BadRequest(f'Chunk {index} must be {length} bytes')
+            digest.update(block)
+            view = memoryview(block)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                written += count
+                view = view[count:]
+        if written != length:
+            raise BadRequest(f'Chunk {index} must be {length} bytes, got {written}')
+        if digest.hexdigest() != expected_sha256:
+            raise BadRequest(f'Chunk {index} does not match its Content-Digest')
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    atomic_write(marker, expected_sha256.encode('ascii'))
+
+
+def chunk_digest(upload_session, index):
+    """Hex SHA-256 a received chunk was verified against, or None if it is missing"""
+    try:
+        with open(_marker_path(upload_session, index)) as handle:
+            return handle.read()
+    except FileNotFoundError:
+        return None
+
+
+def received_chunks(upload_session):
+    """Indexes of the chunks recorded as received"""
+    folder = session_folder(upload_session)
+    if not os.path.isdir(folder):
+        return set()
+    return {int(name.split('.')[0]) for name in os.listdir(folder) if name.endswith('.sha256')}
+
+
+def missing_chunks(upload_session):
+    """Indexes of the chunks still to be sent, in order"""
+    received = received_chunks(upload_session)
+    return [index for index in range(upload_session.chunk_count) if index not in received]
+
+
+def remove_session_files(upload_session, keep_file=False):
+    """Remove a session's markers and, unless it was handed to a DataUpload, its file"""
+    shutil.rmtree(session_folder(upload_session), ignore_errors=True)
+    if not keep_file and os.path.exists(upload_session.file_path):
+        os.remove(upload_session.file_path)
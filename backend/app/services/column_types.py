@@ -0,0 +1,203 @@
+"""Column types inferred for uploaded datasets and applied whenever they are loaded
+
+Left to itself pandas reads every text column as Python strings and never
+parses dates. Types are instead inferred once, from the upload's first
+rows: repetitive text becomes categorical, pass/fail style labels become
+booleans, dates become timestamps and integers take the smallest type that
+holds them. Floats stay float64 so measurements keep their precision. The
+types are recorded in ``DataUpload.column_types``; the columnar copy is
+written with them and every later load gets the same dtypes. Date columns
+are recorded with the format the sample was parsed with, as
+``datetime64[ns]|%d/%m/%Y``, so every chunk and every later load reads
+day and month in the same order.
+
+Later chunks can contradict the sample (a larger integer, an unparseable
+date); the column is then widened, and the recorded types say what the
+whole dataset was loaded as.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+# Rows types are inferred from; later rows that do not fit widen the column
+SAMPLE_ROWS = 10_000
+
+# Text columns with at most this many distinct values per non-missing value are categorical
+CATEGORY_MAX_RATIO = 0.5
+
+# Labels of two-valued columns read as booleans, matched case-insensitively
+BOOLEAN_LABELS = [('pass', 'fail'), ('true', 'false'), ('yes', 'no'), ('y', 'n'), ('ok', 'nok')]
+BOOLEAN_VALUES = {label: value for pair in BOOLEAN_LABELS for label, value in zip(pair, (True, False))}
+
+INTEGER_TYPES = ('int8', 'int16', 'int32', 'int64')
+
+# Separates a date column's dtype from its format in a recorded type
+FORMAT_SEPARATOR = '|'
+
+
+def _smallest_integer(series):
+    if series.empty:
+        return 'int64'
+    low, high = series.min(), series.max()
+    for dtype in INTEGER_TYPES:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    return str(series.dtype)
+
+
+def _boolean_values(series):
+    """The boolean of each distinct value, or None unless they are labels of one boolean pair"""
+    labels = {value: str(value).strip().lower() for value in series.unique()}
+    if not any(set(labels.values()) <= set(pair) for pair in BOOLEAN_LABELS):
+        return None
+    return {value: BOOLEAN_VALUES[label] for value, label in labels.items()}
+
+
+def split_type(column_type):
+    """A recorded column type as ``(dtype, date format or None)``"""
+    dtype, _, fmt = column_type.partition(FORMAT_SEPARATOR)
+    return dtype, fmt or None
+
+
+def _to_dates(series, fmt):
+    """A text column parsed as dates in ``fmt``, or None if some values do not match it"""
+    try:
+        return pd.to_datetime(series, format=fmt)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _parse_dates(series, example):
+    """A text column parsed as dates and the format they are in, or (None, None) if it is not dates
+
+    The format is guessed from ``example`` month first and day first; the
+    first guess every value matches is used.
+    """
+    for dayfirst in (False, True):
+        with warnings.catch_warnings():
+            # pandas warns when a month-first guess finds the day first; the other order is tried next
+            warnings.simplefilter('ignore', UserWarning)
+            fmt = guess_datetime_format(str(example), dayfirst=dayfirst)
+        # Times of day alone are left as text rather than dated 1900-01-01
+        if fmt is None or not any(code in fmt for code in ('%d', '%m', '%b', '%B')):
+            continue
+        dates = _to_dates(series, fmt)
+        if dates is not None:
+            return dates, fmt
+    return None, None
+
+
+def _infer(series):
+    kind = series.dtype.kind
+    if kind == 'b':
+        return 'bool'
+    if kind in 'iu':
+        return _smallest_integer(series)
+    if kind == 'f':
+        return 'float64'
+    if kind != 'O':
+        return str(series.dtype)
+
+    values = series.dropna()
+    if values.empty:
+        return 'object'
+    # Booleans cannot hold missing values, so gaps keep the labels as text
+    if _boolean_values(series) is not None:
+        return 'bool'
+    dates, fmt = _parse_dates(values, values.iloc[0])
+    if dates is not None:
+        return f'{dates.dtype}{FORMAT_SEPARATOR}{fmt}'
+    if values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+        return 'category'
+    return 'object'
+
+
+def infer_column_types(df):
+    """Column types for a dataset, inferred from the first SAMPLE_ROWS rows of a DataFrame of it"""
+    sample = df.head(SAMPLE_ROWS)
+    return {str(column): _infer(sample[column]) for column in sample.columns}
+
+
+def _convert(series, column_type):
+    """A column as its recorded type, or None if its values do not fit"""
+    dtype, fmt = split_type(column_type)
+    kind = series.dtype.kind
+    if dtype == 'category':
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        if kind != 'O':
+            series = series.where(series.isna(), series.astype(str))
+        return series.astype('category')
+    if dtype == 'bool':
+        if kind == 'b':
+            return series
+        values = _boolean_values(series)
+        return None if values is None else series.map(values).astype(bool)
+    if dtype.startswith('datetime64'):
+        if str(series.dtype) == dtype:
+            return series
+        values = series.dropna()
+        if values.empty:
+            return pd.Series(pd.NaT, index=series.index, dtype=dtype)
+        if kind != 'O':
+            return None
+        if fmt is not None:
+            converted = _to_dates(series, fmt)
+        else:
+            # Recorded before formats were; guessed from the values as they were then
+            converted, _ = _parse_dates(series, values.iloc[0])
+        return converted if converted is not None and str(converted.dtype) == dtype else None
+    if dtype in INTEGER_TYPES:
+        if kind not in 'iu':
+            return None
+        if series.empty or (np.iinfo(dtype).min <= series.min() and series.max() <= np.iinfo(dtype).max):
+            return series.astype(dtype)
+        return None
+    if dtype == 'float64':
+        return series.astype(dtype) if kind in 'iuf' else None
+    # Text and anything else is kept as read
+    return series
+
+
+def _widen(dtype, series):
+    """The narrowest recorded type a column that did not fit ``dtype`` can be loaded as"""
+    kind = series.dtype.kind
+    if dtype in INTEGER_TYPES and kind in 'iu':
+        return 'int64'
+    if dtype in INTEGER_TYPES + ('float64',) and kind in 'iuf':
+        return 'float64'
+    return 'object'
+
+
+def apply_column_types(df, column_types):
+    """Convert a DataFrame's columns to their recorded types
+
+    Columns without a recorded type are left as read. When a column's
+    values do not fit its type (or, for dates, its format), ``column_types``
+    is widened in place and the column converted to the wider type.
+    """
+    df = df.copy(deep=False)
+    for column in df.columns:
+        dtype = column_types.get(str(column))
+        if dtype is None:
+            continue
+        series = df[column]
+        converted = _convert(series, dtype)
+        if converted is None:
+            dtype = column_types[str(column)] = _widen(dtype, series)
+            converted = _convert(series, dtype)
+        df[column] = converted
+    return df
+
+
+def category_columns(source, columns=None):
+    """Columns of a DataUpload-like object recorded as categorical, among ``columns`` if given"""
+    column_types = getattr(source, 'column_types', None) or {}
+    return [column for column, dtype in column_types.items()
+            if dtype == 'category' and (columns is None or column in columns)]
@@ -0,0 +1,279 @@
+"""Typed Parquet shadow copies of uploaded datasets"""
+import glob
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.services.column_types import apply_column_types, category_columns
+
+# Small row groups keep single-page reads cheap
+ROW_GROUP_ROWS = 50_000
+
+
+def columnar_path_for(file_path, sheet_index=None):
+    """Directory holding the Parquet copy of an uploaded file, or of one sheet of a workbook"""
+    base = os.path.splitext(file_path)[0]
+    if sheet_index is not None:
+        base = f'{base}.sheet-{sheet_index}'
+    return base + '.parquet'
+
+
+def part_paths(columnar_path):
+    """Parquet part files of a columnar copy, in row order"""
+    return sorted(glob.glob(os.path.join(columnar_path, 'part-*.parquet')))
+
+
+def schema_to_json(schema):
+    """Recordable description of an Arrow schema"""
+    return [{'name': field.name, 'type': str(field.type)} for field in schema]
+
+
+def remove_columnar_copy(columnar_path):
+    if columnar_path and os.path.isdir(columnar_path):
+        shutil.rmtree(columnar_path)
+
+
+def _promote(current, incoming):
+    """Narrowest Arrow type both a column's existing and incoming values fit"""
+    if current == incoming or pa.types.is_null(incoming):
+        return current
+    if pa.types.is_null(current):
+        return incoming
+    if pa.types.is_integer(current) and pa.types.is_integer(incoming):
+        return pa.int64()
+    numeric = (pa.types.is_integer, pa.types.is_floating)
+    if any(check(current) for check in numeric) and any(check(incoming) for check in numeric):
+        return pa.float64()
+    return pa.string()
+
+
+def _to_arrow(chunk):
+    """Convert a pandas chunk, falling back to strings for mixed object columns
+
+    Categoricals are stored as their plain values, which Parquet
+    dictionary-encodes per row group anyway, so every chunk has the same
+    type whatever its categories; loads read them back as categoricals.
+    """
+    arrays = []
+    for column in chunk.columns:
+        series = chunk[column]
+        try:
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                arrays.append(pa.array(series, from_pandas=True).dictionary_decode())
+                continue
+            arrays.append(pa.array(series, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array(series.where(series.isna(), series.astype(str)), from_pandas=True))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in chunk.columns])
+
+
+class ColumnarWriter:
+    """Append pandas chunks to a Parquet part, widening the schema as needed
+
+    A chunk whose types do not fit the schema written so far (e.g. floats
+    after integers, or text after numbers) causes the part to be rewritten
+    row group by row group with the widened schema, so memory stays bounded.
+    """
+
+    def __init__(self, columnar_path, part=0):
+        self.columnar_path = columnar_path
+        self.path = os.path.join(columnar_path, f'part-{part:05d}.parquet')
+        self.schema = None
+        self._writer = None
+        os.makedirs(columnar_path, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, chunk):
+        table = _to_arrow(chunk)
+        if self.schema is None:
+            self.schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            widened = pa.schema([
+                pa.field(field.name, _promote(field.type, table.schema.field(field.name).type))
+                for field in self.schema
+            ])
+            if not widened.equals(self.schema):
+                self._rewrite(widened)
+        self._writer.write_table(table.cast(self.schema), row_group_size=ROW_GROUP_ROWS)
+
+    def _rewrite(self, schema):
+        """Re-encode the rows written so far under a wider schema"""
+        self._writer.close()
+        previous = self.path + '.old'
+        os.replace(self.path, previous)
+
+        self._writer = pq.ParquetWriter(self.path, schema)
+        source = pq.ParquetFile(previous)
+        for index in range(source.num_row_groups):
+            self._writer.write_table(source.read_row_group(index).cast(schema))
+        os.remove(previous)
+        self.schema = schema
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def rebuild_text_columns(path, chunks):
+    """Rewrite columns of a Parquet part as text taken from ``chunks`` of the source
+
+    For columns that became text after row groups were written in another
+    type: casting those row groups would spell values differently from the
+    file (``true`` for ``Pass``). ``chunks`` hold just those columns, read
+    as text, in row order; row groups are rewritten one at a time. Returns
+    the part's new schema.
+    """
+    source = pq.ParquetFile(path)
+    chunks = iter(chunks)
+    pending = None
+    writer = None
+    rebuilt = path + '.rebuilt'
+    try:
+        for index in range(source.num_row_groups):
+            group = source.read_row_group(index)
+            while pending is None or pending.num_rows < group.num_rows:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise ValueError('The source has fewer rows than the columnar copy')
+                text = _to_arrow(chunk)
+                text = text.cast(pa.schema([pa.field(name, pa.string()) for name in text.column_names]))
+                pending = text if pending is None else pa.concat_tables([pending, text])
+            replacement, pending = pending.slice(0, group.num_rows), pending.slice(group.num_rows)
+            for name in replacement.column_names:
+                group = group.set_column(group.schema.get_field_index(name), pa.field(name, pa.string()),
+                                         replacement[name])
+            if writer is None:
+                writer = pq.ParquetWriter(rebuilt, group.schema)
+            writer.write_table(group, row_group_size=ROW_GROUP_ROWS)
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(rebuilt)
+        raise
+    if writer is None:
+        return source.schema_arrow
+    writer.close()
+    os.replace(rebuilt, path)
+    return pq.read_schema(path)
+
+
+def _to_pandas(table):
+    """DataFrame of an Arrow table, categories sorted as astype('category') sorts them"""
+    df = table.to_pandas()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            # Dictionaries list values in order of first appearance
+            df[column] = df[column].cat.reorder_categories(df[column].cat.categories.sort_values())
+    return df
+
+
+def has_columnar_copy(source):
+    """Whether a DataUpload-like object has a usable Parquet copy"""
+    path = getattr(source, 'columnar_path', None)
+    return bool(path) and os.path.isdir(path) and bool(part_paths(path))
+
+
+def write_columnar_copy(chunks, columnar_path):
+    """Write DataFrame chunks to a fresh columnar copy and return its schema"""
+    remove_columnar_copy(columnar_path)
+    with ColumnarWriter(columnar_path) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return writer.schema
+
+
+def append_columnar_part(columnar_path, chunk):
+    """Write appended rows as a new part under the existing schema
+
+    Raises ``pyarrow.ArrowInvalid`` if the rows do not fit the column types
+    already written.
+    """
+    parts = part_paths(columnar_path)
+    schema = pq.read_schema(parts[0])
+    table = _to_arrow(chunk[schema.names]).cast(schema)
+    path = os.path.join(columnar_path, f'part-{len(parts):05d}.parquet')
+    pq.write_table(table, path, row_group_size=ROW_GROUP_ROWS)
+    return path
+
+
+def load_columns(source, columns=None):
+    """Load selected columns of a DataUpload-like object as a DataFrame
+
+    Reads the Parquet copy when there is one and only decodes the requested
+    columns; otherwise falls back to parsing the original file. Either way
+    the columns have the upload's recorded types.
+    """
+    columns = list(columns) if columns is not None else None
+    if columns is not None and getattr(source, 'column_names', None):
+        missing = [column for column in columns if column not in source.column_names]
+        if missing:
+            raise ValueError(f"Unknown columns: {', '.join(missing)}")
+
+    if has_columnar_copy(source):
+        # Categorical columns are decoded straight from their Parquet dictionaries
+        table = pq.read_table(part_paths(source.columnar_path), columns=columns,
+                              read_dictionary=category_columns(source, columns))
+        return _to_pandas(table)
+
+    if source.file_type == 'csv':
+        df = pd.read_csv(source.file_path, usecols=columns)
+    elif source.file_type in ['xlsx', 'xls']:
+        df = pd.read_excel(source.file_path, sheet_name=getattr(source, 'sheet_name', None) or 0, usecols=columns)
+    else:
+        raise ValueError(f"Unsupported file type: {source.file_type}")
+    return apply_column_types(df, dict(getattr(source, 'column_types', None) or {}))
+
+
+def iter_columnar_chunks(source, chunksize=ROW_GROUP_ROWS, columns=None):
+    """Yield DataFrame chunks of a columnar copy, one record batch at a time"""
+    categories = category_columns(source, columns)
+    for path in part_paths(source.columnar_path):
+        parquet_file = pq.ParquetFile(path, read_dictionary=categories)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield _to_pandas(batch)
+
+
+def read_rows(source, offset, limit, columns=None):
+    """Read rows [offset, offset + limit) from a columnar copy
+
+    Only the row groups overlapping the window are decoded.
+    """
+    columns = list(columns) if columns is not None else None
+    tables = []
+    position = 0
+    end = offset + limit
+    categories = category_columns(source, columns)
+    for path in part_paths(source.columnar_path):
+        parquet_file = pq.ParquetFile(path, read_dictionary=categories)
+        metadata = parquet_file.metadata
+        selected = []
+        first_row = None
+        for index in range(metadata.num_row_groups):
+            rows = metadata.row_group(index).num_rows
+            if position + rows > offset and position < end:
+                selected.append(index)
+                if first_row is None:
+                    first_row = position
+            position += rows
+        if selected:
+            table = parquet_file.read_row_groups(selected, columns=columns)
+            start = max(offset - first_row, 0)
+            tables.append(table.slice(start, end - first_row - start))
+        if position >= end:
+            break
+
+    if not tables:
+        schema = pq.read_schema(part_paths(source.columnar_path)[0])
+        names = columns if columns is not None else schema.names
+        return pd.DataFrame(columns=names)
+    return _to_pandas(pa.concat_tables(tables))
@@ -0,0 +1,74 @@
+"""Content-Encoding negotiation for API responses
+
+Responses of compressible types are sent brotli- or gzip-encoded when the
+client accepts it. The encoded representation gets its own entity tag, the
+plain tag with the coding appended, and tags sent back in If-None-Match or
+If-Match have the suffix removed before the views see them, so validators
+keep working whichever encoding the client received.
+"""
+import gzip
+import re
+
+import brotli
+from flask import g, request
+
+# Server preference when the client accepts several codings equally
+CODINGS = ('br', 'gzip')
+
+ETAG_CODING = re.compile(r'-(?:br|gzip)(?=")')
+
+
+class ResponseCompressor:
+    """Compresses responses according to Accept-Encoding"""
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self._strip_etag_codings)
+        app.after_request(self.compress)
+
+    def _strip_etag_codings(self):
+        for header in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH'):
+            value = request.environ.get(header)
+            if value and ETAG_CODING.search(value):
+                request.environ[header] = ETAG_CODING.sub('', value)
+                g.etag_coding = True
+
+    def encode(self, data, coding):
+        """Data encoded with a content coding"""
+        if coding == 'br':
+            return brotli.compress(data, quality=self.app.config['COMPRESS_BROTLI_QUALITY'])
+        return gzip.compress(data, compresslevel=self.app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+    def _coding(self, response):
+        if response.status_code not in (200, 304) or 'Content-Encoding' in response.headers:
+            return None
+        if response.status_code == 200:
+            if (response.direct_passthrough or response.is_streamed
+                    or response.mimetype not in self.app.config['COMPRESS_MIMETYPES']):
+                return None
+        elif not getattr(g, 'etag_coding', False):
+            # A 304 for a representation that was sent unencoded
+            return None
+        return request.accept_encodings.best_match(CODINGS)
+
+    def compress(self, response):
+        coding = self._coding(response)
+        if coding is None:
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.status_code == 200:
+            data = response.get_data()
+            if len(data) < self.app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(self.encode(data, coding))
+            response.headers['Content-Encoding'] = coding
+
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{coding}', weak)
+        return response
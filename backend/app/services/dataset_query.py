@@ -0,0 +1,208 @@
+"""Filtered, sorted and grouped queries over uploaded datasets
+
+Queries run on the columnar copy through ``pyarrow.dataset``. Only the
+columns a query names are decoded, and filters are pushed down to the
+Parquet reader, so row groups whose statistics rule them out are skipped.
+An unsorted page stops reading once it has its rows, and its total is
+counted from the filter columns alone. Uploads without a columnar copy are
+loaded whole and queried the same way.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from app.services.columnar import has_columnar_copy, load_columns, part_paths
+
+# Rows or groups returned per page at most
+MAX_PAGE_ROWS = 1000
+
+# Column added while sorting to keep rows with equal keys in order
+ROW_POSITION = '__row_position'
+
+OPERATORS = {
+    '==': lambda field, value: field == value,
+    '!=': lambda field, value: field != value,
+    '<': lambda field, value: field < value,
+    '<=': lambda field, value: field <= value,
+    '>': lambda field, value: field > value,
+    '>=': lambda field, value: field >= value,
+    'in': lambda field, values: field.isin(values),
+    'not_in': lambda field, values: ~field.isin(values),
+    'is_null': lambda field, value: field.is_null(),
+    'not_null': lambda field, value: field.is_valid()
+}
+LIST_OPERATORS = ('in', 'not_in')
+NULL_OPERATORS = ('is_null', 'not_null')
+
+# Aggregate functions and the Arrow hash aggregations computing them
+AGGREGATES = {
+    'count': 'count',
+    'count_distinct': 'count_distinct',
+    'sum': 'sum',
+    'mean': 'mean',
+    'min': 'min',
+    'max': 'max',
+    'std': 'stddev'
+}
+
+
+def _dataset(source):
+    """Arrow dataset of a DataUpload-like object"""
+    if has_columnar_copy(source):
+        return ds.dataset(part_paths(source.columnar_path), format='parquet')
+    df = load_columns(source)
+    # Categories are compared as their values, as in the columnar copy
+    df = df.astype({column: object for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+    return ds.dataset(pa.Table.from_pandas(df, preserve_index=False))
+
+
+def _check_columns(columns, available):
+    missing = [column for column in columns if column not in available]
+    if missing:
+        raise ValueError(f"Unknown columns: {', '.join(dict.fromkeys(missing))}")
+
+
+def _literal(value, data_type):
+    """A JSON value as a scalar to compare with a column of ``data_type``"""
+    if pa.types.is_timestamp(data_type):
+        try:
+            return pa.scalar(pd.Timestamp(value), type=data_type)
+        except (ValueError, TypeError, pa.ArrowInvalid):
+            raise ValueError(f'{value!r} is not a date')
+    if pa.types.is_boolean(data_type):
+        fits = isinstance(value, bool)
+    elif pa.types.is_integer(data_type) or pa.types.is_floating(data_type):
+        fits = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        fits = isinstance(value, str)
+    else:
+        fits = True
+    if not fits:
+        raise ValueError(f'{value!r} cannot be compared with a {data_type} column')
+    return pa.scalar(value)
+
+
+def _filter_expression(filters, schema):
+    """Conjunction of the filter predicates, or None without any"""
+    _check_columns([predicate['column'] for predicate in filters], schema.names)
+    expression = None
+    for predicate in filters:
+        op = predicate['op']
+        data_type = schema.field(predicate['column']).type
+        value = predicate.get('value')
+        if op in LIST_OPERATORS:
+            if not isinstance(value, list):
+                raise ValueError(f"{op} takes a list of values")
+            value = pa.array([_literal(item, data_type).as_py() for item in value], type=data_type)
+        elif op not in NULL_OPERATORS:
+            if value is None:
+                raise ValueError(f"{op} takes a value; use is_null to match missing values")
+            value = _literal(value, data_type)
+        condition = OPERATORS[op](ds.field(predicate['column']), value)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _aggregate_name(aggregate):
+    if aggregate.get('name'):
+        return aggregate['name']
+    if aggregate.get('column') is None:
+        return aggregate['function']
+    return f"{aggregate['column']}_{aggregate['function']}"
+
+
+def _aggregate(table, group_by, aggregates):
+    """One row per group of ``group_by`` (one in all without keys) with the aggregates"""
+    aggregations = []
+    outputs = []
+    for aggregate in aggregates:
+        if aggregate.get('column') is None:
+            if aggregate['function'] != 'count':
+                raise ValueError(f"{aggregate['function']} needs a column")
+            aggregations.append(([], 'count_all'))
+            outputs.append('count_all')
+        else:
+            function = AGGREGATES[aggregate['function']]
+            aggregations.append((aggregate['column'], function))
+            outputs.append(f"{aggregate['column']}_{function}")
+    grouped = table.group_by(group_by).aggregate(aggregations)
+    names = list(group_by) + [_aggregate_name(aggregate) for aggregate in aggregates]
+    if len(set(names)) != len(names):
+        raise ValueError('Grouped and aggregated columns need distinct names')
+    return pa.table([grouped[name] for name in list(group_by) + outputs], names=names)
+
+
+def _sorted_page(table, sort, offset, limit):
+    """Rows [offset, offset + limit) of a table in sort order
+
+    Only the first ``offset + limit`` rows are selected and ordered, rather
+    than the whole table. Rows with equal keys keep their order, so pages
+    do not overlap; rows with missing keys come last.
+    """
+    if not sort:
+        return table.slice(offset, limit)
+    _check_columns([key['column'] for key in sort], table.column_names)
+    sort_keys = [(key['column'], 'descending' if key.get('descending') else 'ascending') for key in sort]
+    count = min(offset + limit, table.num_rows)
+    if count == 0:
+        return table.slice(0, 0)
+    # Row positions break ties, which the selection would otherwise resolve arbitrarily
+    positions = pa.array(np.arange(table.num_rows))
+    keyed = table.select(list(dict.fromkeys(key for key, _ in sort_keys))).append_column(ROW_POSITION, positions)
+    selected = pc.select_k_unstable(keyed, k=count, sort_keys=sort_keys + [(ROW_POSITION, 'ascending')])
+    top = keyed.take(selected)
+    if len(selected) < count:
+        # The selection leaves out rows whose first key is null; they sort last
+        top = pa.concat_tables([top, keyed.filter(pc.is_null(keyed[sort_keys[0][0]]))])
+    order = pc.sort_indices(top, sort_keys=sort_keys + [(ROW_POSITION, 'ascending')])
+    return table.take(top[ROW_POSITION].take(order).slice(offset, limit))
+
+
+def _to_frame(table, columns):
+    if columns:
+        _check_columns(columns, table.column_names)
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+def run_query(source, columns=None, filters=(), sort=(), group_by=(), aggregates=(), offset=0,
+              limit=MAX_PAGE_ROWS):
+    """Query a DataUpload-like object's data and return one page of the result
+
+    ``filters`` are ``{column, op, value}`` predicates, all of which must
+    hold; ``sort`` lists ``{column, descending}`` keys. With ``group_by`` or
+    ``aggregates`` the result has one row per group, holding the keys and
+    each ``{column, function, name}`` aggregate, and ``columns`` and
+    ``sort`` refer to those. Returns the page as a DataFrame and the number
+    of rows (or groups) in the whole result. Raises ValueError for unknown
+    columns or values that do not fit their column.
+    """
+    dataset = _dataset(source)
+    schema = dataset.schema
+    expression = _filter_expression(list(filters), schema)
+    columns = list(columns or [])
+    sort = list(sort)
+
+    try:
+        if group_by or aggregates:
+            inputs = list(group_by) + [aggregate['column'] for aggregate in aggregates
+                                       if aggregate.get('column') is not None]
+            _check_columns(inputs, schema.names)
+            table = dataset.to_table(columns=list(dict.fromkeys(inputs)), filter=expression)
+            result = _aggregate(table, list(group_by), aggregates)
+            return _to_frame(_sorted_page(result, sort, offset, limit), columns), result.num_rows
+
+        _check_columns(columns + [key['column'] for key in sort], schema.names)
+        columns = columns or schema.names
+        if not sort:
+            # Only as many rows as the page needs are read
+            page = dataset.head(offset + limit, columns=columns, filter=expression).slice(offset)
+            return _to_frame(page, columns), dataset.count_rows(filter=expression)
+
+        needed = list(dict.fromkeys(columns + [key['column'] for key in sort]))
+        result = dataset.to_table(columns=needed, filter=expression)
+        return _to_frame(_sorted_page(result, sort, offset, limit), columns), result.num_rows
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+        raise ValueError(str(e))
@@ -0,0 +1,79 @@
+"""Downsampling of long series to what a chart of a given pixel width can show
+
+Both methods return indices into the original series, so callers can carry
+other per-point fields (labels, limits, flags) along with the values.
+"""
+import numpy as np
+
+METHODS = ['lttb', 'minmax']
+
+MIN_WIDTH = 10
+MAX_WIDTH = 10_000
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: ``threshold`` points preserving the visual shape"""
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    count = y.size
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    selected = np.empty(threshold, dtype='int64')
+    selected[0], selected[-1] = 0, count - 1
+    every = (count - 2) / (threshold - 2)
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+
+        # Keep the point forming the largest triangle with the previous pick and the next bucket's mean
+        area = np.abs((x[anchor] - average_x) * (y[start:end] - y[anchor])
+                      - (x[anchor] - x[start:end]) * (average_y - y[anchor]))
+        anchor = start + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def minmax(y, buckets):
+    """Minimum and maximum of each of ``buckets`` equal-count buckets, plus both ends"""
+    y = np.asarray(y, dtype='float64')
+    count = y.size
+    if count <= 2 * buckets:
+        return np.arange(count)
+
+    bucket = (np.arange(count) * buckets) // count
+    order = np.lexsort((y, bucket))
+    boundaries = np.flatnonzero(np.diff(bucket)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [count]))
+    return np.unique(np.concatenate((order[starts], order[ends - 1], [0, count - 1])))
+
+
+def downsample(y, width, method='lttb', x=None, keep=None):
+    """Indices of the points to draw for a chart ``width`` pixels wide
+
+    ``keep`` is a boolean mask or index array of points that must survive,
+    such as out-of-control points.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unsupported downsampling method: {method}")
+    width = int(width)
+    if not MIN_WIDTH <= width <= MAX_WIDTH:
+        raise ValueError(f'width must be between {MIN_WIDTH} and {MAX_WIDTH}')
+
+    y = np.asarray(y, dtype='float64')
+    if method == 'lttb':
+        indices = lttb(np.arange(y.size) if x is None else x, y, width)
+    else:
+        indices = minmax(y, width)
+
+    if keep is not None:
+        keep = np.asarray(keep)
+        if keep.dtype == bool:
+            keep = np.flatnonzero(keep)
+        indices = np.union1d(indices, keep.astype('int64'))
+    return indices
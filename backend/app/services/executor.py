@@ -0,0 +1,330 @@
+"""Process pool for CPU-heavy analyses
+
+Statistical work holds the GIL, so running it inside a web worker would
+stall every other request that worker serves. Analyses are instead run in
+child processes, one per job, so they can be bounded, cancelled and timed
+out. A dispatcher thread starts queued jobs as slots free up and writes each
+status transition to the ``Analysis`` row.
+
+Queued and running jobs live in the memory of the API process that accepted
+them and do not survive a restart. While a process holds jobs it touches
+their rows' ``updated_at`` every ``HEARTBEAT_INTERVAL``; a pending or
+running row left untouched for ``ORPHAN_AFTER`` belongs to a process that
+is gone, and is marked failed so it can be run again.
+"""
+import multiprocessing
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# How often the dispatcher checks running jobs for results, crashes and timeouts
+POLL_INTERVAL = 0.2
+
+# How often a process marks its jobs as alive and fails jobs no process holds
+HEARTBEAT_INTERVAL = 30
+
+# Age of the last heartbeat after which a pending or running job is orphaned
+ORPHAN_AFTER = timedelta(seconds=4 * HEARTBEAT_INTERVAL)
+
+ORPHANED_MESSAGE = 'Analysis was interrupted by a server restart; run it again'
+
+# Modules the fork server imports once so each job starts warm
+PRELOAD_MODULES = ['app.services.spc', 'app.services.hypothesis']
+
+
+class TooManyAnalyses(Exception):
+    """Raised when a user already has the maximum number of queued analyses"""
+
+
+def _control_chart(source, configuration):
+    from app.services.spc import run_control_chart
+    results, state = run_control_chart(source, configuration)
+    return {'results': results, 'incremental_state': state}
+
+
+def _hypothesis_tests(source, configuration):
+    from app.services.hypothesis import run_hypothesis_tests
+    return {'results': run_hypothesis_tests(source, configuration)}
+
+
+# Runners return the Analysis fields to store on success
+RUNNERS = {
+    'control_chart': _control_chart,
+    'hypothesis_tests': _hypothesis_tests
+}
+
+
+def source_snapshot(data_upload):
+    """Picklable stand-in for a DataUpload with what the loaders read"""
+    return SimpleNamespace(
+        id=data_upload.id,
+        file_path=data_upload.file_path,
+        file_type=data_upload.file_type,
+        sheet_name=data_upload.sheet_name,
+        columnar_path=data_upload.columnar_path,
+        column_names=data_upload.column_names,
+        column_types=data_upload.column_types
+    )
+
+
+def run_analysis(analysis_type, source, configuration):
+    """Run an analysis in the current process and return ``(status, fields or error)``"""
+    try:
+        return 'completed', RUNNERS[analysis_type](source, configuration)
+    except (ValueError, KeyError) as e:
+        return 'failed', str(e)
+    except Exception as e:
+        return 'failed', f'{type(e).__name__}: {str(e)}'
+
+
+def _child_main(connection, analysis_type, source, configuration):
+    try:
+        connection.send(run_analysis(analysis_type, source, configuration))
+    finally:
+        connection.close()
+
+
+class AnalysisExecutor:
+    """Run ``Analysis`` jobs in a bounded set of child processes
+
+    Settings:
+    - ``ANALYSIS_EXECUTOR``: ``process`` (default) or ``eager`` to run inline
+    - ``ANALYSIS_WORKERS``: processes running at once
+    - ``ANALYSIS_MAX_RUNNING_PER_USER``: one user's jobs running at once
+    - ``ANALYSIS_MAX_QUEUED_PER_USER``: one user's jobs queued or running
+    - ``ANALYSIS_TIMEOUT``: seconds before a running job is killed
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self._pending = deque()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dispatcher = None
+        self._next_heartbeat = 0
+        self._context = None
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, cache=None):
+        self.app = app
+        self.cache = cache
+        self.backend = app.config.get('ANALYSIS_EXECUTOR', 'process')
+        if self.backend not in ('process', 'eager'):
+            raise ValueError(f"Unknown analysis executor: {self.backend}")
+        self.workers = app.config.get('ANALYSIS_WORKERS', 2)
+        self.max_running_per_user = app.config.get('ANALYSIS_MAX_RUNNING_PER_USER', 1)
+        self.max_queued_per_user = app.config.get('ANALYSIS_MAX_QUEUED_PER_USER', 10)
+        self.timeout = app.config.get('ANALYSIS_TIMEOUT', 300)
+        if self.backend == 'process':
+            # Serving processes start the dispatcher with their first request,
+            # so jobs orphaned by a restart are failed without waiting for new ones
+            app.before_request(self._start_dispatcher)
+        app.extensions['analysis_executor'] = self
+
+    def _get_context(self):
+        if self._context is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                self._context = multiprocessing.get_context('forkserver')
+                self._context.set_forkserver_preload(PRELOAD_MODULES)
+            else:
+                self._context = multiprocessing.get_context('spawn')
+        return self._context
+
+    def submit(self, analysis, user_id, source, cache_key=None):
+        """Queue a pending analysis for execution
+
+        With a ``cache_key``, the fields of a successful run are also stored
+        in the result cache under that key.
+        """
+        job = {
+            'analysis_id': analysis.id,
+            'analysis_type': analysis.analysis_type,
+            'user_id': str(user_id),
+            'source': source_snapshot(source),
+            'configuration': analysis.configuration,
+            'cache_key': cache_key
+        }
+
+        if self.backend == 'eager':
+            self._record(job['analysis_id'], 'running')
+            status, outcome = run_analysis(job['analysis_type'], job['source'], job['configuration'])
+            self._finish(job, status, outcome)
+            return
+
+        with self._lock:
+            queued = sum(1 for pending in self._pending if pending['user_id'] == job['user_id'])
+            running = sum(1 for active in self._running.values() if active['user_id'] == job['user_id'])
+            if queued + running >= self.max_queued_per_user:
+                raise TooManyAnalyses(f'At most {self.max_queued_per_user} analyses can be queued at once')
+            self._pending.append(job)
+        self._start_dispatcher()
+        self._wake.set()
+
+    def _start_dispatcher(self):
+        if self._dispatcher is not None and self._dispatcher.is_alive():
+            return
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch, name='dmaic-analysis', daemon=True)
+                self._dispatcher.start()
+
+    def cancel(self, analysis_id):
+        """Drop a queued job or kill a running one; returns whether it was found"""
+        with self._lock:
+            for job in self._pending:
+                if job['analysis_id'] == analysis_id:
+                    self._pending.remove(job)
+                    return True
+            job = self._running.pop(analysis_id, None)
+        if job is None:
+            return False
+        self._stop(job)
+        return True
+
+    def _stop(self, job):
+        job['process'].terminate()
+        job['process'].join(5)
+        job['connection'].close()
+
+    def _start_ready_jobs(self):
+        """Start queued jobs while there are free slots, honouring per-user limits"""
+        started, broken = [], []
+        with self._lock:
+            for job in list(self._pending):
+                if len(self._running) >= self.workers:
+                    break
+                running = sum(1 for active in self._running.values() if active['user_id'] == job['user_id'])
+                if running >= self.max_running_per_user:
+                    continue
+
+                self._pending.remove(job)
+                try:
+                    receiver, sender = self._get_context().Pipe(duplex=False)
+                    process = self._get_context().Process(
+                        target=_child_main,
+                        args=(sender, job['analysis_type'], job['source'], job['configuration']),
+                        daemon=True
+                    )
+                    process.start()
+                    sender.close()
+                except Exception as e:
+                    broken.append((job, f'Could not start analysis process: {str(e)}'))
+                    continue
+
+                job.update(process=process, connection=receiver, deadline=time.monotonic() + self.timeout)
+                self._running[job['analysis_id']] = job
+                started.append(job['analysis_id'])
+
+        for analysis_id in started:
+            self._record(analysis_id, 'running')
+        for job, error_message in broken:
+            self._finish(job, 'failed', error_message)
+
+    def _collect_finished_jobs(self):
+        """Record results, crashes and timeouts of running jobs"""
+        with self._lock:
+            running = list(self._running.values())
+
+        for job in running:
+            outcome = None
+            try:
+                if job['connection'].poll():
+                    outcome = job['connection'].recv()
+                    job['process'].join()
+                elif time.monotonic() > job['deadline']:
+                    self._stop(job)
+                    outcome = ('failed', f'Analysis timed out after {self.timeout} seconds')
+            except EOFError:
+                # The child exited without sending a result
+                job['process'].join()
+                outcome = ('failed', f"Analysis process exited unexpectedly (code {job['process'].exitcode})")
+            except OSError:
+                # The connection was closed by a concurrent cancel
+                continue
+            if outcome is None:
+                continue
+
+            with self._lock:
+                if self._running.pop(job['analysis_id'], None) is None:
+                    continue
+            job['connection'].close()
+            self._finish(job, *outcome)
+
+    def _heartbeat(self):
+        """Touch the rows of this process's jobs and fail those no process holds"""
+        from app import db
+        from app.models import Analysis
+
+        with self._lock:
+            held = [job['analysis_id'] for job in self._pending] + list(self._running)
+        now = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                active = Analysis.query.filter(Analysis.status.in_(('pending', 'running')))
+                if held:
+                    active.filter(Analysis.id.in_(held)).update(
+                        {Analysis.updated_at: now}, synchronize_session=False)
+                orphaned = active.filter(Analysis.updated_at < now - ORPHAN_AFTER).update(
+                    {Analysis.status: 'failed', Analysis.error_message: ORPHANED_MESSAGE, Analysis.updated_at: now},
+                    synchronize_session=False)
+                db.session.commit()
+                if orphaned:
+                    self.app.logger.warning('Marked %s orphaned analyses as failed', orphaned)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Could not check for orphaned analyses')
+            finally:
+                db.session.remove()
+
+    def _dispatch(self):
+        while True:
+            self._wake.clear()
+            try:
+                self._start_ready_jobs()
+                self._collect_finished_jobs()
+            except Exception:
+                self.app.logger.exception('Analysis dispatcher error')
+            if time.monotonic() >= self._next_heartbeat:
+                self._heartbeat()
+                self._next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL
+            with self._lock:
+                idle = not self._pending and not self._running
+            self._wake.wait(HEARTBEAT_INTERVAL if idle else POLL_INTERVAL)
+
+    def _finish(self, job, status, outcome):
+        if status == 'completed':
+            self._record(job['analysis_id'], status, fields=outcome)
+            if job.get('cache_key') and self.cache is not None:
+                try:
+                    self.cache.set(job['cache_key'], outcome)
+                except Exception:
+                    self.app.logger.exception('Could not cache result of analysis %s', job['analysis_id'])
+        else:
+            self._record(job['analysis_id'], status, error_message=outcome)
+
+    def _record(self, analysis_id, status, fields=None, error_message=None):
+        """Write a status transition unless the analysis was cancelled or deleted meanwhile"""
+        from app import db
+        from app.models import Analysis
+
+        with self.app.app_context():
+            try:
+                analysis = Analysis.query.get(analysis_id)
+                if analysis is None or analysis.status in ('cancelled', 'completed', 'failed'):
+                    return
+                for key, value in (fields or {}).items():
+                    setattr(analysis, key, value)
+                analysis.status = status
+                analysis.error_message = error_message
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Could not record status of analysis %s', analysis_id)
+            finally:
+                db.session.remove()
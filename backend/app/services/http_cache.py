@@ -0,0 +1,70 @@
+"""HTTP validators (ETag, Last-Modified) and Cache-Control for API responses
+
+Every successful GET carries a validator, so clients revalidate a copy they
+hold instead of downloading it again. Routes that can name the version of
+what they serve cheaply (a project's version, an upload's content hash, a
+row's updated_at) check it before doing any work; other JSON responses get
+an ETag hashed from their body. Responses are private to the signed-in user.
+"""
+from datetime import datetime
+
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+
+
+def version_tag(*parts):
+    """Entity tag from identifying parts, such as a kind, an id and an updated_at"""
+    return '-'.join(part.strftime('%Y%m%d%H%M%S%f') if isinstance(part, datetime) else str(part)
+                    for part in parts)
+
+
+def with_validators(response, etag, last_modified=None):
+    """Set ETag and, when known, Last-Modified on a response"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """A 304 response if the client's copy is current (If-None-Match / If-Modified-Since), else None"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return with_validators(current_app.response_class(status=304), etag, last_modified)
+
+
+def versioned(response, version):
+    """Let clients keep a response for good when its URL names the content version it serves
+
+    Content addressed by ``?v=<version>`` never changes, so no revalidation is
+    needed; without a matching ``v`` the blueprint's policy applies.
+    """
+    if version and request.args.get('v') == version:
+        response.headers['Cache-Control'] = f"private, max-age={current_app.config['IMMUTABLE_MAX_AGE']}, immutable"
+    return response
+
+
+def register_cache_policies(app):
+    """Apply each blueprint's Cache-Control to its responses, adding body ETags to JSON GETs"""
+
+    @app.after_request
+    def apply_cache_policy(response):
+        policy = app.config['CACHE_CONTROL'].get(request.blueprint)
+        if policy is None:
+            return response
+        if request.method not in ('GET', 'HEAD') or response.status_code >= 400:
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        if (response.status_code == 200 and 'no-store' not in policy and 'ETag' not in response.headers
+                and not response.direct_passthrough and not response.is_streamed):
+            response.add_etag()
+            response = response.make_conditional(request)
+
+        # Explicit lifetimes (versioned content) stand; send_file's default no-cache is replaced
+        if not response.cache_control.max_age:
+            response.headers['Cache-Control'] = policy
+        response.vary.add('Authorization')
+        return response
@@ -0,0 +1,339 @@
+"""Batched hypothesis tests over one dataset load
+
+All tests of a batch share a single read of the needed columns. Each factor
+is encoded once, per-level moments of every numeric response are computed in
+one grouped pass per factor, and the test statistics and p-values are then
+evaluated as arrays rather than test by test.
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+from statsmodels.stats.multitest import multipletests
+
+from app.services.columnar import load_columns
+
+TESTS = ['auto', 't_test', 'anova', 'chi_square']
+
+# Bump when results change for the same input, so cached results are not reused
+ENGINE_VERSION = '1'
+
+# Names accepted for multiple-comparison correction, mapped to statsmodels methods
+CORRECTIONS = {'holm': 'holm', 'bonferroni': 'bonferroni', 'fdr_bh': 'fdr_bh', 'none': None}
+
+MAX_TESTS = 1000
+
+# Factors with more levels than this are almost always identifiers, not factors
+MAX_LEVELS = 100
+
+# Chi-square approximations are doubtful when expected cell counts fall below this
+MIN_EXPECTED = 5
+
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def expand_tests(configuration):
+    """List the individual tests of a batch
+
+    Explicit ``tests`` come first, followed by every ``factors`` x
+    ``responses`` pair run with the batch-wide ``test``.
+    """
+    specs = [dict(spec) for spec in configuration.get('tests') or []]
+    default_test = configuration.get('test') or 'auto'
+    for factor in configuration.get('factors') or []:
+        for response in configuration.get('responses') or []:
+            if factor != response:
+                specs.append({'test': default_test, 'factor': factor, 'response': response})
+
+    for spec in specs:
+        spec.setdefault('test', 'auto')
+        if spec['test'] not in TESTS:
+            raise ValueError(f"Unsupported test: {spec['test']}")
+    if not specs:
+        raise ValueError('No tests requested')
+    if len(specs) > MAX_TESTS:
+        raise ValueError(f'At most {MAX_TESTS} tests can be run in one batch')
+    return specs
+
+
+def required_columns(configuration):
+    """Dataset columns a batch of tests reads"""
+    columns = []
+    for spec in expand_tests(configuration):
+        for column in (spec['factor'], spec['response']):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+class GroupedStatistics:
+    """Per-factor level codes and per-level moments, computed once and shared"""
+
+    def __init__(self, df):
+        self.df = df
+        self._codes = {}
+        self._moments = {}
+
+    def codes(self, factor):
+        """Integer level codes of a factor (-1 for missing) and the level labels"""
+        if factor not in self._codes:
+            codes, levels = pd.factorize(self.df[factor], sort=True)
+            self._codes[factor] = (codes, [str(level) for level in levels])
+        return self._codes[factor]
+
+    def prepare(self, factor, responses):
+        """Compute count, mean and variance per level for many responses in one pass"""
+        pending = [response for response in responses if (factor, response) not in self._moments]
+        if not pending:
+            return
+        codes, levels = self.codes(factor)
+        present = codes >= 0
+        frame = self.df.loc[present, pending].apply(pd.to_numeric, errors='coerce')
+        grouped = frame.groupby(codes[present]).agg(['count', 'mean', 'var'])
+        grouped = grouped.reindex(range(len(levels)))
+        for response in pending:
+            self._moments[(factor, response)] = (
+                grouped[(response, 'count')].fillna(0).to_numpy(dtype='float64'),
+                grouped[(response, 'mean')].to_numpy(dtype='float64'),
+                grouped[(response, 'var')].to_numpy(dtype='float64')
+            )
+
+    def moments(self, factor, response):
+        self.prepare(factor, [response])
+        return self._moments[(factor, response)]
+
+    def contingency(self, factor, response):
+        """Cross-tabulated counts of two categorical columns, empty rows and columns dropped"""
+        row_codes, row_levels = self.codes(factor)
+        column_codes, column_levels = self.codes(response)
+        present = (row_codes >= 0) & (column_codes >= 0)
+        flat = row_codes[present] * len(column_levels) + column_codes[present]
+        table = np.bincount(flat, minlength=len(row_levels) * len(column_levels))
+        table = table.reshape(len(row_levels), len(column_levels)).astype('float64')
+        rows = table.sum(axis=1) > 0
+        columns = table.sum(axis=0) > 0
+        return (table[rows][:, columns],
+                [level for level, keep in zip(row_levels, rows) if keep],
+                [level for level, keep in zip(column_levels, columns) if keep])
+
+
+def _resolve_test(spec, df):
+    if spec['test'] != 'auto':
+        return spec['test']
+    if not _is_numeric(df[spec['response']]):
+        return 'chi_square'
+    return 't_test' if df[spec['factor']].nunique() == 2 else 'anova'
+
+
+def _group_summary(levels, counts, means, variances):
+    return [
+        {'level': level, 'n': int(n), 'mean': float(mean), 'std': float(np.sqrt(variance))}
+        for level, n, mean, variance in zip(levels, counts, means, variances)
+        if n > 0
+    ]
+
+
+def _welch(entries, grouped):
+    """Welch two-sample t-tests for all entries at once"""
+    n1, m1, v1, n2, m2, v2 = (np.empty(len(entries)) for _ in range(6))
+    for position, entry in enumerate(entries):
+        spec = entry['spec']
+        counts, means, variances = grouped.moments(spec['factor'], spec['response'])
+        first, second = entry['levels']
+        n1[position], m1[position], v1[position] = counts[first], means[first], variances[first]
+        n2[position], m2[position], v2[position] = counts[second], means[second], variances[second]
+
+    a, b = v1 / n1, v2 / n2
+    statistic = (m1 - m2) / np.sqrt(a + b)
+    df = (a + b) ** 2 / (a ** 2 / (n1 - 1) + b ** 2 / (n2 - 1))
+    p_values = 2 * stats.t.sf(np.abs(statistic), df)
+    pooled = np.sqrt(((n1 - 1) * v1 + (n2 - 1) * v2) / (n1 + n2 - 2))
+    cohens_d = (m1 - m2) / pooled
+
+    for position, entry in enumerate(entries):
+        entry['result'].update({
+            'statistic': float(statistic[position]),
+            'df': float(df[position]),
+            'p_value': float(p_values[position]),
+            'effect_size': {'name': 'cohens_d', 'value': float(cohens_d[position])}
+        })
+
+
+def _anova(entries, grouped):
+    """One-way ANOVA F-tests from per-level moments"""
+    statistic, df_between, df_within, eta_squared = (np.empty(len(entries)) for _ in range(4))
+    for position, entry in enumerate(entries):
+        spec = entry['spec']
+        counts, means, variances = grouped.moments(spec['factor'], spec['response'])
+        used = entry['levels']
+        n, mean, variance = counts[used], means[used], variances[used]
+        grand_mean = (n * mean).sum() / n.sum()
+        between = (n * (mean - grand_mean) ** 2).sum()
+        within = ((n - 1) * np.nan_to_num(variance)).sum()
+        df_between[position] = len(used) - 1
+        df_within[position] = n.sum() - len(used)
+        statistic[position] = (between / df_between[position]) / (within / df_within[position])
+        eta_squared[position] = between / (between + within)
+
+    p_values = stats.f.sf(statistic, df_between, df_within)
+    for position, entry in enumerate(entries):
+        entry['result'].update({
+            'statistic': float(statistic[position]),
+            'df': [float(df_between[position]), float(df_within[position])],
+            'p_value': float(p_values[position]),
+            'effect_size': {'name': 'eta_squared', 'value': float(eta_squared[position])}
+        })
+
+
+def _chi_square(entries, grouped):
+    """Pearson chi-square tests of independence"""
+    statistic, dof, cramers_v = (np.empty(len(entries)) for _ in range(3))
+    for position, entry in enumerate(entries):
+        table = entry['table']
+        total = table.sum()
+        expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / total
+        statistic[position] = ((table - expected) ** 2 / expected).sum()
+        dof[position] = (table.shape[0] - 1) * (table.shape[1] - 1)
+        cramers_v[position] = np.sqrt(statistic[position] / (total * (min(table.shape) - 1)))
+        if (expected < MIN_EXPECTED).any():
+            entry['result']['warning'] = f'Some expected counts are below {MIN_EXPECTED}'
+
+    p_values = stats.chi2.sf(statistic, dof)
+    for position, entry in enumerate(entries):
+        entry['result'].update({
+            'statistic': float(statistic[position]),
+            'df': float(dof[position]),
+            'p_value': float(p_values[position]),
+            'effect_size': {'name': 'cramers_v', 'value': float(cramers_v[position])}
+        })
+
+
+def _prepare_entry(spec, df, grouped):
+    """Validate one test and gather what its statistic needs"""
+    factor, response = spec['factor'], spec['response']
+    for column in (factor, response):
+        if column not in df.columns:
+            raise ValueError(f'Unknown column: {column}')
+
+    test = _resolve_test(spec, df)
+    result = {'test': test, 'factor': factor, 'response': response}
+    entry = {'spec': spec, 'test': test, 'result': result}
+
+    _, levels = grouped.codes(factor)
+    if len(levels) > MAX_LEVELS:
+        raise ValueError(f'{factor} has more than {MAX_LEVELS} levels')
+
+    if test == 'chi_square':
+        table, row_levels, column_levels = grouped.contingency(factor, response)
+        if len(column_levels) > MAX_LEVELS:
+            raise ValueError(f'{response} has more than {MAX_LEVELS} levels')
+        if min(table.shape) < 2:
+            raise ValueError('Chi-square needs at least two levels in each column')
+        entry['table'] = table
+        result['rows'] = row_levels
+        result['columns'] = column_levels
+        result['observed'] = table.astype('int64').tolist()
+        return entry
+
+    if not _is_numeric(df[response]):
+        raise ValueError(f'{response} is not numeric')
+    counts, means, variances = grouped.moments(factor, response)
+
+    if test == 't_test':
+        if spec.get('groups'):
+            wanted = [str(level) for level in spec['groups']]
+            unknown = [level for level in wanted if level not in levels]
+            if len(wanted) != 2 or unknown:
+                raise ValueError('groups must name two levels of the factor')
+            used = [levels.index(level) for level in wanted]
+        else:
+            used = [index for index in range(len(levels)) if counts[index] > 0]
+            if len(used) != 2:
+                raise ValueError(f'{factor} has {len(used)} levels; name two with groups or use anova')
+    else:
+        used = [index for index in range(len(levels)) if counts[index] > 0]
+        if len(used) < 2:
+            raise ValueError(f'{factor} needs at least two levels with data')
+
+    if (counts[used] < 2).any():
+        raise ValueError('Each group needs at least two observations')
+    if test == 'anova' and counts[used].sum() <= len(used):
+        raise ValueError('Not enough observations for ANOVA')
+
+    entry['levels'] = used
+    result['groups'] = _group_summary([levels[index] for index in used], counts[used],
+                                      means[used], variances[used])
+    return entry
+
+
+def hypothesis_tests(df, configuration):
+    """Run a batch of tests on a DataFrame and correct for multiple comparisons"""
+    specs = expand_tests(configuration)
+    alpha = float(configuration.get('alpha') or 0.05)
+    correction = configuration.get('correction') or 'holm'
+    if correction not in CORRECTIONS:
+        raise ValueError(f'Unsupported correction: {correction}')
+
+    grouped = GroupedStatistics(df)
+
+    # Batch the numeric moments of each factor into a single grouped pass
+    numeric_pairs = {}
+    for spec in specs:
+        if spec['factor'] in df.columns and spec['response'] in df.columns \
+                and _is_numeric(df[spec['response']]):
+            numeric_pairs.setdefault(spec['factor'], []).append(spec['response'])
+    for factor, responses in numeric_pairs.items():
+        if df[factor].nunique() <= MAX_LEVELS:
+            grouped.prepare(factor, list(dict.fromkeys(responses)))
+
+    entries, results = [], []
+    for spec in specs:
+        try:
+            entry = _prepare_entry(spec, df, grouped)
+        except ValueError as e:
+            results.append({'test': spec['test'], 'factor': spec['factor'],
+                            'response': spec['response'], 'error': str(e)})
+            continue
+        entries.append(entry)
+        results.append(entry['result'])
+
+    runners = {'t_test': _welch, 'anova': _anova, 'chi_square': _chi_square}
+    for test, runner in runners.items():
+        batch = [entry for entry in entries if entry['test'] == test]
+        if batch:
+            runner(batch, grouped)
+
+    # Tests with degenerate data (e.g. zero variance) report NaN and are not corrected
+    valid = [entry['result'] for entry in entries if np.isfinite(entry['result']['p_value'])]
+    for entry in entries:
+        if not np.isfinite(entry['result']['p_value']):
+            entry['result']['error'] = 'Test statistic is undefined for this data'
+            for key in ('statistic', 'p_value'):
+                entry['result'][key] = None
+
+    if valid:
+        p_values = np.array([result['p_value'] for result in valid])
+        method = CORRECTIONS[correction]
+        if method:
+            rejected, adjusted, _, _ = multipletests(p_values, alpha=alpha, method=method)
+        else:
+            rejected, adjusted = p_values < alpha, p_values
+        for result, reject, p_adjusted in zip(valid, rejected, adjusted):
+            result['p_adjusted'] = float(p_adjusted)
+            result['significant'] = bool(reject)
+
+    return {
+        'alpha': alpha,
+        'correction': correction,
+        'tests_run': len(valid),
+        'tests_failed': len(results) - len(valid),
+        'significant': sum(1 for result in valid if result['significant']),
+        'tests': results
+    }
+
+
+def run_hypothesis_tests(source, configuration):
+    """Load the needed columns of a DataUpload-like object once and run the batch"""
+    df = load_columns(source, required_columns(configuration))
+    return hypothesis_tests(df, configuration)
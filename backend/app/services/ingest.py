@@ -0,0 +1,527 @@
+"""Background ingestion of uploaded datasets and appends to them"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow as pa
+from flask import current_app
+from app import db, jobs
+from app.models import DataUpload, Analysis, Project
+from app.services.column_types import apply_column_types
+from app.services.columnar import (
+    ColumnarWriter, append_columnar_part, columnar_path_for, has_columnar_copy, iter_columnar_chunks,
+    rebuild_text_columns, remove_columnar_copy, schema_to_json
+)
+from app.services.profiler import DatasetProfiler, profile_dataset
+from app.services.readers import chain_sha256, file_sha256, iter_chunks, sheet_names
+from app.services.row_index import RowIndexBuilder, row_index_path_for
+from app.services.spc import required_columns, run_control_chart, update_control_chart
+
+# Only write progress to the database when it has moved at least this much
+PROGRESS_STEP = 0.05
+
+# What profiling records on an upload
+PROFILE_FIELDS = ('columnar_path', 'columnar_schema', 'row_index_path', 'row_count', 'column_count',
+                  'column_names', 'column_types', 'data_summary')
+
+# What uploads with the same contents share: the stored file, its copies and its profile
+SHARED_FIELDS = ('filename', 'file_path', 'file_size') + PROFILE_FIELDS
+
+# Also used from sheet worker processes, which have no app context
+logger = logging.getLogger(__name__)
+
+
+def _process(data_upload, progress=None, stream=None):
+    """Profile an upload and build its columnar copy and row index in one read
+
+    The saved file is read, or ``stream`` while the file is being received.
+    Results are recorded on the upload. Returns the SHA-256 of the bytes
+    read for CSV files (None for others). On failure the partial copies are
+    removed and the error is raised.
+    """
+    # Build the columnar copy from the same chunks the profiler reads
+    columnar_path = columnar_path_for(data_upload.file_path, data_upload.sheet_index)
+    remove_columnar_copy(columnar_path)
+    writer = ColumnarWriter(columnar_path)
+    first_types = {}
+
+    def write_chunk(chunk):
+        nonlocal writer
+        if writer is None:
+            return
+        if not first_types:
+            first_types.update((str(column), dtype) for column, dtype in chunk.dtypes.items())
+        try:
+            writer.write(chunk)
+        except Exception:
+            # The copy is only an accelerator; reads fall back to the original file
+            logger.exception('Columnar copy of upload %s failed', data_upload.id)
+            writer.close()
+            writer = None
+            remove_columnar_copy(columnar_path)
+
+    # CSV uploads also get a row index, fed from the same reads
+    index_builder = None
+    if data_upload.file_type == 'csv':
+        index_builder = RowIndexBuilder(row_index_path_for(data_upload.file_path))
+
+    # CSV bytes pass through here anyway, so hash them on the way; other files are hashed separately
+    digest = hashlib.sha256()
+
+    def read_bytes(data):
+        digest.update(data)
+        if index_builder is not None:
+            index_builder.feed(data)
+
+    try:
+        result = profile_dataset(
+            data_upload.file_path,
+            data_upload.file_type,
+            progress=progress,
+            on_chunk=write_chunk,
+            on_bytes=read_bytes if data_upload.file_type == 'csv' else None,
+            stream=stream,
+            sheet=data_upload.sheet_name
+        )
+    except Exception:
+        if writer is not None:
+            writer.close()
+        remove_columnar_copy(columnar_path)
+        if index_builder is not None:
+            index_builder.abort()
+        raise
+
+    if writer is not None:
+        writer.close()
+        schema = writer.schema
+        # Columns that became text after rows of another type were written are
+        # rebuilt from the file, so every row keeps its original spelling
+        widened = [column for column, dtype in result['column_types'].items()
+                   if dtype == 'object' and first_types.get(column) != object]
+        if schema is not None and widened:
+            try:
+                schema = rebuild_text_columns(writer.path, iter_chunks(
+                    data_upload.file_path, data_upload.file_type, usecols=widened, dtype=object,
+                    sheet=data_upload.sheet_name))
+            except Exception:
+                logger.exception('Columnar copy of upload %s failed', data_upload.id)
+                schema = None
+        if schema is not None:
+            data_upload.columnar_path = columnar_path
+            data_upload.columnar_schema = schema_to_json(schema)
+        else:
+            remove_columnar_copy(columnar_path)
+
+    if index_builder is not None:
+        if index_builder.finish() == result['row_count']:
+            data_upload.row_index_path = index_builder.index_path
+        else:
+            # Row boundaries disagree with the parser (unusual quoting); page without it
+            index_builder.abort()
+
+    data_upload.row_count = result['row_count']
+    data_upload.column_count = result['column_count']
+    data_upload.column_names = result['column_names']
+    data_upload.column_types = result['column_types']
+    data_upload.data_summary = result['summary']
+    return digest.hexdigest() if data_upload.file_type == 'csv' else None
+
+
+@jobs.task('ingest_upload', model=DataUpload)
+def ingest_upload(upload_id):
+    """Profile a saved upload and record the results on its DataUpload row"""
+    data_upload = DataUpload.query.get(upload_id)
+    if data_upload is None:
+        # Deleted before the job started
+        return
+
+    data_upload.status = 'running'
+    data_upload.progress = 0.0
+    data_upload.error_message = None
+    db.session.commit()
+
+    def report_progress(fraction):
+        if fraction - data_upload.progress >= PROGRESS_STEP:
+            data_upload.progress = fraction
+            db.session.commit()
+
+    try:
+        names = sheet_names(data_upload.file_path, data_upload.file_type)
+        if len(names) > 1:
+            # Workbooks are hashed first so one already stored is not parsed again
+            data_upload.content_hash = data_upload.content_hash or file_sha256(data_upload.file_path)
+            if not _share_duplicate(data_upload):
+                _process_sheets(data_upload, names, progress=report_progress)
+        else:
+            content_hash = _process(data_upload, progress=report_progress)
+            # Streamed uploads were hashed as they were received
+            data_upload.content_hash = content_hash or data_upload.content_hash or file_sha256(data_upload.file_path)
+            # Uploads assembled from chunks are first hashed here; store identical contents once
+            _share_duplicate(data_upload)
+    except Exception as e:
+        db.session.rollback()
+        data_upload.mark_failed(f'Dataset analysis failed: {str(e)}')
+        db.session.commit()
+        return
+
+    data_upload.status = 'completed'
+    data_upload.progress = 1.0
+    db.session.commit()
+
+
+def _share_duplicate(data_upload):
+    """Share the stored data of an earlier upload with the same contents; True if there was one"""
+    duplicate = find_duplicate(data_upload, data_upload.project.user_id)
+    if duplicate is None:
+        return False
+    remove_stored_files(data_upload)
+    share_stored_data(data_upload, duplicate)
+    return True
+
+
+def sheet_sha256(workbook_hash, sheet_name):
+    """Content hash of one worksheet, derived from its workbook's"""
+    return chain_sha256(workbook_hash, hashlib.sha256(sheet_name.encode('utf-8')).hexdigest())
+
+
+def _profile_sheet(snapshot):
+    """Profile one worksheet, in a worker process; returns the fields to record on its upload"""
+    _process(snapshot)
+    return {field: getattr(snapshot, field, None) for field in PROFILE_FIELDS}
+
+
+def _sheet_results(snapshots, workers):
+    """Yield ``(position, fields or the exception raised)`` for each sheet as it finishes"""
+    if workers <= 1:
+        for position, snapshot in enumerate(snapshots):
+            try:
+                yield position, _profile_sheet(snapshot)
+            except Exception as e:
+                yield position, e
+        return
+
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as pool:
+        futures = {pool.submit(_profile_sheet, snapshot): position for position, snapshot in enumerate(snapshots)}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], error if error is not None else future.result()
+
+
+def _process_sheets(data_upload, names, progress=None):
+    """Profile every worksheet of a workbook as an upload of its own, several at a time
+
+    Each sheet gets a DataUpload under the workbook's, with its own columnar
+    copy and profile, recorded as soon as the sheet is done. A sheet that
+    cannot be read fails alone. The workbook's upload takes the profile of
+    its first readable sheet, so it reads like a single-sheet upload.
+    """
+    # A job run again starts the sheets afresh; their copies are rewritten in place
+    for sheet in data_upload.sheets:
+        db.session.delete(sheet)
+    sheets = [
+        DataUpload(
+            project_id=data_upload.project_id,
+            parent=data_upload,
+            sheet_name=name,
+            sheet_index=index,
+            filename=data_upload.filename,
+            original_filename=data_upload.original_filename,
+            file_path=data_upload.file_path,
+            file_size=data_upload.file_size,
+            file_type=data_upload.file_type,
+            content_hash=sheet_sha256(data_upload.content_hash, name),
+            upload_stage=data_upload.upload_stage,
+            description=data_upload.description,
+            status='running',
+            progress=0.0
+        )
+        for index, name in enumerate(names)
+    ]
+    data_upload.sheet_names = names
+    db.session.add_all(sheets)
+    db.session.commit()
+
+    snapshots = [
+        SimpleNamespace(id=sheet.id, file_path=sheet.file_path, file_type=sheet.file_type,
+                        sheet_name=sheet.sheet_name, sheet_index=sheet.sheet_index)
+        for sheet in sheets
+    ]
+    workers = min(current_app.config['EXCEL_SHEET_WORKERS'], len(sheets))
+    for done, (position, result) in enumerate(_sheet_results(snapshots, workers), start=1):
+        sheet = sheets[position]
+        if isinstance(result, Exception):
+            sheet.status = 'failed'
+            sheet.error_message = f'Dataset analysis failed: {str(result)}'
+        else:
+            for field, value in result.items():
+                setattr(sheet, field, value)
+            sheet.status = 'completed'
+            sheet.progress = 1.0
+        db.session.commit()
+        if progress:
+            progress(done / len(sheets))
+
+    profiled = [sheet for sheet in sheets if sheet.status == 'completed']
+    if not profiled:
+        raise ValueError(f'No sheet could be read ({sheets[0].error_message})')
+    for field in PROFILE_FIELDS:
+        setattr(data_upload, field, getattr(profiled[0], field))
+
+
+def ingest_stream(data_upload, receiver):
+    """Profile a CSV upload from the request body as it is received
+
+    ``receiver`` is an UploadReceiver positioned at the start of the file;
+    the file is saved and hashed by the receiver as the parser reads it.
+    Raises ValueError if the data cannot be parsed.
+    """
+    try:
+        _process(data_upload, stream=receiver)
+    except (ValueError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise ValueError(f'Dataset analysis failed: {str(e)}')
+    data_upload.status = 'completed'
+    data_upload.progress = 1.0
+
+
+def find_duplicate(data_upload, user_id):
+    """A completed upload of the same user with the same contents, whose stored files can be shared"""
+    return DataUpload.query.join(Project).filter(
+        Project.user_id == user_id,
+        DataUpload.content_hash == data_upload.content_hash,
+        DataUpload.file_type == data_upload.file_type,
+        DataUpload.status == 'completed',
+        DataUpload.parent_id.is_(None),
+        DataUpload.id != data_upload.id
+    ).order_by(DataUpload.id).first()
+
+
+def share_stored_data(data_upload, original):
+    """Point an upload at another upload's stored file, copies and profile instead of its own
+
+    The sheets of a workbook are shared along with it.
+    """
+    for field in SHARED_FIELDS:
+        setattr(data_upload, field, getattr(original, field))
+    if original.sheet_names:
+        data_upload.sheet_names = original.sheet_names
+    for sheet in original.sheets.filter_by(status='completed'):
+        copy = DataUpload(
+            project_id=data_upload.project_id,
+            parent=data_upload,
+            sheet_name=sheet.sheet_name,
+            sheet_index=sheet.sheet_index,
+            original_filename=data_upload.original_filename,
+            file_type=sheet.file_type,
+            content_hash=sheet.content_hash,
+            upload_stage=data_upload.upload_stage,
+            description=data_upload.description,
+            status='completed',
+            progress=1.0
+        )
+        for field in SHARED_FIELDS:
+            setattr(copy, field, getattr(sheet, field))
+        db.session.add(copy)
+    data_upload.status = 'completed'
+    data_upload.progress = 1.0
+
+
+def file_references(file_path, exclude_ids=()):
+    """Number of uploads stored in a file"""
+    query = DataUpload.query.filter(DataUpload.file_path == file_path)
+    exclude_ids = [upload_id for upload_id in exclude_ids if upload_id is not None]
+    if exclude_ids:
+        query = query.filter(DataUpload.id.notin_(exclude_ids))
+    return query.count()
+
+
+def remove_stored_files(data_upload):
+    """Delete the files and copies of an upload and its sheets, unless other uploads share them"""
+    uploads = [data_upload]
+    if data_upload.id is not None:
+        uploads += data_upload.sheets.all()
+    upload_ids = [upload.id for upload in uploads]
+    for file_path in {upload.file_path for upload in uploads}:
+        if file_references(file_path, exclude_ids=upload_ids):
+            continue
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        for upload in uploads:
+            if upload.file_path != file_path:
+                continue
+            remove_columnar_copy(upload.columnar_path)
+            if upload.row_index_path and os.path.exists(upload.row_index_path):
+                os.remove(upload.row_index_path)
+
+
+def _own_stored_files(data_upload):
+    """Give an upload private copies of files it shares, before they are changed; True if copied"""
+    if not file_references(data_upload.file_path, exclude_ids=[data_upload.id]):
+        return False
+    extension = os.path.splitext(data_upload.file_path)[1]
+    filename = f'{uuid.uuid4()}{extension}'
+    file_path = os.path.join(os.path.dirname(data_upload.file_path), filename)
+    shutil.copyfile(data_upload.file_path, file_path)
+    if data_upload.row_index_path and os.path.exists(data_upload.row_index_path):
+        data_upload.row_index_path = shutil.copyfile(data_upload.row_index_path, row_index_path_for(file_path))
+    if has_columnar_copy(data_upload):
+        data_upload.columnar_path = shutil.copytree(data_upload.columnar_path, columnar_path_for(file_path))
+    data_upload.filename = filename
+    data_upload.file_path = file_path
+    return True
+
+
+def _incoming_rows(data_upload, file_path, file_type):
+    """Read appended rows and line their columns up with the dataset's"""
+    chunks = list(iter_chunks(file_path, file_type))
+    incoming = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    columns = [str(column) for column in incoming.columns]
+    expected = data_upload.column_names or []
+    if sorted(columns) != sorted(expected):
+        missing = [column for column in expected if column not in columns]
+        extra = [column for column in columns if column not in expected]
+        raise ValueError(f"Appended columns do not match the dataset "
+                         f"(missing: {missing or 'none'}, unexpected: {extra or 'none'})")
+    incoming.columns = columns
+    return incoming[expected]
+
+
+def _append_csv(data_upload, incoming):
+    """Append rows to the original CSV and extend its row index in place"""
+    with open(data_upload.file_path, 'rb') as handle:
+        handle.seek(0, os.SEEK_END)
+        needs_newline = False
+        if handle.tell():
+            handle.seek(-1, os.SEEK_END)
+            needs_newline = handle.read(1) != b'\n'
+
+    payload = incoming.to_csv(header=False, index=False).encode('utf-8')
+    if needs_newline:
+        payload = b'\n' + payload
+
+    builder = None
+    if data_upload.row_index_path and os.path.exists(data_upload.row_index_path):
+        builder = RowIndexBuilder.resume(data_upload.row_index_path)
+    with open(data_upload.file_path, 'ab') as handle:
+        handle.write(payload)
+    if builder is not None:
+        builder.feed(payload)
+        if builder.finish() != data_upload.row_count + len(incoming):
+            builder.abort()
+            data_upload.row_index_path = None
+
+
+def _append_columnar(data_upload, incoming):
+    """Add appended rows to the columnar copy as a new part"""
+    if not has_columnar_copy(data_upload):
+        return
+    try:
+        append_columnar_part(data_upload.columnar_path, incoming)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        if data_upload.file_type != 'csv':
+            raise ValueError('Appended rows do not match the column types of the dataset')
+        # The CSV still holds every row; reads fall back to it
+        logger.warning('Dropping columnar copy of upload %s after a type change', data_upload.id)
+        remove_columnar_copy(data_upload.columnar_path)
+        data_upload.columnar_path = None
+        data_upload.columnar_schema = None
+
+
+def _reprofile(data_upload):
+    """Profile every stored row of an upload again and record the summary
+
+    Reads the typed columnar copy when there is one, else the original file.
+    """
+    if has_columnar_copy(data_upload):
+        profiler = DatasetProfiler()
+        for chunk in iter_columnar_chunks(data_upload):
+            profiler.update(chunk)
+        result = profiler.result()
+    else:
+        result = profile_dataset(data_upload.file_path, data_upload.file_type, sheet=data_upload.sheet_name)
+    data_upload.column_count = result['column_count']
+    data_upload.data_summary = result['summary']
+
+
+def append_to_upload(data_upload, file_path, file_type):
+    """Append the rows of a file to a completed upload
+
+    Control charts on the upload absorb only the new rows through their
+    stored running statistics. Returns the number of rows appended and the
+    analyses that were updated. Nothing is written if the new rows cannot be
+    charted or stored. The upload's summary is profiled again over all rows.
+    """
+    incoming = _incoming_rows(data_upload, file_path, file_type)
+    if data_upload.file_type != 'csv' and not has_columnar_copy(data_upload):
+        raise ValueError('Only CSV datasets or datasets with a columnar copy can be appended to')
+
+    # Chart the new rows first so a bad append leaves everything untouched
+    analyses = Analysis.query.filter_by(
+        data_upload_id=data_upload.id,
+        analysis_type='control_chart',
+        status='completed'
+    ).all()
+    updates = []
+    for analysis in analyses:
+        if analysis.incremental_state is None:
+            continue
+        try:
+            updates.append((analysis, update_control_chart(
+                analysis.results,
+                analysis.incremental_state,
+                incoming[required_columns(analysis.configuration)],
+                analysis.configuration
+            )))
+        except (ValueError, KeyError) as e:
+            raise ValueError(f"Appended rows break analysis {analysis.id}: {str(e)}")
+
+    # The columnar copy takes the rows in the dataset's types; the CSV keeps them as sent
+    column_types = dict(data_upload.column_types or {})
+    typed = apply_column_types(incoming, column_types)
+    copied = _own_stored_files(data_upload)
+    try:
+        _append_columnar(data_upload, typed)
+    except ValueError:
+        if copied:
+            remove_stored_files(data_upload)
+        raise
+    if data_upload.file_type == 'csv':
+        _append_csv(data_upload, incoming)
+
+    data_upload.row_count = (data_upload.row_count or 0) + len(incoming)
+    if column_types != (data_upload.column_types or {}):
+        data_upload.column_types = column_types
+    if data_upload.content_hash:
+        data_upload.content_hash = chain_sha256(data_upload.content_hash, file_sha256(file_path))
+    data_upload.updated_at = datetime.utcnow()
+    try:
+        # Sketches are not stored, so the summary is rebuilt rather than merged
+        _reprofile(data_upload)
+    except Exception:
+        logger.exception('Could not profile upload %s after an append', data_upload.id)
+
+    updated = []
+    for analysis, (results, state) in updates:
+        analysis.results = results
+        analysis.incremental_state = state
+        updated.append(analysis)
+
+    # Charts created before running statistics were kept are recomputed in full
+    for analysis in analyses:
+        if analysis.incremental_state is None:
+            try:
+                analysis.results, analysis.incremental_state = run_control_chart(data_upload, analysis.configuration)
+            except (ValueError, KeyError) as e:
+                analysis.status = 'failed'
+                analysis.error_message = str(e)
+            updated.append(analysis)
+
+    db.session.commit()
+    return len(incoming), updated
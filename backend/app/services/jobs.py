@@ -0,0 +1,239 @@
+"""Background job queue for work that should not run inside a request
+
+Tasks that work on a row (an upload being profiled, a report being written)
+are registered with its model. While a process holds such a job, queued or
+running, it touches the row's ``updated_at`` every ``HEARTBEAT_INTERVAL``.
+A pending or running row that no process has touched for ``ORPHAN_AFTER``,
+and whose job is not waiting in Redis, lost its job with the process that
+held it (a restart or crash) and is marked failed.
+
+With Redis, a worker moves each job it takes onto a processing list of its
+own and removes it once the job has finished. A worker also keeps a key
+alive while it runs; the processing lists of workers whose key expired are
+moved back onto the queue, so a job outlives the worker that crashed on it.
+"""
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import redis
+
+# Redis list the API pushes to and `flask jobs worker` pops from
+QUEUE_KEY = 'dmaic:jobs'
+
+# Jobs a worker has taken and not finished, one list per worker id
+PROCESSING_KEY = 'dmaic:jobs:processing:'
+
+# Exists while the worker with this id is alive
+WORKER_KEY = 'dmaic:jobs:worker:'
+
+# How often a process marks its jobs as alive and fails jobs no process holds
+HEARTBEAT_INTERVAL = 30
+
+# Age of the last heartbeat after which a job's row, or a worker, is given up on
+ORPHAN_AFTER = timedelta(seconds=4 * HEARTBEAT_INTERVAL)
+
+# Times a job is requeued after its worker died; a job that keeps killing workers is dropped
+MAX_ATTEMPTS = 3
+
+ORPHANED_MESSAGE = 'Processing was interrupted by a server restart; please try again'
+
+
+class JobQueue:
+    """Dispatch registered tasks to a worker pool
+
+    Backends (``JOB_QUEUE_BACKEND``):
+    - ``local``: in-process thread pool, no broker needed
+    - ``redis``: jobs are pushed to ``REDIS_URL`` and run by ``flask jobs worker``
+    - ``eager``: run inline, used by tests
+    """
+
+    def __init__(self, app=None):
+        self.tasks = {}
+        self.models = {}
+        self.app = None
+        self.backend = None
+        self._executor = None
+        self._redis = None
+        self._held = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._worker_id = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = app.config.get('JOB_QUEUE_BACKEND', 'local')
+        if self.backend == 'local':
+            self._executor = ThreadPoolExecutor(
+                max_workers=app.config.get('JOB_QUEUE_WORKERS', 2),
+                thread_name_prefix='dmaic-job'
+            )
+            # Serving processes start the heartbeat with their first request,
+            # so jobs orphaned by a restart are failed without waiting for new ones
+            app.before_request(self._start_heartbeat)
+        elif self.backend == 'redis':
+            self._redis = redis.Redis.from_url(app.config['REDIS_URL'])
+        elif self.backend != 'eager':
+            raise ValueError(f"Unknown job queue backend: {self.backend}")
+        app.extensions['jobs'] = self
+
+    def task(self, name, model=None):
+        """Register a function as a task runnable by name
+
+        With a ``model``, the task's first argument is the id of a row of it
+        whose ``status`` the task takes from pending or running to completed
+        or failed. The row is kept alive while its job is held, and failed
+        through its ``mark_failed`` if the job is lost.
+        """
+        def decorator(func):
+            self.tasks[name] = func
+            if model is not None:
+                self.models[name] = model
+            return func
+        return decorator
+
+    def enqueue(self, name, *args, job_id=None):
+        """Queue a registered task and return its job id"""
+        if name not in self.tasks:
+            raise KeyError(f"Unknown task: {name}")
+        job_id = job_id or uuid.uuid4().hex
+
+        if self.backend == 'redis':
+            payload = {'id': job_id, 'task': name, 'args': list(args)}
+            self._redis.lpush(QUEUE_KEY, json.dumps(payload))
+        elif self.backend == 'local':
+            with self._lock:
+                self._held[job_id] = (name, args)
+            self._start_heartbeat()
+            self._executor.submit(self._run, name, args, job_id)
+        else:
+            self._run(name, args)
+
+        return job_id
+
+    def _run(self, name, args, job_id=None):
+        with self.app.app_context():
+            try:
+                self.tasks[name](*args)
+            except Exception:
+                self.app.logger.exception('Job %s failed', name)
+            finally:
+                with self._lock:
+                    self._held.pop(job_id, None)
+
+    def work(self, burst=False):
+        """Run jobs from the Redis queue until stopped (or until empty in burst mode)
+
+        A job stays on this worker's processing list until it has run, so
+        if the worker dies meanwhile another worker puts it back on the queue.
+        """
+        if self.backend != 'redis':
+            raise RuntimeError('The worker loop requires JOB_QUEUE_BACKEND=redis')
+        self._worker_id = uuid.uuid4().hex
+        processing = PROCESSING_KEY + self._worker_id
+        self._beat()
+        self._start_heartbeat()
+        try:
+            while True:
+                if burst:
+                    payload = self._redis.lmove(QUEUE_KEY, processing, 'RIGHT', 'LEFT')
+                    if payload is None:
+                        return
+                else:
+                    payload = self._redis.blmove(QUEUE_KEY, processing, HEARTBEAT_INTERVAL, 'RIGHT', 'LEFT')
+                    if payload is None:
+                        continue
+                job = json.loads(payload)
+                with self._lock:
+                    self._held[job['id']] = (job['task'], job['args'])
+                self._run(job['task'], job['args'], job['id'])
+                # Acknowledge the job whatever its outcome; failures are recorded on its row
+                self._redis.lrem(processing, 1, payload)
+        finally:
+            self._redis.delete(WORKER_KEY + self._worker_id)
+
+    def _start_heartbeat(self):
+        if self._heartbeat is not None and self._heartbeat.is_alive():
+            return
+        with self._lock:
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._beat_forever, name='dmaic-job-heartbeat',
+                                                   daemon=True)
+                self._heartbeat.start()
+
+    def _beat_forever(self):
+        while True:
+            self._beat()
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def _beat(self):
+        """Mark this process's jobs alive, requeue the jobs of dead workers and fail lost jobs"""
+        try:
+            waiting = set()
+            if self.backend == 'redis':
+                if self._worker_id is not None:
+                    self._redis.set(WORKER_KEY + self._worker_id, 1, ex=int(ORPHAN_AFTER.total_seconds()))
+                self._requeue_abandoned()
+                waiting = self._waiting_job_ids()
+            self._touch_and_fail_orphaned(waiting)
+        except Exception:
+            self.app.logger.exception('Job heartbeat failed')
+
+    def _requeue_abandoned(self):
+        """Put the jobs of workers that stopped before finishing them back on the queue"""
+        for key in self._redis.scan_iter(match=PROCESSING_KEY + '*'):
+            worker_id = key.decode('utf-8')[len(PROCESSING_KEY):]
+            if self._redis.exists(WORKER_KEY + worker_id):
+                continue
+            while True:
+                payload = self._redis.rpop(key)
+                if payload is None:
+                    break
+                job = json.loads(payload)
+                job['attempts'] = job.get('attempts', 0) + 1
+                if job['attempts'] > MAX_ATTEMPTS:
+                    # Its row is failed once it goes stale
+                    self.app.logger.error('Dropping job %s (%s) after %s workers died running it',
+                                          job['id'], job['task'], MAX_ATTEMPTS)
+                    continue
+                self._redis.rpush(QUEUE_KEY, json.dumps(job))
+                self.app.logger.warning('Requeued job %s (%s) of stopped worker %s', job['id'], job['task'], worker_id)
+
+    def _waiting_job_ids(self):
+        """Ids of the jobs queued or being run in Redis"""
+        keys = [QUEUE_KEY] + list(self._redis.scan_iter(match=PROCESSING_KEY + '*'))
+        return {json.loads(payload)['id'] for key in keys for payload in self._redis.lrange(key, 0, -1)}
+
+    def _touch_and_fail_orphaned(self, waiting):
+        """Touch the rows of the jobs this process holds and fail those of jobs no process holds"""
+        from app import db
+
+        with self._lock:
+            held = list(self._held.values())
+        now = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                for model in set(self.models.values()):
+                    names = [name for name, task_model in self.models.items() if task_model is model]
+                    ids = [args[0] for name, args in held if name in names]
+                    active = model.query.filter(model.status.in_(('pending', 'running')))
+                    if ids:
+                        active.filter(model.id.in_(ids)).update({model.updated_at: now}, synchronize_session=False)
+                    stale = active.filter(model.job_id.isnot(None), model.updated_at < now - ORPHAN_AFTER)
+                    orphaned = [row for row in stale if row.job_id not in waiting]
+                    for row in orphaned:
+                        row.mark_failed(ORPHANED_MESSAGE)
+                    if orphaned:
+                        self.app.logger.warning('Marked %s orphaned %s rows as failed', len(orphaned),
+                                                model.__tablename__)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Could not check for orphaned jobs')
+            finally:
+                db.session.remove()
@@ -0,0 +1,166 @@
+"""JSON Patch (RFC 6902) and JSON Merge Patch (RFC 7386)
+
+Patches are applied to a copy of the document, so a patch that fails
+part-way leaves the original untouched.
+"""
+import copy
+import re
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+ARRAY_INDEX = re.compile(r'0|[1-9][0-9]*')
+
+
+class InvalidPatch(ValueError):
+    """A patch document that is malformed"""
+
+
+class PatchConflict(ValueError):
+    """A well-formed patch that cannot be applied to the document"""
+
+
+def parse_pointer(pointer):
+    """Reference tokens of a JSON Pointer (RFC 6901)"""
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise InvalidPatch(f'Invalid JSON pointer: {pointer!r}')
+    if not pointer:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def format_pointer(tokens):
+    """JSON Pointer for reference tokens"""
+    return ''.join('/' + str(token).replace('~', '~0').replace('/', '~1') for token in tokens)
+
+
+def parse_operations(operations):
+    """Validated ``(op, path, from, value)`` tuples of a JSON Patch, with pointers as token lists"""
+    if not isinstance(operations, list):
+        raise InvalidPatch('A JSON Patch must be an array of operations')
+
+    parsed = []
+    for number, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise InvalidPatch(f'Operation {number}: op must be one of {", ".join(OPERATIONS)}')
+        op = operation['op']
+        if 'path' not in operation:
+            raise InvalidPatch(f'Operation {number}: missing path')
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise InvalidPatch(f'Operation {number}: missing value')
+        if op in ('move', 'copy') and 'from' not in operation:
+            raise InvalidPatch(f'Operation {number}: missing from')
+
+        path = parse_pointer(operation['path'])
+        source = parse_pointer(operation['from']) if op in ('move', 'copy') else None
+        if op == 'move' and path[:len(source)] == source and path != source:
+            raise InvalidPatch(f'Operation {number}: cannot move a value into itself')
+        parsed.append((op, path, source, operation.get('value')))
+    return parsed
+
+
+def json_equal(a, b):
+    """Equality of JSON values, where booleans are not numbers"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(json_equal(a[key], b[key]) for key in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(json_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _array_index(tokens, token, length, allow_end):
+    if allow_end and token == '-':
+        return length
+    if not ARRAY_INDEX.fullmatch(token) or int(token) > length or (int(token) == length and not allow_end):
+        raise PatchConflict(f'Array index out of range: {format_pointer(tokens)}')
+    return int(token)
+
+
+def _resolve(document, tokens):
+    value = document
+    for depth, token in enumerate(tokens):
+        if isinstance(value, dict) and token in value:
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_array_index(tokens[:depth + 1], token, len(value), False)]
+        else:
+            raise PatchConflict(f'Path not found: {format_pointer(tokens[:depth + 1])}')
+    return value
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(tokens, tokens[-1], len(parent), True), value)
+    else:
+        raise PatchConflict(f'Path not found: {format_pointer(tokens[:-1])}')
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise PatchConflict('Cannot remove the whole document')
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict) and tokens[-1] in parent:
+        return parent.pop(tokens[-1])
+    if isinstance(parent, list):
+        return parent.pop(_array_index(tokens, tokens[-1], len(parent), False))
+    raise PatchConflict(f'Path not found: {format_pointer(tokens)}')
+
+
+def _replace(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict) and tokens[-1] in parent:
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent[_array_index(tokens, tokens[-1], len(parent), False)] = value
+    else:
+        raise PatchConflict(f'Path not found: {format_pointer(tokens)}')
+    return document
+
+
+def apply_json_patch(document, operations):
+    """The document with a JSON Patch applied; raises InvalidPatch or PatchConflict"""
+    document = copy.deepcopy(document)
+    for op, path, source, value in parse_operations(operations):
+        if op == 'test':
+            if not json_equal(_resolve(document, path), value):
+                raise PatchConflict(f'Test failed: {format_pointer(path)}')
+        elif op == 'add':
+            document = _add(document, path, copy.deepcopy(value))
+        elif op == 'remove':
+            _remove(document, path)
+        elif op == 'replace':
+            document = _replace(document, path, copy.deepcopy(value))
+        elif op == 'copy':
+            document = _add(document, path, copy.deepcopy(_resolve(document, source)))
+        elif op == 'move':
+            if path != source:
+                document = _add(document, path, _remove(document, source))
+            else:
+                _resolve(document, source)
+    return document
+
+
+def apply_merge_patch(target, patch):
+    """The target with a JSON Merge Patch applied
+
+    Only the objects along patched paths are copied; the rest of the
+    target is shared with the result, never modified.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
@@ -0,0 +1,38 @@
+"""Queries behind the listing endpoints
+
+Each function returns the filtered query and the columns it is ordered by,
+which the composite indexes in the models are built to match: the
+equality filters first, then the sort columns ending in the primary key.
+The routes and the query-plan check (``flask queries check-plans``) use
+the same functions, so the check covers exactly the queries the API runs.
+"""
+from app.models import Analysis, DataUpload, Project, Report
+
+
+def user_projects(user_id, stage=None, status=None):
+    """A user's projects, optionally of one stage and/or status, by (updated_at, id)"""
+    query = Project.query.filter_by(user_id=user_id)
+    if stage:
+        query = query.filter_by(current_stage=stage)
+    if status:
+        query = query.filter_by(status=status)
+    return query, [Project.updated_at, Project.id]
+
+
+def project_uploads(project_id):
+    """A project's data uploads, without the sheets of workbooks, by (created_at, id)"""
+    query = DataUpload.query.filter_by(project_id=project_id).filter(DataUpload.parent_id.is_(None))
+    return query, [DataUpload.created_at, DataUpload.id]
+
+
+def project_analyses(project_id, status=None):
+    """A project's analyses, optionally of one status, by (created_at, id)"""
+    query = Analysis.query.filter_by(project_id=project_id)
+    if status:
+        query = query.filter_by(status=status)
+    return query, [Analysis.created_at, Analysis.id]
+
+
+def project_reports(project_id):
+    """A project's reports by (created_at, id)"""
+    return Report.query.filter_by(project_id=project_id), [Report.created_at, Report.id]
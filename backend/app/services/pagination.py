@@ -0,0 +1,118 @@
+"""Keyset (cursor) pagination and cached list totals
+
+Pages continue from the sort key of the last row of the previous page
+instead of skipping rows with OFFSET, so every page costs the same indexed
+range scan no matter how deep into the list it is.
+"""
+import base64
+import binascii
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+# Seconds a cached list total may be served before it is recounted
+COUNT_TTL = 60
+
+# Expired totals are pruned once the cache holds this many
+COUNT_CACHE_ITEMS = 10_000
+
+
+def encode_cursor(values):
+    """Opaque cursor for a row's sort key"""
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Sort key values of a cursor, typed like ``columns``; raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+
+    decoded = []
+    for value, column in zip(values, columns):
+        if column.type.python_type is datetime:
+            value = datetime.fromisoformat(value) if isinstance(value, str) else None
+        elif column.type.python_type is int:
+            value = value if isinstance(value, int) else None
+        if value is None:
+            raise ValueError('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def page_size(value):
+    """Requested page size, clamped to 1..MAX_PER_PAGE"""
+    return min(max(int(value or DEFAULT_PER_PAGE), 1), MAX_PER_PAGE)
+
+
+def keyset_query(query, columns, cursor=None, limit=None):
+    """``query`` in descending order of ``columns``, continuing after ``cursor``"""
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)))
+    query = query.order_by(*[column.desc() for column in columns])
+    return query if limit is None else query.limit(limit)
+
+
+def keyset_page(query, columns, cursor=None, per_page=DEFAULT_PER_PAGE):
+    """One page of ``query`` in descending order of ``columns``
+
+    The last column must be unique (the primary key) so rows with equal
+    timestamps are neither skipped nor repeated. Returns ``(items, next_cursor)``;
+    ``next_cursor`` is None on the last page.
+    """
+    # One extra row tells whether another page follows, without counting
+    items = keyset_query(query, columns, cursor, per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in columns])
+    return items, next_cursor
+
+
+class CountCache:
+    """Short-lived totals of list queries, so pages don't each run COUNT(*)
+
+    Entries live in this process. Writes made here invalidate them at once;
+    writes made by other processes show up once an entry expires.
+    """
+
+    def __init__(self, ttl=COUNT_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, count):
+        """Cached total for ``key``, calling ``count()`` when missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+        total = count()
+        with self._lock:
+            if len(self._entries) >= COUNT_CACHE_ITEMS:
+                self._entries = {cached: entry for cached, entry in self._entries.items() if entry[1] > now}
+            self._entries[key] = (total, now + self.ttl)
+        return total
+
+    def invalidate(self, prefix):
+        """Drop every total whose key starts with ``prefix``"""
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+list_totals = CountCache()
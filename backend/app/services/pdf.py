@@ -0,0 +1,143 @@
+"""Minimal streaming PDF writer
+
+Objects are written to the file as soon as they are complete and only their
+byte offsets are kept, so memory use does not grow with the page count.
+Images are written once and referenced from every page that shows them.
+Text uses the standard Helvetica fonts, which PDF viewers always provide.
+"""
+import zlib
+
+from PIL import Image
+
+LETTER = (612, 792)  # points
+
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+
+# Image rows compressed per write, bounding the memory one image needs
+IMAGE_STRIP_ROWS = 64
+
+
+def escape_text(text):
+    """PDF string literal body for text in the fonts' WinAnsi encoding"""
+    data = str(text).encode('cp1252', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PDFWriter:
+    """Write a PDF page by page to ``path``"""
+
+    def __init__(self, path, page_size=LETTER):
+        self.page_size = page_size
+        self._file = open(path, 'wb')
+        self._offsets = []
+        self._pages = []
+        self._images = {}
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._catalog = self._reserve()
+        self._page_tree = self._reserve()
+        self._fonts = {
+            name: self.add_object(f'<< /Type /Font /Subtype /Type1 /BaseFont /{font} '
+                                  f'/Encoding /WinAnsiEncoding >>'.encode('ascii'))
+            for name, font in FONTS.items()
+        }
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    def _write(self, data):
+        self._file.write(data)
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _begin(self, number):
+        self._offsets[number - 1] = self._file.tell()
+        self._write(f'{number} 0 obj\n'.encode('ascii'))
+
+    def add_object(self, body, number=None):
+        """Write an object and return its number"""
+        number = number or self._reserve()
+        self._begin(number)
+        self._write(body)
+        self._write(b'\nendobj\n')
+        return number
+
+    def _add_stream(self, dictionary, chunks):
+        """Write a Flate-compressed stream from an iterable of byte chunks"""
+        number = self._reserve()
+        length = self._reserve()
+        self._begin(number)
+        self._write(f'<< {dictionary} /Filter /FlateDecode /Length {length} 0 R >>\nstream\n'.encode('ascii'))
+        start = self._file.tell()
+        compressor = zlib.compressobj()
+        for chunk in chunks:
+            self._write(compressor.compress(chunk))
+        self._write(compressor.flush())
+        size = self._file.tell() - start
+        self._write(b'\nendstream\nendobj\n')
+        # The length is only known afterwards, so it is its own object
+        self.add_object(str(size).encode('ascii'), number=length)
+        return number
+
+    def add_image(self, key, path):
+        """Embed an image file once per key; returns (resource name, width, height) in pixels"""
+        if key in self._images:
+            return self._images[key]
+
+        with Image.open(path) as image:
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Flatten transparency onto white, as the charts are drawn on white
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            width, height = image.size
+
+            def strips():
+                for top in range(0, height, IMAGE_STRIP_ROWS):
+                    yield image.crop((0, top, width, min(top + IMAGE_STRIP_ROWS, height))).tobytes()
+
+            number = self._add_stream(
+                f'/Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                f'/ColorSpace /DeviceRGB /BitsPerComponent 8',
+                strips()
+            )
+
+        self._images[key] = (f'Im{number}', width, height)
+        return self._images[key]
+
+    def add_page(self, content, images=()):
+        """Write one page from its content stream and the image names it draws"""
+        contents = self._add_stream('', [content])
+        fonts = ' '.join(f'/{name} {number} 0 R' for name, number in self._fonts.items())
+        xobjects = ' '.join(f'/{name} {name[2:]} 0 R' for name in sorted(set(images)))
+        width, height = self.page_size
+        self._pages.append(self.add_object(
+            f'<< /Type /Page /Parent {self._page_tree} 0 R /MediaBox [0 0 {width} {height}] '
+            f'/Resources << /Font << {fonts} >> /XObject << {xobjects} >> >> '
+            f'/Contents {contents} 0 R >>'.encode('ascii')
+        ))
+
+    def close(self, title=None):
+        """Write the page tree, cross-reference table and trailer"""
+        kids = ' '.join(f'{number} 0 R' for number in self._pages)
+        self.add_object(f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>'.encode('ascii'),
+                        number=self._page_tree)
+        self.add_object(f'<< /Type /Catalog /Pages {self._page_tree} 0 R >>'.encode('ascii'),
+                        number=self._catalog)
+        info = self.add_object(b'<< /Title (' + escape_text(title or '') + b') /Producer (DMAIC Assistant) >>')
+
+        xref = self._file.tell()
+        self._write(f'xref\n0 {len(self._offsets) + 1}\n0000000000 65535 f \n'.encode('ascii'))
+        for offset in self._offsets:
+            self._write(f'{offset:010d} 00000 n \n'.encode('ascii'))
+        self._write(f'trailer\n<< /Size {len(self._offsets) + 1} /Root {self._catalog} 0 R '
+                    f'/Info {info} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('ascii'))
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
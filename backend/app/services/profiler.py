@@ -0,0 +1,226 @@
+"""Single-pass, bounded-memory dataset profiling"""
+import numpy as np
+import pandas as pd
+from pandas.api import types as ptypes
+
+from app.services.column_types import apply_column_types, infer_column_types, split_type
+from app.services.readers import iter_chunks
+from app.services.sketches import HyperLogLog, KLLSketch, TopK
+
+
+def _native(value):
+    """Convert numpy scalars to plain Python values for JSON columns"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _is_numeric(dtype):
+    return ptypes.is_numeric_dtype(dtype) and not ptypes.is_bool_dtype(dtype)
+
+
+def _is_categorical(dtype):
+    return ptypes.is_object_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype)
+
+
+def _is_counted(dtype):
+    """Whether a column is profiled by its most frequent values"""
+    return _is_categorical(dtype) or ptypes.is_bool_dtype(dtype)
+
+
+class NumericColumnProfile:
+    """Running count/mean/std/min/max and quantile sketch for one column"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = KLLSketch()
+
+    def update(self, series):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        values = values[~np.isnan(values)]
+        n = values.size
+        if n == 0:
+            return
+
+        # Merge the chunk's moments into the running Welford accumulators
+        chunk_mean = values.mean()
+        chunk_m2 = np.square(values - chunk_mean).sum()
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+        chunk_min, chunk_max = values.min(), values.max()
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+        self.sketch.update(values)
+
+    def to_summary(self, column):
+        has_values = self.count > 0
+        return {
+            'column': column,
+            'count': int(self.count),
+            'mean': float(self.mean) if has_values else None,
+            'std': float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else None,
+            'min': float(self.min) if has_values else None,
+            'max': float(self.max) if has_values else None,
+            'median': self.sketch.quantile(0.5),
+            'quartiles': {
+                'q1': self.sketch.quantile(0.25),
+                'q3': self.sketch.quantile(0.75)
+            }
+        }
+
+
+class CategoricalColumnProfile:
+    """Heavy hitters and distinct count for one column"""
+
+    def __init__(self):
+        self.top = TopK()
+        self.distinct = HyperLogLog()
+
+    def update(self, series):
+        counts = series.value_counts(dropna=True)
+        # Categoricals also count the categories absent from this chunk
+        counts = counts[counts > 0]
+        self.top.update(counts)
+        self.distinct.update(counts.index.to_numpy())
+
+    def to_summary(self, column):
+        top_values = self.top.most_common(5)
+        unique_count = len(self.top.counts) if self.top.exact else self.distinct.count()
+        return {
+            'column': column,
+            'unique_count': int(unique_count),
+            'most_frequent': _native(top_values.index[0]) if not top_values.empty else None,
+            'top_values': {_native(value): int(count) for value, count in top_values.items()}
+        }
+
+
+class DatasetProfiler:
+    """Profile a dataset one DataFrame chunk at a time
+
+    Every column is scanned once per chunk and only fixed-size accumulators are
+    kept between chunks, so memory does not grow with the number of rows.
+    """
+
+    def __init__(self):
+        self.row_count = 0
+        self.columns = None
+        self.dtypes = {}
+        self.missing = {}
+        self.numeric = {}
+        self.categorical = {}
+        # Columns that became text after chunks of another type were consumed
+        self.demoted = set()
+
+    def update(self, chunk):
+        if self.columns is None:
+            self.columns = chunk.columns.tolist()
+            self.missing = {column: 0 for column in self.columns}
+
+        self.row_count += len(chunk)
+        for column, count in chunk.isna().sum().items():
+            self.missing[column] += int(count)
+
+        for column in self.columns:
+            series = chunk[column]
+            previous = self.dtypes.get(column)
+            self._merge_dtype(column, series.dtype)
+            dtype = self.dtypes[column]
+
+            if _is_numeric(dtype):
+                self.numeric.setdefault(column, NumericColumnProfile()).update(series)
+            elif _is_counted(dtype):
+                if previous is not None and str(previous) != str(dtype) and not _is_categorical(previous):
+                    self.numeric.pop(column, None)
+                    self.demoted.add(column)
+                if column not in self.demoted:
+                    self.categorical.setdefault(column, CategoricalColumnProfile()).update(series)
+
+    def _merge_dtype(self, column, dtype):
+        """Widen a column's dtype the way a whole-file read would"""
+        current = self.dtypes.get(column)
+        # Categoricals of different chunks have different categories but the same type
+        if current is None or str(current) == str(dtype):
+            self.dtypes[column] = dtype
+        elif _is_numeric(current) and _is_numeric(dtype):
+            self.dtypes[column] = np.result_type(current, dtype)
+        else:
+            self.dtypes[column] = np.dtype('object')
+
+    def rescan(self, chunks):
+        """Profile demoted columns again from chunks read as plain objects"""
+        for chunk in chunks:
+            for column in self.demoted:
+                self.categorical.setdefault(column, CategoricalColumnProfile()).update(chunk[column])
+        self.demoted = set()
+
+    def result(self):
+        """Return the profile in the shape stored on ``DataUpload``"""
+        columns = self.columns or []
+        column_types = {column: str(self.dtypes[column]) for column in columns}
+
+        summary = {
+            'numeric_columns': [
+                self.numeric[column].to_summary(column)
+                for column in columns if column in self.numeric
+            ],
+            'categorical_columns': [
+                self.categorical[column].to_summary(column)
+                for column in columns if column in self.categorical
+            ],
+            'missing_values': self.missing,
+            'data_types': column_types
+        }
+
+        return {
+            'row_count': self.row_count,
+            'column_count': len(columns),
+            'column_names': columns,
+            'column_types': column_types,
+            'summary': summary
+        }
+
+
+def profile_dataset(file_path, file_type, progress=None, on_chunk=None, on_bytes=None, stream=None, sheet=None):
+    """Profile an uploaded file in a single streaming pass
+
+    Column types are inferred as the file is read (see column_types) and
+    the chunks are converted to them, so consumers receive typed chunks.
+
+    ``on_chunk`` and ``on_bytes``, if given, receive every parsed chunk and
+    raw block as well, so other consumers (the columnar copy, the row index)
+    can share the same read of the file. With ``stream`` the pass reads the
+    file as it arrives; ``file_path`` is only read if a column must be
+    profiled again, by which time the whole file has been saved there.
+    ``sheet`` names the worksheet profiled from an Excel file.
+    """
+    profiler = DatasetProfiler()
+    column_types = None
+    for chunk in iter_chunks(file_path, file_type, progress=progress, on_bytes=on_bytes, stream=stream,
+                             sheet=sheet):
+        # Types are inferred from the first chunk and applied to every chunk
+        if column_types is None:
+            column_types = infer_column_types(chunk)
+        chunk = apply_column_types(chunk, column_types)
+        profiler.update(chunk)
+        if on_chunk:
+            on_chunk(chunk)
+
+    if profiler.demoted:
+        # Rare: re-read only the columns whose type changed part-way through
+        profiler.rescan(iter_chunks(file_path, file_type, usecols=sorted(profiler.demoted), dtype=object,
+                                     sheet=sheet))
+
+    result = profiler.result()
+    if column_types:
+        # Date columns keep the format they were parsed with
+        result['column_types'] = {
+            column: column_types[column] if split_type(column_types.get(column, ''))[0] == dtype else dtype
+            for column, dtype in result['column_types'].items()
+        }
+    return result
@@ -0,0 +1,206 @@
+"""Partial project updates from JSON Patch and JSON Merge Patch documents
+
+Only the fields a patch touches are loaded and written. On PostgreSQL,
+patches to the stage documents are translated to jsonb_set/jsonb_insert
+expressions and applied by the database in a single UPDATE, so large
+documents never travel between the database and the application.
+"""
+import json
+from datetime import date, datetime
+
+from marshmallow import ValidationError
+from sqlalchemy import and_, case, cast, func, literal, null, select, true, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.types import Text
+
+from app import db
+from app.models import Project
+from app.services.json_patch import (
+    ARRAY_INDEX, InvalidPatch, PatchConflict, apply_json_patch, apply_merge_patch, json_equal, parse_operations
+)
+
+JSON_PATCH = 'application/json-patch+json'
+MERGE_PATCH = 'application/merge-patch+json'
+
+# JSON Patch operations the database applies itself; patches using move or copy are applied in Python
+SQL_OPERATIONS = {'add', 'remove', 'replace', 'test'}
+
+
+class VersionConflict(Exception):
+    """The project changed after the version the patch was made against"""
+
+
+def patched_fields(patch_format, patch, editable):
+    """Project fields a patch reads or writes; raises InvalidPatch for others"""
+    if patch_format == MERGE_PATCH:
+        if not isinstance(patch, dict):
+            raise InvalidPatch('A merge patch must be an object of project fields')
+        fields = list(patch)
+    else:
+        fields = []
+        for _, path, source, _ in parse_operations(patch):
+            for tokens in (path, source):
+                if tokens is None:
+                    continue
+                if not tokens:
+                    raise InvalidPatch('Patch paths must start with a project field')
+                fields.append(tokens[0])
+
+    unknown = [field for field in fields if field not in editable]
+    if unknown:
+        raise InvalidPatch(f"Fields cannot be patched: {', '.join(dict.fromkeys(unknown))}")
+    return list(dict.fromkeys(fields))
+
+
+def _validate(values, schema):
+    """Deserialized field values, allowing None only for nullable columns"""
+    cleared = [field for field, value in values.items() if value is None]
+    required = [field for field in cleared if not Project.__table__.c[field].nullable]
+    if required:
+        raise ValidationError({field: ['Field may not be null.'] for field in required})
+    loaded = schema.load({field: value for field, value in values.items() if value is not None}, partial=True)
+    return {**dict.fromkeys(cleared), **loaded}
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _patch_in_python(project, patch_format, patch, fields, schema):
+    db.session.refresh(project, fields)
+    current = {field: _json_value(getattr(project, field)) for field in fields}
+    if patch_format == MERGE_PATCH:
+        patched = {field: None if value is None else apply_merge_patch(current[field], value)
+                   for field, value in patch.items()}
+    else:
+        document = apply_json_patch(current, patch)
+        # Removing a top-level field clears it
+        patched = {field: document.get(field) for field in fields}
+
+    changed = {field: value for field, value in patched.items() if not json_equal(value, current[field])}
+    for field, value in _validate(changed, schema).items():
+        setattr(project, field, value)
+    return list(changed)
+
+
+def _jsonb(value):
+    return cast(literal(json.dumps(value), Text), JSONB)
+
+
+def _text_array(tokens):
+    return literal(list(tokens), ARRAY(Text))
+
+
+def _at(document, tokens):
+    return document.op('#>', return_type=JSONB)(_text_array(tokens))
+
+
+def _sql_operation(document, op, tokens, value):
+    """(new document, condition for the operation to apply) as SQL expressions"""
+    if not tokens:
+        # The whole document
+        if op == 'test':
+            return document, document.is_(None) if value is None else document == _jsonb(value)
+        return (null() if op == 'remove' else _jsonb(value)), true()
+
+    target = _at(document, tokens)
+    path = _text_array(tokens)
+    if op == 'test':
+        return document, target == _jsonb(value)
+    if op == 'remove':
+        return document.op('#-', return_type=JSONB)(path), target.isnot(None)
+    if op == 'replace':
+        return func.jsonb_set(document, path, _jsonb(value), False, type_=JSONB), target.isnot(None)
+
+    # add: insert into an array, or set an object member
+    parent = _at(document, tokens[:-1])
+    parent_type = func.jsonb_typeof(parent)
+    member = func.jsonb_set(document, path, _jsonb(value), True, type_=JSONB)
+    last = tokens[-1]
+    if last == '-':
+        appended = func.jsonb_insert(document, _text_array(tokens[:-1] + ['-1']), _jsonb(value), True, type_=JSONB)
+        return case((parent_type == 'array', appended), else_=member), parent_type.in_(['array', 'object'])
+    if ARRAY_INDEX.fullmatch(last):
+        inserted = func.jsonb_insert(document, path, _jsonb(value), type_=JSONB)
+        # CASE so the array length is only taken of arrays
+        in_range = case((parent_type == 'array', func.jsonb_array_length(parent) >= int(last)),
+                        else_=parent_type == 'object')
+        return case((parent_type == 'array', inserted), else_=member), in_range
+    return member, parent_type == 'object'
+
+
+def _sql_merge(document, patch):
+    """SQL expression of a JSON Merge Patch applied to a jsonb document"""
+    if not isinstance(patch, dict):
+        return _jsonb(patch)
+    merged = case((func.jsonb_typeof(document) == 'object', document), else_=_jsonb({}))
+    removed = [key for key, value in patch.items() if value is None]
+    if removed:
+        merged = merged.op('-', return_type=JSONB)(_text_array(removed))
+    members = []
+    for key, value in patch.items():
+        if value is not None:
+            members += [key, _sql_merge(document.op('->', return_type=JSONB)(key), value)]
+    if members:
+        merged = merged.op('||', return_type=JSONB)(func.jsonb_build_object(*members, type_=JSONB))
+    return merged
+
+
+def _patch_in_database(project, patch_format, patch, fields, schema):
+    documents = [field for field in fields if field in Project.DOCUMENT_FIELDS]
+    values = {}
+    changed = []
+
+    if patch_format == MERGE_PATCH:
+        scalars = {field: value for field, value in patch.items() if field not in documents}
+        values.update(_validate(scalars, schema))
+        for field in documents:
+            value = patch[field]
+            if value is not None and not isinstance(value, dict):
+                _validate({field: value}, schema)
+            values[field] = null() if value is None else _sql_merge(getattr(Project, field), value)
+        changed = list(patch)
+        condition = true()
+    else:
+        # Each operation is a CTE over the previous one's documents, so the
+        # statement grows linearly with the number of operations
+        step = select(*[getattr(Project, field).label(field) for field in documents],
+                      true().label('ok')).where(Project.id == project.id).cte('patch_0')
+        for number, (op, path, _, value) in enumerate(parse_operations(patch), start=1):
+            field, tokens = path[0], path[1:]
+            if not tokens and op in ('add', 'replace'):
+                _validate({field: value}, schema)
+            new_document, condition = _sql_operation(step.c[field], op, tokens, value)
+            step = select(*[(new_document if name == field else step.c[name]).label(name) for name in documents],
+                          and_(step.c.ok, condition).label('ok')).cte(f'patch_{number}')
+            if op != 'test' and field not in changed:
+                changed.append(field)
+        values.update({field: select(step.c[field]).scalar_subquery() for field in changed})
+        condition = select(step.c.ok).scalar_subquery()
+
+    statement = update(Project).where(
+        Project.id == project.id, Project.version == project.version, condition
+    ).values(**values, version=Project.version + 1, updated_at=datetime.utcnow()).returning(Project.version)
+    if db.session.execute(statement, execution_options={'synchronize_session': False}).first() is None:
+        current = db.session.query(Project.version).filter_by(id=project.id).scalar()
+        if current != project.version:
+            raise VersionConflict()
+        raise PatchConflict('A test failed or a path was not found in the current document')
+
+    db.session.refresh(project, ['version', 'updated_at'])
+    return changed
+
+
+def patch_project(project, patch_format, patch, fields, schema):
+    """Apply a patch to a project loaded with its id and version; returns the changed fields
+
+    The caller commits. A concurrent update of the project raises
+    VersionConflict here or StaleDataError at commit.
+    """
+    sql_capable = patch_format == MERGE_PATCH or (
+        all(field in Project.DOCUMENT_FIELDS for field in fields)
+        and all(op in SQL_OPERATIONS for op, _, _, _ in parse_operations(patch))
+    )
+    if db.session.get_bind().dialect.name == 'postgresql' and sql_capable:
+        return _patch_in_database(project, patch_format, patch, fields, schema)
+    return _patch_in_python(project, patch_format, patch, fields, schema)
@@ -0,0 +1,98 @@
+"""Query-plan regression check for the listing queries
+
+Each listing query is EXPLAINed on the configured database and flagged if
+its plan reads a whole table or sorts rows, instead of walking one of the
+composite indexes in order. Supported on SQLite and PostgreSQL.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.services.listings import project_analyses, project_reports, project_uploads, user_projects
+from app.services.pagination import DEFAULT_PER_PAGE, encode_cursor, keyset_query
+
+# PostgreSQL plan nodes that mean a table was not read through an index, or rows were sorted
+POSTGRESQL_PROBLEM_NODES = {'Seq Scan', 'Sort', 'Incremental Sort'}
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN of a statement, in the form the dialect's check reads"""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'sqlite')
+def _explain_sqlite(element, compiler, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, 'postgresql')
+def _explain_postgresql(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def listing_queries(user_id=1, project_id=1):
+    """(name, query) for every listing query the API runs, first pages and later ones"""
+    cursor = encode_cursor([datetime.utcnow(), 1])
+    paginated = [
+        ('projects', user_projects(user_id)),
+        ('projects by stage', user_projects(user_id, stage='define')),
+        ('projects by status', user_projects(user_id, status='active')),
+        ('projects by stage and status', user_projects(user_id, stage='define', status='active')),
+        ('data uploads', project_uploads(project_id)),
+    ]
+    for name, (query, order) in paginated:
+        yield name, keyset_query(query, order, limit=DEFAULT_PER_PAGE + 1)
+        yield f'{name} after a cursor', keyset_query(query, order, cursor, DEFAULT_PER_PAGE + 1)
+
+    yield 'analyses', keyset_query(*project_analyses(project_id))
+    query, order = project_analyses(project_id, status='completed')
+    yield 'completed analyses', query.order_by(*order)
+    yield 'reports', keyset_query(*project_reports(project_id))
+
+
+def _sqlite_problems(rows):
+    # Rows are (id, parent, unused, detail); a SEARCH uses an index, a SCAN reads every row
+    return [detail for *_, detail in rows if detail.startswith('SCAN ') or 'TEMP B-TREE' in detail]
+
+
+def _postgresql_problems(rows):
+    problems = []
+    nodes = [rows[0][0][0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] in POSTGRESQL_PROBLEM_NODES:
+            relation = node.get('Relation Name')
+            problems.append(node['Node Type'] + (f' on {relation}' if relation else ''))
+        nodes.extend(node.get('Plans', []))
+    return problems
+
+
+PLAN_READERS = {'sqlite': _sqlite_problems, 'postgresql': _postgresql_problems}
+
+
+def check_plans(session):
+    """(name, problems) for each listing query; an empty list means an index-ordered plan"""
+    dialect = session.get_bind().dialect.name
+    if dialect not in PLAN_READERS:
+        raise ValueError(f'Query plans cannot be checked on {dialect}')
+
+    results = []
+    try:
+        if dialect == 'postgresql':
+            # Small or empty tables are cheaper to scan and sort, so the planner would
+            # choose that regardless of indexes; with both penalised it only does so
+            # when no index can serve the query.
+            session.execute(text('SET LOCAL enable_seqscan = off'))
+            session.execute(text('SET LOCAL enable_sort = off'))
+        for name, query in listing_queries():
+            rows = session.execute(Explain(query.statement)).all()
+            results.append((name, PLAN_READERS[dialect](rows)))
+    finally:
+        session.rollback()
+    return results
@@ -0,0 +1,153 @@
+"""Chunked readers for uploaded CSV/Excel datasets"""
+import hashlib
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Rows per chunk; bounds peak memory of every streaming consumer
+CHUNK_ROWS = 100_000
+
+# Bytes per read when hashing a whole file
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+class _TeeReader:
+    """File wrapper that hands every block pandas reads to a callback"""
+
+    def __init__(self, handle, on_bytes):
+        self._handle = handle
+        self._on_bytes = on_bytes
+
+    def read(self, size=-1):
+        data = self._handle.read(size)
+        self._on_bytes(data)
+        return data
+
+    def __iter__(self):
+        return iter(self._handle)
+
+
+def file_sha256(file_path):
+    """Hex SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chain_sha256(previous, appended):
+    """Content hash of a dataset after appending data whose own hash is ``appended``"""
+    return hashlib.sha256(f'{previous}:{appended}'.encode('ascii')).hexdigest()
+
+
+def sheet_names(file_path, file_type):
+    """Names of a workbook's worksheets, in order; empty for CSV files"""
+    if file_type == 'xlsx':
+        # Read-only mode lists the sheets without parsing their cells
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            return [worksheet.title for worksheet in workbook.worksheets]
+        finally:
+            workbook.close()
+    if file_type == 'xls':
+        with pd.ExcelFile(file_path) as workbook:
+            return list(workbook.sheet_names)
+    return []
+
+
+def iter_chunks(file_path, file_type, chunksize=CHUNK_ROWS, usecols=None, dtype=None,
+                progress=None, on_bytes=None, stream=None, sheet=None):
+    """Yield DataFrame chunks of an uploaded dataset without loading it whole
+
+    ``sheet`` names the worksheet of an Excel file to read; the first by
+    default. ``progress``, if given, is called with the fraction of the file consumed
+    after each chunk. ``on_bytes`` (CSV only) receives the raw bytes as they
+    are read, so byte-level consumers need no second pass over the file.
+    ``stream`` (CSV only) is a binary stream of the file to read instead,
+    such as an upload still being received; progress is not reported for it.
+    """
+    if file_type == 'csv' and stream is not None:
+        source = _TeeReader(stream, on_bytes) if on_bytes else stream
+        with pd.read_csv(source, chunksize=chunksize, usecols=usecols, dtype=dtype) as reader:
+            yield from reader
+    elif file_type == 'csv':
+        total = os.path.getsize(file_path) or 1
+        with open(file_path, 'rb') as handle:
+            source = _TeeReader(handle, on_bytes) if on_bytes else handle
+            with pd.read_csv(source, chunksize=chunksize, usecols=usecols, dtype=dtype) as reader:
+                for chunk in reader:
+                    yield chunk
+                    if progress:
+                        progress(min(handle.tell() / total, 1.0))
+    elif file_type == 'xlsx':
+        for chunk, fraction in _iter_xlsx_chunks(file_path, chunksize, sheet):
+            if usecols is not None:
+                chunk = chunk[list(usecols)]
+            yield chunk.astype(dtype) if dtype is not None else chunk
+            if progress:
+                progress(fraction)
+    elif file_type == 'xls':
+        # Legacy workbooks have no streaming reader; fall back to a full load
+        df = pd.read_excel(file_path, sheet_name=sheet or 0, usecols=usecols, dtype=dtype)
+        for start in range(0, max(len(df), 1), chunksize):
+            yield df.iloc[start:start + chunksize]
+            if progress:
+                progress(min((start + chunksize) / max(len(df), 1), 1.0))
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def _unique_columns(header):
+    """Name header cells the way pandas does (blank -> Unnamed, duplicates -> .1)"""
+    columns = []
+    seen = {}
+    for position, name in enumerate(header):
+        name = f'Unnamed: {position}' if name is None else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def _rows_to_frame(rows, columns):
+    width = max([len(columns)] + [len(row) for row in rows])
+    if width > len(columns):
+        columns = columns + [f'Unnamed: {i}' for i in range(len(columns), width)]
+    rows = [row + (None,) * (width - len(row)) if len(row) < width else row for row in rows]
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def _iter_xlsx_chunks(file_path, chunksize, sheet=None):
+    """Stream a worksheet (the first by default) through openpyxl's read-only mode
+
+    Yields ``(chunk, fraction_of_rows_read)`` pairs.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+        total = worksheet.max_row or 1
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _unique_columns(header)
+
+        batch = []
+        yielded = False
+        for position, row in enumerate(rows, start=2):
+            if all(value is None for value in row):
+                continue
+            batch.append(row)
+            if len(batch) == chunksize:
+                yield _rows_to_frame(batch, columns), min(position / total, 1.0)
+                yielded = True
+                batch = []
+        if batch or not yielded:
+            yield _rows_to_frame(batch, columns), 1.0
+    finally:
+        workbook.close()
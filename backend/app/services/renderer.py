@@ -0,0 +1,202 @@
+"""Pooled chart rendering with a content-keyed image cache
+
+Charts are drawn in worker processes that import Matplotlib (Agg) once at
+start-up, so a request never pays the import or warm-up cost. Rendered
+images are stored under a key derived from everything that affects the
+picture, so identical charts are drawn once and shared between analyses.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, wait
+
+from app.services.executor import source_snapshot
+from app.services.storage import atomic_write, evict_least_recently_used
+
+# Bump when drawings change, so cached images are not reused
+RENDER_VERSION = '1'
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+PURPOSES = ['screen', 'print']
+
+
+def _init_worker():
+    from app.services import charts
+    charts.warm_up()
+
+
+def _ping():
+    return True
+
+
+def _render(source, analysis_type, results, configuration, name, image_format, dpi):
+    from app.services.charts import render
+    return render(source, analysis_type, results, configuration, name, image_format, dpi)
+
+
+class ChartRenderer:
+    """Render analysis charts on a pool of pre-warmed processes
+
+    Settings:
+    - ``CHART_RENDERER``: ``process`` (default) or ``eager`` to draw inline
+    - ``CHART_WORKERS``: rendering processes
+    - ``CHART_DPI`` / ``CHART_FORMAT``: print output
+    - ``CHART_SCREEN_DPI``: screen previews
+    - ``CHART_CACHE_FOLDER`` / ``CHART_CACHE_MAX_BYTES``: rendered image store and its size bound
+    - ``CHART_RENDER_TIMEOUT``: seconds a batch may take; the pool is restarted
+      when a render overruns it, since a running render cannot be cancelled
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pool = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = app.config.get('CHART_RENDERER', 'process')
+        if self.backend not in ('process', 'eager'):
+            raise ValueError(f"Unknown chart renderer: {self.backend}")
+        self.workers = app.config.get('CHART_WORKERS', 2)
+        self.print_dpi = app.config.get('CHART_DPI', 300)
+        self.print_format = app.config.get('CHART_FORMAT', 'png')
+        self.screen_dpi = app.config.get('CHART_SCREEN_DPI', 100)
+        self.folder = app.config.get('CHART_CACHE_FOLDER')
+        self.max_bytes = app.config.get('CHART_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+        self.timeout = app.config.get('CHART_RENDER_TIMEOUT', 120)
+        app.extensions['chart_renderer'] = self
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker
+                )
+                # Start every worker now so none warms up during a request
+                wait([self._pool.submit(_ping) for _ in range(self.workers)])
+            return self._pool
+
+    def _restart_pool(self, pool):
+        """Kill the workers of a pool stuck on a render; the next batch starts a new pool
+
+        Other batches still waiting on the old pool fail with BrokenProcessPool.
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        self.app.logger.warning('Chart rendering timed out; restarted the rendering pool')
+
+    def variant(self, purpose, image_format=None):
+        """(format, dpi) for screen previews or print output"""
+        if purpose not in PURPOSES:
+            raise ValueError(f"purpose must be one of {', '.join(PURPOSES)}")
+        if purpose == 'print':
+            image_format, dpi = image_format or self.print_format, self.print_dpi
+        else:
+            image_format, dpi = image_format or 'png', self.screen_dpi
+        if image_format not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        return image_format, dpi
+
+    def image_key(self, analysis, name, image_format, dpi):
+        """Key of a rendered chart: the data, results, configuration and output settings"""
+        upload = analysis.data_upload
+        dataset = upload.content_hash if upload and upload.content_hash else \
+            f"{getattr(upload, 'file_path', None)}@{getattr(upload, 'updated_at', None)}"
+        canonical = json.dumps({
+            'dataset': dataset,
+            'type': analysis.analysis_type,
+            'configuration': analysis.configuration,
+            'results': analysis.results,
+            'chart': name,
+            'format': image_format,
+            'dpi': dpi,
+            'version': RENDER_VERSION
+        }, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def image_path(self, key, image_format):
+        return os.path.join(self.folder, key[:2], f'{key}.{image_format}')
+
+    def render_analyses(self, analyses, purpose, image_format=None, names=None):
+        """Render (or reuse) every chart of the given completed analyses in one batch
+
+        Records the images on each ``Analysis.charts`` under the variant's name
+        and returns ``(charts by analysis id, errors by analysis id)``. The
+        caller commits.
+        """
+        from app.services.charts import chart_names
+
+        image_format, dpi = self.variant(purpose, image_format)
+        variant = f'{purpose}-{image_format}'
+        entries, pending, errors = {}, [], {}
+
+        for analysis in analyses:
+            wanted = chart_names(analysis.analysis_type, analysis.results or {})
+            if names is not None:
+                wanted = [name for name in wanted if name in names]
+            entries[analysis.id] = []
+            for name in wanted:
+                key = self.image_key(analysis, name, image_format, dpi)
+                entry = {'name': name, 'format': image_format, 'dpi': dpi, 'key': key}
+                entries[analysis.id].append(entry)
+                path = self.image_path(key, image_format)
+                if os.path.exists(path):
+                    os.utime(path)
+                else:
+                    source = source_snapshot(analysis.data_upload) if analysis.data_upload else None
+                    args = (source, analysis.analysis_type, analysis.results,
+                            analysis.configuration, name, image_format, dpi)
+                    pending.append((analysis, entry, path, args))
+
+        if pending:
+            if self.backend == 'eager':
+                outcomes = []
+                for item in pending:
+                    try:
+                        outcomes.append((item, _render(*item[3]), None))
+                    except Exception as e:
+                        outcomes.append((item, None, e))
+            else:
+                pool = self._get_pool()
+                futures = [(item, pool.submit(_render, *item[3])) for item in pending]
+                done, not_done = wait([future for _, future in futures], timeout=self.timeout)
+                if not_done:
+                    # A render already running ignores cancel() and would hold its worker
+                    self._restart_pool(pool)
+                outcomes = []
+                for item, future in futures:
+                    if future not in done:
+                        outcomes.append((item, None, TimeoutError('Chart rendering timed out')))
+                    elif future.exception() is not None:
+                        outcomes.append((item, None, future.exception()))
+                    else:
+                        outcomes.append((item, future.result(), None))
+
+            for (analysis, entry, path, _), image, error in outcomes:
+                if error is not None:
+                    errors.setdefault(analysis.id, []).append(f"{entry['name']}: {str(error)}")
+                    entries[analysis.id].remove(entry)
+                    continue
+                atomic_write(path, image)
+            evict_least_recently_used(self.folder, self.max_bytes)
+
+        for analysis in analyses:
+            charts = dict(analysis.charts or {})
+            recorded = {entry['name']: entry for entry in charts.get(variant, [])}
+            recorded.update({entry['name']: entry for entry in entries[analysis.id]})
+            charts[variant] = list(recorded.values())
+            analysis.charts = charts
+        return entries, errors
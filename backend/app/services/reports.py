@@ -0,0 +1,375 @@
+"""Background generation of DMAIC project reports and exports
+
+PDF reports are laid out one page at a time and streamed to disk by the PDF
+writer; Excel exports stream rows through xlsxwriter's constant-memory mode.
+Analyses are loaded in small batches, so a report with thousands of pages
+needs no more memory than one with ten.
+"""
+import os
+from datetime import datetime
+
+from flask import current_app
+from reportlab.lib.utils import simpleSplit
+
+from app import chart_renderer, db, jobs
+from app.models import Analysis, DataUpload, Report
+from app.services.executor import source_snapshot
+from app.services.pdf import PDFWriter, escape_text
+from app.services.spreadsheet import WorkbookWriter, add_analysis_sheet, dataset_chunks
+
+# Analyses loaded (and their charts rendered) per query
+ANALYSIS_BATCH = 20
+
+# Only write progress to the database when it has moved at least this much
+PROGRESS_STEP = 0.05
+
+# Hypothesis tests listed per analysis, most significant first
+MAX_TESTS_LISTED = 25
+
+CHARTER_FIELDS = [
+    ('Problem statement', 'problem_statement'),
+    ('Goals', 'project_goals'),
+    ('Scope', 'project_scope'),
+    ('Stakeholders', 'stakeholders'),
+    ('Success metrics', 'success_metrics'),
+    ('Improvement plan', 'improvement_plan'),
+    ('Control plan', 'control_plan'),
+]
+
+
+def _number(value):
+    return '-' if value is None else f'{value:.4g}'
+
+
+class PageLayout:
+    """Flow text, tables and images down pages, writing each page once it is full"""
+
+    def __init__(self, writer, margin=54, footer=None):
+        self.writer = writer
+        self.margin = margin
+        self.footer = footer
+        self.page_width, self.page_height = writer.page_size
+        self.width = self.page_width - 2 * margin
+        self._start_page()
+
+    def _start_page(self):
+        self._ops = []
+        self._images = set()
+        self.y = self.page_height - self.margin
+
+    def page_break(self):
+        if not self._ops:
+            return
+        if self.footer:
+            self._text(f'{self.footer} - page {self.writer.page_count + 1}',
+                       self.margin, self.margin / 2, 8, False)
+        self.writer.add_page('\n'.join(self._ops).encode('latin-1'), self._images)
+        self._start_page()
+
+    def _ensure(self, height):
+        if self.y - height < self.margin:
+            self.page_break()
+
+    def _text(self, text, x, y, size, bold):
+        font = 'F2' if bold else 'F1'
+        self._ops.append(f'BT /{font} {size} Tf {x:.2f} {y:.2f} Td ('
+                         + escape_text(text).decode('latin-1') + ') Tj ET')
+
+    def space(self, height):
+        self.y -= height
+
+    def paragraph(self, text, size=10, bold=False, indent=0):
+        font = 'Helvetica-Bold' if bold else 'Helvetica'
+        leading = size * 1.3
+        for block in str(text).splitlines() or ['']:
+            for line in simpleSplit(block, font, size, self.width - indent) or ['']:
+                self._ensure(leading)
+                self.y -= leading
+                self._text(line, self.margin + indent, self.y + size * 0.3, size, bold)
+
+    def heading(self, text, level=1):
+        size = {0: 20, 1: 15, 2: 12}[level]
+        # Keep a heading with at least a few lines of what follows
+        self._ensure(size * 1.3 + 60)
+        self.space(size * 0.5)
+        self.paragraph(text, size, bold=True)
+        self.space(size * 0.3)
+
+    def table(self, headers, rows, widths, size=8):
+        """Rows of cells clipped to column widths (fractions of the text width)"""
+        leading = size * 1.5
+        columns = [self.width * width for width in widths]
+
+        def row(cells, bold):
+            self._ensure(leading)
+            self.y -= leading
+            x = self.margin
+            font = 'Helvetica-Bold' if bold else 'Helvetica'
+            for cell, width in zip(cells, columns):
+                lines = simpleSplit(str(cell), font, size, width - 4)
+                self._text(lines[0] if lines else '', x, self.y + size * 0.4, size, bold)
+                x += width
+
+        if headers:
+            row(headers, True)
+        for cells in rows:
+            row(cells, False)
+        self.space(leading / 2)
+
+    def image(self, key, path):
+        name, width, height = self.writer.add_image(key, path)
+        draw_width = self.width
+        draw_height = draw_width * height / width
+        limit = self.page_height - 2 * self.margin
+        if draw_height > limit:
+            draw_width, draw_height = draw_width * limit / draw_height, limit
+        self._ensure(draw_height + 6)
+        self.y -= draw_height + 6
+        self._ops.append(f'q {draw_width:.2f} 0 0 {draw_height:.2f} {self.margin:.2f} {self.y:.2f} cm /{name} Do Q')
+        self._images.add(name)
+
+    def finish(self):
+        self.page_break()
+
+
+def _write_project(layout, project):
+    layout.heading(project.title, level=0)
+    if project.description:
+        layout.paragraph(project.description)
+    layout.space(8)
+    owner = project.owner
+    details = [
+        ('Stage', (project.current_stage or '').capitalize()),
+        ('Status', (project.status or '').replace('_', ' ').capitalize()),
+        ('Owner', f'{owner.first_name} {owner.last_name}' if owner else '-'),
+        ('Start date', project.start_date.isoformat() if project.start_date else '-'),
+        ('Target completion', project.target_completion_date.isoformat() if project.target_completion_date else '-'),
+        ('Generated', datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')),
+    ]
+    layout.table(None, details, [0.3, 0.7], size=10)
+
+    charter = [(label, getattr(project, field)) for label, field in CHARTER_FIELDS if getattr(project, field)]
+    if charter:
+        layout.heading('Project charter')
+        for label, text in charter:
+            layout.paragraph(label, bold=True)
+            layout.paragraph(text)
+            layout.space(6)
+
+
+def _write_datasets(layout, project):
+    # Only the listed columns are loaded; profiles can be large
+    uploads = project.data_uploads.with_entities(
+        DataUpload.original_filename, DataUpload.upload_stage, DataUpload.row_count,
+        DataUpload.column_count, DataUpload.status
+    ).filter(DataUpload.parent_id.is_(None)).order_by(DataUpload.id)
+    rows = [
+        (upload.original_filename, upload.upload_stage or '-', upload.row_count or '-',
+         upload.column_count or '-', upload.status)
+        for upload in uploads
+    ]
+    if rows:
+        layout.heading('Datasets')
+        layout.table(['File', 'Stage', 'Rows', 'Columns', 'Status'], rows, [0.44, 0.14, 0.14, 0.14, 0.14])
+
+
+def _write_control_chart(layout, results):
+    layout.paragraph(f"{results['chart_type']} chart of {results['column']}: "
+                     + ('in control' if results['in_control'] else 'out of control'))
+    rows = []
+    for name, chart in results['charts'].items():
+        varying = 'limits_by_size' in chart
+        rows.append((name, _number(chart.get('center')), 'varies' if varying else _number(chart['lcl']),
+                     'varies' if varying else _number(chart['ucl']), chart['points'], chart['out_of_control_points']))
+    layout.table(['Chart', 'Center', 'LCL', 'UCL', 'Points', 'Out of control'], rows,
+                 [0.2, 0.16, 0.16, 0.16, 0.14, 0.18])
+    for name, chart in results['charts'].items():
+        for violation in chart['violations'].values():
+            layout.paragraph(f"{name}: {violation['description']} ({violation['count']} points)", size=9)
+
+
+def _write_hypothesis_tests(layout, results):
+    layout.paragraph(f"{results['tests_run']} tests, {results['significant']} significant at "
+                     f"alpha = {results['alpha']:g} ({results['correction']} correction)")
+    tests = sorted(
+        (test for test in results['tests'] if test.get('p_adjusted') is not None),
+        key=lambda test: test['p_adjusted']
+    )
+    rows = [
+        (test['test'], test['factor'], test['response'], _number(test['statistic']),
+         _number(test['p_value']), _number(test['p_adjusted']), 'yes' if test['significant'] else 'no')
+        for test in tests[:MAX_TESTS_LISTED]
+    ]
+    layout.table(['Test', 'Factor', 'Response', 'Statistic', 'p', 'Adjusted p', 'Significant'], rows,
+                 [0.12, 0.2, 0.2, 0.12, 0.12, 0.12, 0.12])
+    if len(tests) > MAX_TESTS_LISTED:
+        layout.paragraph(f'{len(tests) - MAX_TESTS_LISTED} less significant tests not listed', size=9)
+
+
+def _write_analysis(layout, analysis, charts, errors):
+    layout.heading(analysis.analysis_name or f"{analysis.analysis_type.replace('_', ' ').capitalize()} #{analysis.id}",
+                   level=2)
+    stage = f' - {analysis.dmaic_stage} stage' if analysis.dmaic_stage else ''
+    layout.paragraph(f"{analysis.created_at.strftime('%Y-%m-%d')}{stage}", size=9)
+    if analysis.summary:
+        layout.paragraph(analysis.summary)
+
+    results = analysis.results or {}
+    if analysis.analysis_type == 'control_chart':
+        _write_control_chart(layout, results)
+    elif analysis.analysis_type == 'hypothesis_tests':
+        _write_hypothesis_tests(layout, results)
+
+    for entry in charts:
+        path = chart_renderer.image_path(entry['key'], entry['format'])
+        try:
+            layout.image(entry['key'], path)
+        except OSError:
+            # Evicted from the image cache since it was rendered
+            layout.paragraph(f"Chart {entry['name']} is no longer available", size=9)
+    for message in errors:
+        layout.paragraph(f'Chart could not be rendered: {message}', size=9)
+    layout.space(12)
+
+
+def _analysis_batches(completed):
+    """Keyset batches of analyses, so only a few (and their results) are in memory at once"""
+    last_id = 0
+    while True:
+        batch = completed.filter(Analysis.id > last_id).order_by(Analysis.id).limit(ANALYSIS_BATCH).all()
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def write_pdf_report(report, path, progress=None):
+    """Write a project's report to ``path``; returns the page count"""
+    project = report.project
+    writer = PDFWriter(path)
+    try:
+        layout = PageLayout(writer, footer=project.title)
+        _write_project(layout, project)
+        _write_datasets(layout, project)
+
+        completed = project.analyses.filter_by(status='completed')
+        total = completed.count()
+        if total:
+            layout.heading('Analyses')
+
+        done = 0
+        for batch in _analysis_batches(completed):
+            charts, errors = chart_renderer.render_analyses(batch, 'print', 'png')
+            for analysis in batch:
+                _write_analysis(layout, analysis, charts.get(analysis.id, []), errors.get(analysis.id, []))
+            done += len(batch)
+            if progress is not None:
+                progress(done / total)
+
+        layout.finish()
+        writer.close(title=project.title)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.page_count
+
+
+def write_excel_report(report, path, progress=None):
+    """Write a workbook of a project's datasets and analyses to ``path``
+
+    Each dataset is streamed into its own sheet(s) and each completed
+    analysis gets one sheet. Returns None (workbooks have no page count).
+    """
+    project = report.project
+    options = report.options or {}
+
+    sources = []
+    if options.get('include_data', True):
+        uploads = project.data_uploads.filter_by(status='completed').order_by(DataUpload.id)
+        if options.get('data_upload_ids'):
+            uploads = uploads.filter(DataUpload.id.in_(options['data_upload_ids']))
+        else:
+            # Each sheet of a workbook once, rather than its first sheet again as the workbook
+            uploads = uploads.filter(~DataUpload.sheets.any())
+        sources = [(upload.sheet_name or upload.original_filename, upload.row_count or 0, source_snapshot(upload))
+                   for upload in uploads]
+
+    completed = project.analyses.filter_by(status='completed')
+    total_analyses = completed.count()
+    total_rows = sum(rows for _, rows, _ in sources)
+    # Datasets dominate the work when present; analyses share what is left
+    data_share = 0.8 if total_rows and total_analyses else (1.0 if total_rows else 0.0)
+
+    writer = WorkbookWriter(path, tmpdir=os.path.dirname(path))
+    try:
+        written = 0
+        for filename, rows, source in sources:
+            def dataset_progress(done, before=written):
+                if progress is not None:
+                    progress(data_share * min((before + done) / total_rows, 1.0))
+
+            written += writer.add_dataset(os.path.splitext(filename)[0], dataset_chunks(source),
+                                          description=f'Dataset {filename}', progress=dataset_progress)
+
+        done = 0
+        for batch in _analysis_batches(completed):
+            for analysis in batch:
+                source = source_snapshot(analysis.data_upload) if analysis.data_upload else None
+                add_analysis_sheet(writer, analysis, source)
+            done += len(batch)
+            if progress is not None:
+                progress(data_share + (1 - data_share) * done / total_analyses)
+    finally:
+        # Closing assembles the file from the flushed sheets (and frees them on failure)
+        writer.close()
+    return None
+
+
+REPORT_WRITERS = {'pdf': write_pdf_report, 'xlsx': write_excel_report}
+
+
+def report_path_for(report):
+    return os.path.join(current_app.config['REPORTS_FOLDER'],
+                        f'report_{report.project_id}_{report.id}.{report.report_type}')
+
+
+@jobs.task('generate_report', model=Report)
+def generate_report(report_id):
+    """Write a report file and record it on its Report row"""
+    report = Report.query.get(report_id)
+    if report is None:
+        # Deleted before the job started
+        return
+
+    report.status = 'running'
+    report.progress = 0.0
+    report.error_message = None
+    db.session.commit()
+
+    def report_progress(fraction):
+        # Chart records made while rendering are saved along with progress
+        if fraction - report.progress >= PROGRESS_STEP:
+            report.progress = fraction
+            db.session.commit()
+
+    path = report_path_for(report)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.part'
+    try:
+        page_count = REPORT_WRITERS[report.report_type](report, partial, progress=report_progress)
+        os.replace(partial, path)
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        report.mark_failed(f'Report generation failed: {str(e)}')
+        db.session.commit()
+        return
+
+    report.file_path = path
+    report.file_size = os.path.getsize(path)
+    report.page_count = page_count
+    report.status = 'completed'
+    report.progress = 1.0
+    report.completed_at = datetime.utcnow()
+    db.session.commit()
@@ -0,0 +1,85 @@
+"""Bytes and CPU time of API responses under each encoding option
+
+Each endpoint is requested through the test client as a real user, so
+the timings cover the whole request: queries, reading data, encoding
+and compression. The baseline is the standard library encoder with row
+records and no compression, which is how responses were sent before.
+"""
+import time
+
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import create_access_token
+
+from app.models import Analysis, DataUpload, Project
+from app.services.serialization import COLUMNS, RECORDS, OrjsonProvider
+
+# (label, JSON provider, format, Accept-Encoding)
+VARIANTS = [
+    ('json', DefaultJSONProvider, RECORDS, 'identity'),
+    ('orjson', OrjsonProvider, RECORDS, 'identity'),
+    ('orjson columns', OrjsonProvider, COLUMNS, 'identity'),
+    ('orjson columns gzip', OrjsonProvider, COLUMNS, 'gzip'),
+    ('orjson columns br', OrjsonProvider, COLUMNS, 'br'),
+]
+
+
+def benchmark_endpoints(user_id):
+    """(name, url, takes a format) for the user's latest data, from lists to chart points"""
+    endpoints = [('projects', '/api/projects?per_page=100', False),
+                 ('project summary', '/api/projects/summary', False)]
+
+    upload = DataUpload.query.join(Project).filter(
+        Project.user_id == user_id, DataUpload.status == 'completed'
+    ).order_by(DataUpload.id.desc()).first()
+    if upload:
+        endpoints.append(('data preview', f'/api/data/upload/{upload.id}/data?limit=1000', True))
+        numeric = [column for column, dtype in (upload.column_types or {}).items()
+                   if dtype.startswith(('int', 'float'))]
+        if numeric:
+            endpoints.append(('data series', f'/api/data/upload/{upload.id}/series?column={numeric[0]}', True))
+
+    analysis = Analysis.query.join(Project).filter(
+        Project.user_id == user_id, Analysis.analysis_type == 'control_chart', Analysis.status == 'completed'
+    ).order_by(Analysis.id.desc()).first()
+    if analysis:
+        endpoints.append(('chart data', f'/api/analysis/result/{analysis.id}/chart-data', True))
+    return endpoints
+
+
+def _run(app, url, headers, repeat):
+    client = app.test_client()
+    response = client.get(url, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {url} returned {response.status_code}')
+    start = time.process_time()
+    for _ in range(repeat):
+        client.get(url, headers=headers)
+    return len(response.get_data()), (time.process_time() - start) / repeat
+
+
+def run_benchmark(app, user_id, repeat=20):
+    """(endpoint, variant, bytes, CPU seconds per request) for each endpoint and variant
+
+    Must run inside an app context. The app's JSON provider is restored afterwards.
+    """
+    token = create_access_token(identity=user_id)
+    provider = app.json
+    results = []
+    try:
+        for name, url, formats in benchmark_endpoints(user_id):
+            for label, provider_class, fmt, encoding in VARIANTS:
+                query = ''
+                if formats:
+                    query = ('&' if '?' in url else '?') + f'format={fmt}'
+                elif fmt == COLUMNS:
+                    # Endpoints without a columnar format are compressed as they are
+                    if encoding == 'identity':
+                        continue
+                    label = label.replace(' columns', '')
+                app.json = provider_class(app)
+                headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': encoding}
+                size, cpu = _run(app, url + query, headers, repeat)
+                results.append((name, label, size, cpu))
+    finally:
+        app.json = provider
+    return results
@@ -0,0 +1,184 @@
+"""Content-addressed cache of analysis results
+
+Entries are keyed by the dataset's content hash, the analysis type, the
+canonical JSON of its configuration and the engine version, so any two
+identical requests share one computation no matter which upload row or
+analysis they come from. Redis is used when reachable; otherwise entries go
+to an in-memory LRU backed by a size-bounded directory on disk.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import redis
+
+from app.services.storage import atomic_write, evict_least_recently_used
+
+KEY_PREFIX = 'dmaic:result:'
+
+# Redis set of cache keys per content hash, used for invalidation
+INDEX_PREFIX = 'dmaic:result-index:'
+
+# Seconds to stop trying Redis after it fails, so requests don't each wait on it
+REDIS_RETRY_AFTER = 30
+
+
+def _engine_version(analysis_type):
+    from app.services import hypothesis, spc
+    versions = {'control_chart': spc.ENGINE_VERSION, 'hypothesis_tests': hypothesis.ENGINE_VERSION}
+    return versions.get(analysis_type)
+
+
+def cache_key(content_hash, analysis_type, configuration):
+    """Cache key for an analysis of a dataset, or None if it cannot be cached"""
+    version = _engine_version(analysis_type)
+    if not content_hash or version is None:
+        return None
+    canonical = json.dumps(
+        {'type': analysis_type, 'configuration': configuration, 'engine': version},
+        sort_keys=True, separators=(',', ':'), default=str
+    )
+    return f"{content_hash}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+def _encode(fields):
+    return zlib.compress(json.dumps(fields, separators=(',', ':')).encode('utf-8'))
+
+
+def _decode(payload):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+class ResultCache:
+    """Store and look up the Analysis fields an analysis run produced
+
+    Settings:
+    - ``RESULT_CACHE_BACKEND``: ``redis`` (falls back to local), ``local`` or ``none``
+    - ``RESULT_CACHE_TTL``: seconds a Redis entry lives
+    - ``RESULT_CACHE_FOLDER`` / ``RESULT_CACHE_MAX_BYTES``: local disk store and its size bound
+    - ``RESULT_CACHE_MEMORY_ITEMS``: entries kept decoded in memory
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self._redis = None
+        self._redis_down_until = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = app.config.get('RESULT_CACHE_BACKEND', 'redis')
+        if self.backend not in ('redis', 'local', 'none'):
+            raise ValueError(f"Unknown result cache backend: {self.backend}")
+        self.ttl = app.config.get('RESULT_CACHE_TTL', 7 * 24 * 3600)
+        self.folder = app.config.get('RESULT_CACHE_FOLDER')
+        self.max_bytes = app.config.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        self.memory_items = app.config.get('RESULT_CACHE_MEMORY_ITEMS', 128)
+        if self.backend == 'redis':
+            self._redis = redis.Redis.from_url(
+                app.config['REDIS_URL'], socket_connect_timeout=0.5, socket_timeout=2
+            )
+        app.extensions['result_cache'] = self
+
+    def _use_redis(self):
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self):
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+        self.app.logger.warning('Result cache: Redis unavailable, using the local cache')
+
+    def get(self, key):
+        """Cached Analysis fields for a key, or None"""
+        if key is None or self.backend == 'none':
+            return None
+        if self._use_redis():
+            try:
+                payload = self._redis.get(KEY_PREFIX + key)
+                return _decode(payload) if payload is not None else None
+            except redis.RedisError:
+                self._redis_failed()
+        return self._local_get(key)
+
+    def set(self, key, fields):
+        if key is None or self.backend == 'none':
+            return
+        payload = _encode(fields)
+        if self._use_redis():
+            try:
+                content_hash = key.split(':', 1)[0]
+                pipeline = self._redis.pipeline()
+                pipeline.set(KEY_PREFIX + key, payload, ex=self.ttl)
+                pipeline.sadd(INDEX_PREFIX + content_hash, key)
+                pipeline.expire(INDEX_PREFIX + content_hash, self.ttl)
+                pipeline.execute()
+                return
+            except redis.RedisError:
+                self._redis_failed()
+        self._local_set(key, fields, payload)
+
+    def invalidate(self, content_hash):
+        """Drop every entry computed from a dataset's contents"""
+        if not content_hash or self.backend == 'none':
+            return
+        if self._use_redis():
+            try:
+                keys = self._redis.smembers(INDEX_PREFIX + content_hash)
+                pipeline = self._redis.pipeline()
+                for key in keys:
+                    pipeline.delete(KEY_PREFIX + key.decode('utf-8'))
+                pipeline.delete(INDEX_PREFIX + content_hash)
+                pipeline.execute()
+            except redis.RedisError:
+                self._redis_failed()
+
+        # Local entries may exist from a period when Redis was down
+        with self._lock:
+            for key in [key for key in self._memory if key.startswith(content_hash + ':')]:
+                del self._memory[key]
+        if self.folder:
+            shutil.rmtree(os.path.join(self.folder, content_hash), ignore_errors=True)
+
+    def _local_path(self, key):
+        content_hash, digest = key.split(':', 1)
+        return os.path.join(self.folder, content_hash, digest + '.json.z')
+
+    def _remember(self, key, fields):
+        with self._lock:
+            self._memory[key] = fields
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _local_get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if not self.folder:
+            return None
+        path = self._local_path(key)
+        try:
+            with open(path, 'rb') as handle:
+                fields = _decode(handle.read())
+            # Touch so eviction treats the entry as recently used
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            return None
+        self._remember(key, fields)
+        return fields
+
+    def _local_set(self, key, fields, payload):
+        self._remember(key, fields)
+        if not self.folder:
+            return
+        atomic_write(self._local_path(key), payload)
+        evict_least_recently_used(self.folder, self.max_bytes)
@@ -0,0 +1,128 @@
+"""Byte-offset row index for random-access paging of CSV uploads
+
+The index file is a flat little-endian uint64 array: entry ``i`` is the byte
+offset where data row ``i`` starts and the final entry is the file size. The
+header is everything before entry 0. Pages are read by memory-mapping both the
+index and the CSV, so any page costs O(limit) regardless of its offset.
+"""
+import io
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+NEWLINE = 10
+CARRIAGE_RETURN = 13
+QUOTE = 34
+
+
+def row_index_path_for(file_path):
+    return os.path.splitext(file_path)[0] + '.rowidx'
+
+
+class RowIndexBuilder:
+    """Build a row index from CSV bytes fed in arbitrary pieces
+
+    Newlines inside quoted fields do not end a record, and blank lines are
+    skipped the way pandas skips them, so entry numbers match DataFrame rows.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._handle = open(index_path, 'wb')
+        self._position = 0
+        self._record_start = 0
+        self._in_quotes = 0
+        self._previous_byte = None
+        self._header_seen = False
+        self.rows = 0
+
+    @classmethod
+    def resume(cls, index_path):
+        """Reopen a finished index to extend it with bytes appended to its CSV"""
+        builder = cls.__new__(cls)
+        builder.index_path = index_path
+        builder._handle = open(index_path, 'r+b')
+        offsets = np.fromfile(builder._handle, dtype='<u8')
+        size = int(offsets[-1])
+
+        # Drop the end-of-file sentinel; the next record starts where the file ended
+        builder._handle.seek((len(offsets) - 1) * 8)
+        builder._handle.truncate()
+        builder._position = size
+        builder._record_start = size
+        builder._in_quotes = 0
+        builder._previous_byte = NEWLINE
+        builder._header_seen = True
+        builder.rows = len(offsets) - 1
+        return builder
+
+    def feed(self, data):
+        if not data:
+            return
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        parity = (np.cumsum(buffer == QUOTE) + self._in_quotes) % 2
+        newlines = np.flatnonzero((buffer == NEWLINE) & (parity == 0))
+
+        if newlines.size:
+            ends = newlines.astype(np.uint64) + np.uint64(self._position)
+            starts = np.empty_like(ends)
+            starts[0] = self._record_start
+            starts[1:] = ends[:-1] + np.uint64(1)
+
+            # A record is blank if it is empty or a lone carriage return
+            lengths = ends - starts
+            before_newline = np.where(
+                newlines > 0,
+                buffer[np.maximum(newlines - 1, 0)],
+                self._previous_byte if self._previous_byte is not None else 0
+            )
+            blank = (lengths == 0) | ((lengths == 1) & (before_newline == CARRIAGE_RETURN))
+            self._write(starts[~blank])
+            self._record_start = int(ends[-1]) + 1
+
+        self._in_quotes = int(parity[-1])
+        self._previous_byte = int(buffer[-1])
+        self._position += buffer.size
+
+    def _write(self, starts):
+        if not self._header_seen and starts.size:
+            self._header_seen = True
+            starts = starts[1:]
+        starts.astype('<u8').tofile(self._handle)
+        self.rows += starts.size
+
+    def finish(self):
+        """Record a trailing unterminated row and the end-of-file sentinel"""
+        trailing = self._position - self._record_start
+        if trailing > 1 or (trailing == 1 and self._previous_byte != CARRIAGE_RETURN):
+            self._write(np.array([self._record_start], dtype=np.uint64))
+        np.array([self._position], dtype='<u8').tofile(self._handle)
+        self._handle.close()
+        return self.rows
+
+    def abort(self):
+        self._handle.close()
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+
+def read_page(file_path, index_path, offset, limit):
+    """Parse rows [offset, offset + limit) of a CSV using its row index"""
+    offsets = np.memmap(index_path, dtype='<u8', mode='r')
+    rows = len(offsets) - 1
+    start = min(offset, rows)
+    stop = min(offset + limit, rows)
+
+    with open(file_path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return pd.DataFrame()
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            header = view[:int(offsets[0])]
+            body = view[int(offsets[start]):int(offsets[stop])]
+
+    # Ensure the header line is terminated before appending the page
+    if header and not header.endswith(b'\n'):
+        header += b'\n'
+    return pd.read_csv(io.BytesIO(header + body))
@@ -0,0 +1,159 @@
+"""Bounded-memory streaming sketches used by the dataset profiler"""
+import numpy as np
+import pandas as pd
+
+
+class KLLSketch:
+    """KLL quantile sketch over a stream of floats
+
+    Holds at most about 3k values however long the stream is. Until the first
+    compaction every value is kept, so quantiles of small columns are exact and
+    match pandas' linear interpolation.
+    """
+
+    def __init__(self, k=4096, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.compacted = False
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        """Number of values a level may hold before it is compacted"""
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values):
+        """Add a batch of values, ignoring NaNs"""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.compacted = self.compacted or other.compacted
+        self._compress()
+
+    def _compress(self):
+        while True:
+            for level, items in enumerate(self.levels):
+                if items.size > self._capacity(level):
+                    break
+            else:
+                return
+            self._compact(level)
+
+    def _compact(self, level):
+        """Promote every other sorted value of a level to the next one"""
+        items = np.sort(self.levels[level])
+        odd = items.size % 2
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+        offset = int(self._rng.integers(2))
+        promoted = items[odd:][offset::2]
+        self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+        self.levels[level] = items[:odd]
+        self.compacted = True
+
+    def quantile(self, q):
+        """Return the approximate q-quantile, or None for an empty sketch"""
+        if not self.compacted:
+            if self.levels[0].size == 0:
+                return None
+            return float(np.quantile(self.levels[0], q))
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(items.size, 2 ** level, dtype='float64')
+            for level, items in enumerate(self.levels)
+        ])
+        order = np.argsort(values, kind='mergesort')
+        cumulative = np.cumsum(weights[order])
+        index = int(np.searchsorted(cumulative, q * cumulative[-1]))
+        return float(values[order][min(index, values.size - 1)])
+
+
+class TopK:
+    """Mergeable Misra-Gries heavy hitters
+
+    Counts are exact until more than ``capacity`` distinct values have been
+    seen; after that the least frequent values are evicted and the remaining
+    counts become lower bounds.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.exact = True
+
+    def update(self, counts):
+        """Add a batch of value counts (a ``value_counts()`` result)"""
+        if counts.empty:
+            return
+        if self.counts.empty:
+            merged = counts.astype('int64')
+        else:
+            merged = self.counts.add(counts, fill_value=0).astype('int64')
+        if len(merged) > self.capacity:
+            threshold = merged.nlargest(self.capacity + 1).iloc[-1]
+            merged = merged - threshold
+            merged = merged[merged > 0]
+            self.exact = False
+        self.counts = merged
+
+    def most_common(self, n):
+        """Return the n most frequent values, ties broken by value"""
+        counts = self.counts
+        try:
+            counts = counts.sort_index(kind='mergesort')
+        except TypeError:
+            # Mixed value types cannot be ordered; keep insertion order
+            pass
+        return counts.sort_values(ascending=False, kind='mergesort').head(n)
+
+
+def _leading_zeros(values):
+    """Count leading zero bits of non-zero uint64 values"""
+    zeros = np.zeros(values.shape, dtype='uint8')
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = values < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[mask] += shift
+        values = np.where(mask, values << np.uint64(shift), values)
+    return zeros
+
+
+class HyperLogLog:
+    """HyperLogLog distinct-value estimator (2**p one-byte registers)"""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype='uint8')
+
+    def update(self, values):
+        """Add a batch of values; duplicates within or across batches are fine"""
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+        index = (hashes >> np.uint64(64 - self.p)).astype('int64')
+        remainder = (hashes << np.uint64(self.p)) | (np.uint64(1) << np.uint64(self.p - 1))
+        ranks = _leading_zeros(remainder) + 1
+        maxima = pd.Series(ranks).groupby(index).max()
+        current = self.registers[maxima.index.to_numpy()]
+        self.registers[maxima.index.to_numpy()] = np.maximum(current, maxima.to_numpy())
+
+    def count(self):
+        """Return the estimated number of distinct values"""
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype('int64')))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
@@ -0,0 +1,694 @@
+"""Vectorized statistical process control (control chart) engine"""
+import copy
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+
+from app.services.columnar import load_columns
+
+CHART_TYPES = ['xbar_r', 'xbar_s', 'imr', 'p', 'np', 'c', 'u']
+
+# Bump when results change for the same input, so cached results are not reused
+ENGINE_VERSION = '2'
+
+# Nelson rules (1-4 and 5-8 generalise the Western Electric rules)
+RULES = {
+    1: 'One point beyond 3 sigma',
+    2: 'Nine points in a row on the same side of the center line',
+    3: 'Six points in a row steadily increasing or decreasing',
+    4: 'Fourteen points in a row alternating up and down',
+    5: 'Two of three points beyond 2 sigma on the same side',
+    6: 'Four of five points beyond 1 sigma on the same side',
+    7: 'Fifteen points in a row within 1 sigma',
+    8: 'Eight points in a row beyond 1 sigma on either side'
+}
+
+# Violations stored per rule (the most recent are kept); the count is always exact
+MAX_STORED_VIOLATIONS = 1000
+
+# Points of history kept so rules can span previously charted and appended data
+RULE_CONTEXT = 14
+
+# Bias-correction constants for subgroup ranges, indexed by subgroup size (2-25)
+_D2 = np.array([np.nan, np.nan, 1.128, 1.693, 2.059, 2.326, 2.534, 2.704, 2.847, 2.970,
+                3.078, 3.173, 3.258, 3.336, 3.407, 3.472, 3.532, 3.588, 3.640, 3.689,
+                3.735, 3.778, 3.819, 3.858, 3.895, 3.931])
+_D3 = np.array([np.nan, np.nan, 0.853, 0.888, 0.880, 0.864, 0.848, 0.833, 0.820, 0.808,
+                0.797, 0.787, 0.778, 0.770, 0.763, 0.756, 0.750, 0.744, 0.739, 0.734,
+                0.729, 0.724, 0.720, 0.716, 0.712, 0.708])
+MAX_RANGE_SUBGROUP = len(_D2) - 1
+
+
+def c4(n):
+    """Bias-correction constant for subgroup standard deviations"""
+    n = np.asarray(n, dtype='float64')
+    return np.sqrt(2 / (n - 1)) * np.exp(gammaln(n / 2) - gammaln((n - 1) / 2))
+
+
+def d2(n):
+    return _D2[np.asarray(n, dtype='int64')]
+
+
+def d3(n):
+    return _D3[np.asarray(n, dtype='int64')]
+
+
+def constants(n):
+    """Classic control chart factors (A2, A3, B3, B4, D3, D4, d2, c4) for size n"""
+    n = int(n)
+    c = float(c4(n))
+    spread = 3 * np.sqrt(1 - c * c) / c
+    table = {'c4': c, 'A3': 3 / (c * np.sqrt(n)), 'B3': max(0.0, 1 - spread), 'B4': 1 + spread}
+    if 2 <= n <= MAX_RANGE_SUBGROUP:
+        table.update({
+            'd2': float(d2(n)),
+            'A2': 3 / (float(d2(n)) * np.sqrt(n)),
+            'D3': max(0.0, 1 - 3 * float(d3(n)) / float(d2(n))),
+            'D4': 1 + 3 * float(d3(n)) / float(d2(n))
+        })
+    return table
+
+
+def _window_count(condition, window):
+    """Number of True values in the trailing window ending at each point"""
+    counts = np.cumsum(condition, dtype='int64')
+    counts[window:] = counts[window:] - counts[:-window]
+    counts[:window - 1] = 0  # Not enough history for a full window
+    return counts
+
+
+def detect_rules(values, center, sigma, rules=None):
+    """Flag Nelson rule violations; returns {rule: boolean array over points}
+
+    ``center`` and ``sigma`` may be scalars or per-point arrays (for charts with
+    variable subgroup sizes).
+    """
+    rules = rules or list(RULES)
+    values = np.asarray(values, dtype='float64')
+    count = values.size
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (values - center) / sigma
+    z = np.nan_to_num(z, nan=0.0)
+    above, below = z > 0, z < 0
+    flags = {}
+
+    for rule in rules:
+        flagged = np.zeros(count, dtype=bool)
+        if count == 0:
+            pass
+        elif rule == 1:
+            flagged = np.abs(z) > 3
+        elif rule == 2 and count >= 9:
+            flagged = (_window_count(above, 9) == 9) | (_window_count(below, 9) == 9)
+        elif rule == 3 and count >= 6:
+            steps = np.diff(values)
+            rising = _window_count(steps > 0, 5) == 5
+            falling = _window_count(steps < 0, 5) == 5
+            flagged[1:] = rising | falling
+        elif rule == 4 and count >= 14:
+            steps = np.diff(values)
+            alternating = (steps[1:] * steps[:-1]) < 0
+            flagged[2:] = _window_count(alternating, 12) == 12
+        elif rule == 5 and count >= 3:
+            flagged = (_window_count(z > 2, 3) >= 2) | (_window_count(z < -2, 3) >= 2)
+        elif rule == 6 and count >= 5:
+            flagged = (_window_count(z > 1, 5) >= 4) | (_window_count(z < -1, 5) >= 4)
+        elif rule == 7 and count >= 15:
+            flagged = _window_count(np.abs(z) < 1, 15) == 15
+        elif rule == 8 and count >= 8:
+            flagged = _window_count(np.abs(z) > 1, 8) == 8
+        flags[rule] = flagged
+    return flags
+
+
+def _summarize_flags(flags, offset=0):
+    """Violation entries per rule and the number of points breaking any rule"""
+    violations = {}
+    out_of_control = None
+    for rule, flagged in flags.items():
+        points = np.flatnonzero(flagged) + offset
+        out_of_control = flagged if out_of_control is None else out_of_control | flagged
+        violations[str(rule)] = {
+            'description': RULES[rule],
+            'count': int(points.size),
+            'points': points[-MAX_STORED_VIOLATIONS:].tolist()
+        }
+    return violations, int(np.count_nonzero(out_of_control)) if out_of_control is not None else 0
+
+
+def _size_key(size):
+    """Key of a subgroup size in ``limits_by_size``: the integer when whole, else the exact float"""
+    size = float(size)
+    return str(int(size)) if size.is_integer() else repr(size)
+
+
+def _limits(center, ucl, lcl, sizes=None):
+    """Serialise limits; variable-size charts store one set per distinct size"""
+    if sizes is None or np.unique(sizes).size < 2:
+        return {'center': float(np.mean(center)), 'ucl': float(np.mean(ucl)), 'lcl': float(np.mean(lcl))}
+
+    frame = pd.DataFrame({'n': sizes, 'center': center, 'ucl': ucl, 'lcl': lcl}).drop_duplicates('n')
+    return {
+        'center': float(frame['center'].iloc[0]) if frame['center'].nunique() == 1 else None,
+        'limits_by_size': {
+            _size_key(row.n): {'center': float(row.center), 'ucl': float(row.ucl), 'lcl': float(row.lcl)}
+            for row in frame.itertuples(index=False)
+        }
+    }
+
+
+def _chart(values, center, ucl, lcl, sigma, rules, sizes=None):
+    """Limits, rule violations and point count of one chart
+
+    ``sigma`` is the per-point standard error the rules measure zones in.
+    """
+    violations, out_of_control = _summarize_flags(detect_rules(values, center, sigma, rules))
+    result = _limits(center, ucl, lcl, sizes)
+    result.update({
+        'points': int(np.size(values)),
+        'violations': violations,
+        'out_of_control_points': out_of_control
+    })
+    return result
+
+
+def _extend_chart(chart, window, center, ucl, lcl, sigma, rules, context, offset, limits):
+    """Fold points appended after ``context`` points of history into a chart
+
+    Rules are evaluated over the history plus the new points, but only the
+    new points are flagged; earlier verdicts are kept as they were.
+    """
+    flags = detect_rules(window, center, sigma, rules)
+    new_flags = {rule: flagged[context:] for rule, flagged in flags.items()}
+    violations, out_of_control = _summarize_flags(new_flags, offset)
+
+    for rule, entry in violations.items():
+        existing = chart['violations'].setdefault(rule, {'description': entry['description'], 'count': 0, 'points': []})
+        existing['count'] += entry['count']
+        existing['points'] = (existing['points'] + entry['points'])[-MAX_STORED_VIOLATIONS:]
+    chart['out_of_control_points'] += out_of_control
+    chart['points'] += len(window) - context
+
+    for key in ('center', 'ucl', 'lcl', 'limits_by_size'):
+        chart.pop(key, None)
+    chart.update(limits)
+
+
+def _dispersion_rules(rules):
+    """Range/std charts are autocorrelated, so only the 3-sigma rule applies"""
+    return [1] if 1 in rules else []
+
+
+def _tail(values):
+    return [float(value) for value in np.asarray(values)[-RULE_CONTEXT:]]
+
+
+# Subgroup (X-bar/R, X-bar/S) charts
+
+def _dispersion_name(chart_type):
+    return 'range' if chart_type == 'xbar_r' else 'std'
+
+
+def _subgroup_table(df, column, subgroup_size=None, subgroup_column=None):
+    """Per-subgroup sufficient statistics (n, mean, M2, min, max)
+
+    Fixed-size subgroups are formed by reshaping consecutive values and the
+    trailing partial subgroup is returned as ``pending``; otherwise rows are
+    grouped by ``subgroup_column`` in order of first appearance.
+    """
+    values = pd.to_numeric(df[column], errors='coerce')
+    if subgroup_column:
+        frame = pd.DataFrame({'label': df[subgroup_column].astype(str), 'value': values}).dropna()
+        stats = frame.groupby('label', sort=False)['value'].agg(['count', 'mean', 'min', 'max'])
+        squares = (frame['value'] - frame['label'].map(stats['mean'])) ** 2
+        m2 = squares.groupby(frame['label'], sort=False).sum().reindex(stats.index)
+        return {
+            'labels': stats.index.tolist(),
+            'n': stats['count'].to_numpy(dtype='float64'),
+            'mean': stats['mean'].to_numpy(dtype='float64'),
+            'm2': m2.to_numpy(dtype='float64'),
+            'min': stats['min'].to_numpy(dtype='float64'),
+            'max': stats['max'].to_numpy(dtype='float64'),
+            'pending': []
+        }
+
+    values = values.to_numpy(dtype='float64')
+    return _fixed_subgroups(values[~np.isnan(values)], int(subgroup_size))
+
+
+def _fixed_subgroups(values, size):
+    if size < 2:
+        raise ValueError('subgroup_size must be at least 2')
+    count = values.size // size
+    matrix = values[:count * size].reshape(count, size)
+    means = matrix.mean(axis=1)
+    return {
+        'labels': None,
+        'n': np.full(count, size, dtype='float64'),
+        'mean': means,
+        'm2': np.square(matrix - means[:, None]).sum(axis=1),
+        'min': matrix.min(axis=1) if count else np.zeros(0),
+        'max': matrix.max(axis=1) if count else np.zeros(0),
+        'pending': values[count * size:].tolist()
+    }
+
+
+def _dispersion(table, chart_type):
+    if chart_type == 'xbar_r':
+        return table['max'] - table['min']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(table['m2'] / (table['n'] - 1))
+
+
+def _sigma_terms(table, chart_type):
+    """Per-subgroup unbiased sigma estimates (R/d2 or S/c4)"""
+    n = table['n']
+    if chart_type == 'xbar_r':
+        return _dispersion(table, chart_type) / d2(n)
+    return _dispersion(table, chart_type) / c4(n)
+
+
+def _subgroup_limits(chart_type, n, grand_mean, sigma):
+    """(center, ucl, lcl, point sigma) of both charts for subgroup sizes n"""
+    n = np.asarray(n, dtype='float64')
+    error = sigma / np.sqrt(n)
+    limits = {'xbar': (np.full(n.shape, grand_mean), grand_mean + 3 * error, grand_mean - 3 * error, error)}
+    if chart_type == 'xbar_r':
+        center, deviation = d2(n) * sigma, d3(n) * sigma
+    else:
+        factor = c4(n)
+        center, deviation = factor * sigma, sigma * np.sqrt(1 - factor * factor)
+    limits[_dispersion_name(chart_type)] = (center, center + 3 * deviation, np.maximum(0, center - 3 * deviation),
+                                            deviation)
+    return limits
+
+
+def _check_subgroup_sizes(chart_type, n):
+    if n.size == 0:
+        raise ValueError('Not enough data to form a subgroup')
+    if chart_type == 'xbar_r' and n.max() > MAX_RANGE_SUBGROUP:
+        raise ValueError(f'X-bar/R charts need subgroup sizes between 2 and {MAX_RANGE_SUBGROUP}')
+
+
+def _subgroup_charts(table, chart_type, rules):
+    """Charts computed from a full subgroup table"""
+    # Single-value subgroups carry no within-subgroup variation
+    keep = table['n'] >= 2
+    charted = {key: table[key][keep] for key in ('n', 'mean', 'm2', 'min', 'max')}
+    n = charted['n']
+    _check_subgroup_sizes(chart_type, n)
+
+    sigma = float(np.mean(_sigma_terms(charted, chart_type)))
+    grand_mean = float(np.average(charted['mean'], weights=n))
+    limits = _subgroup_limits(chart_type, n, grand_mean, sigma)
+    dispersion = _dispersion_name(chart_type)
+    charts = {
+        'xbar': _chart(charted['mean'], *limits['xbar'], rules, n),
+        dispersion: _chart(_dispersion(charted, chart_type), *limits[dispersion], _dispersion_rules(rules), n)
+    }
+    summary = {
+        'subgroups': int(n.size),
+        'points': int(n.sum()),
+        'dropped_points': int(table['n'][~keep].sum()) + len(table['pending']),
+        'sigma': sigma
+    }
+    if np.unique(n).size == 1:
+        summary['constants'] = constants(n[0])
+    return summary, charts
+
+
+def _subgroup_state(table, chart_type):
+    if table['labels'] is not None:
+        return {
+            'mode': 'grouped',
+            'labels': table['labels'],
+            **{key: table[key].tolist() for key in ('n', 'mean', 'm2', 'min', 'max')}
+        }
+    return {
+        'mode': 'fixed',
+        'subgroups': int(table['n'].size),
+        'weight': float(table['n'].sum()),
+        'sum_mean': float(np.dot(table['n'], table['mean'])),
+        'sum_sigma': float(np.sum(_sigma_terms(table, chart_type))),
+        'pending': table['pending'],
+        'tail': {
+            'xbar': _tail(table['mean']),
+            _dispersion_name(chart_type): _tail(_dispersion(table, chart_type))
+        }
+    }
+
+
+def _merge_grouped(state, new):
+    """Merge new per-label statistics into a grouped state (Chan et al.)"""
+    index = {label: position for position, label in enumerate(state['labels'])}
+    table = {key: list(state[key]) for key in ('labels', 'n', 'mean', 'm2', 'min', 'max')}
+    for label, n, mean, m2, low, high in zip(new['labels'], new['n'], new['mean'], new['m2'], new['min'], new['max']):
+        position = index.get(label)
+        if position is None:
+            index[label] = len(table['labels'])
+            for key, value in zip(('labels', 'n', 'mean', 'm2', 'min', 'max'), (label, n, mean, m2, low, high)):
+                table[key].append(float(value) if key != 'labels' else value)
+            continue
+        old_n, old_mean = table['n'][position], table['mean'][position]
+        total = old_n + n
+        delta = mean - old_mean
+        table['mean'][position] = old_mean + delta * n / total
+        table['m2'][position] += m2 + delta * delta * old_n * n / total
+        table['n'][position] = total
+        table['min'][position] = min(table['min'][position], low)
+        table['max'][position] = max(table['max'][position], high)
+    return {key: (np.asarray(value, dtype='float64') if key != 'labels' else value) for key, value in table.items()}
+
+
+def _update_fixed(results, state, df, configuration, rules):
+    chart_type = results['chart_type']
+    values = pd.to_numeric(df[configuration['column']], errors='coerce').to_numpy(dtype='float64')
+    values = np.concatenate([np.asarray(state['pending'], dtype='float64'), values[~np.isnan(values)]])
+    table = _fixed_subgroups(values, int(configuration['subgroup_size']))
+    added = int(table['n'].size)
+    state['pending'] = table['pending']
+    if added == 0:
+        results['dropped_points'] = len(state['pending'])
+        return
+
+    old_count = state['subgroups']
+    state['subgroups'] += added
+    state['weight'] += float(table['n'].sum())
+    state['sum_mean'] += float(np.dot(table['n'], table['mean']))
+    state['sum_sigma'] += float(np.sum(_sigma_terms(table, chart_type)))
+    sigma = state['sum_sigma'] / state['subgroups']
+    grand_mean = state['sum_mean'] / state['weight']
+
+    dispersion = _dispersion_name(chart_type)
+    new_points = {'xbar': table['mean'], dispersion: _dispersion(table, chart_type)}
+    chart_rules = {'xbar': rules, dispersion: _dispersion_rules(rules)}
+    for name, points in new_points.items():
+        tail = state['tail'][name]
+        window = np.concatenate([np.asarray(tail, dtype='float64'), points])
+        center, ucl, lcl, error = _subgroup_limits(chart_type, np.full(window.size, table['n'][0]), grand_mean, sigma)[name]
+        _extend_chart(results['charts'][name], window, center, ucl, lcl, error, chart_rules[name],
+                      len(tail), old_count, _limits(center, ucl, lcl))
+        state['tail'][name] = _tail(window)
+
+    results.update({
+        'subgroups': state['subgroups'],
+        'points': int(state['weight']),
+        'dropped_points': len(state['pending']),
+        'sigma': sigma
+    })
+
+
+# Individuals and moving range (I-MR) charts
+
+def _imr_limits(center, sigma):
+    moving_center = float(d2(2)) * sigma
+    moving_deviation = float(d3(2)) * sigma
+    return {
+        'individuals': (center, center + 3 * sigma, center - 3 * sigma, sigma),
+        'moving_range': (moving_center, moving_center + 3 * moving_deviation, 0.0, moving_deviation)
+    }
+
+
+def _imr(values, rules):
+    if values.size < 2:
+        raise ValueError('I-MR charts need at least 2 values')
+    moving_range = np.abs(np.diff(values))
+    sigma = float(moving_range.mean()) / float(d2(2))
+    center = float(values.mean())
+    limits = _imr_limits(center, sigma)
+    charts = {
+        'individuals': _chart(values, *limits['individuals'], rules),
+        'moving_range': _chart(moving_range, *limits['moving_range'], _dispersion_rules(rules))
+    }
+    state = {
+        'mode': 'individuals',
+        'count': int(values.size),
+        'sum': float(values.sum()),
+        'moving_sum': float(moving_range.sum()),
+        'tail': {'individuals': _tail(values), 'moving_range': _tail(moving_range)}
+    }
+    return {'points': int(values.size), 'sigma': sigma}, charts, state
+
+
+def _update_imr(results, state, df, configuration, rules):
+    values = pd.to_numeric(df[configuration['column']], errors='coerce').to_numpy(dtype='float64')
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return
+    previous = state['tail']['individuals'][-1]
+    moving_range = np.abs(np.diff(np.concatenate([[previous], values])))
+    old_count = state['count']
+
+    state['count'] += int(values.size)
+    state['sum'] += float(values.sum())
+    state['moving_sum'] += float(moving_range.sum())
+    sigma = state['moving_sum'] / (state['count'] - 1) / float(d2(2))
+    limits = _imr_limits(state['sum'] / state['count'], sigma)
+
+    new_points = {'individuals': (values, old_count, rules),
+                  'moving_range': (moving_range, old_count - 1, _dispersion_rules(rules))}
+    for name, (points, offset, chart_rules) in new_points.items():
+        tail = state['tail'][name]
+        window = np.concatenate([np.asarray(tail, dtype='float64'), points])
+        center, ucl, lcl, error = limits[name]
+        _extend_chart(results['charts'][name], window, center, ucl, lcl, error, chart_rules,
+                      len(tail), offset, _limits(center, ucl, lcl))
+        state['tail'][name] = _tail(window)
+
+    results.update({'points': state['count'], 'sigma': sigma})
+
+
+# Attribute (p, np, c, u) charts
+
+def _attribute_inputs(df, configuration):
+    """Counts and sample sizes for p, np, c and u charts"""
+    column = configuration['column']
+    counts = pd.to_numeric(df[column], errors='coerce')
+    if configuration.get('sample_size_column'):
+        sizes = pd.to_numeric(df[configuration['sample_size_column']], errors='coerce')
+    else:
+        sizes = pd.Series(float(configuration.get('sample_size') or 1), index=df.index)
+    valid = counts.notna() & sizes.notna() & (sizes > 0)
+    return counts[valid].to_numpy(dtype='float64'), sizes[valid].to_numpy(dtype='float64')
+
+
+def _attribute_limits(chart_type, sizes, total_counts, total_sizes, samples):
+    """(center, ucl, lcl, point sigma) for samples of the given sizes"""
+    sizes = np.asarray(sizes, dtype='float64')
+    if chart_type == 'c':
+        c_bar = total_counts / samples
+        sigma = np.full(sizes.shape, np.sqrt(c_bar))
+        return np.full(sizes.shape, c_bar), c_bar + 3 * sigma, np.maximum(0, c_bar - 3 * sigma), sigma
+
+    rate = total_counts / total_sizes
+    if chart_type == 'np':
+        center = sizes * rate
+        sigma = np.sqrt(sizes * rate * (1 - rate))
+        return center, np.minimum(sizes, center + 3 * sigma), np.maximum(0, center - 3 * sigma), sigma
+    if chart_type == 'p':
+        sigma = np.sqrt(rate * (1 - rate) / sizes)
+        return np.full(sizes.shape, rate), np.minimum(1, rate + 3 * sigma), np.maximum(0, rate - 3 * sigma), sigma
+    sigma = np.sqrt(rate / sizes)
+    return np.full(sizes.shape, rate), rate + 3 * sigma, np.maximum(0, rate - 3 * sigma), sigma
+
+
+def _attribute_points(chart_type, counts, sizes):
+    return counts if chart_type in ('c', 'np') else counts / sizes
+
+
+def _attribute_chart(chart_type, counts, sizes, rules):
+    if counts.size == 0:
+        raise ValueError('No valid samples for the attribute chart')
+    if chart_type == 'np' and np.unique(sizes).size > 1:
+        raise ValueError('np charts need a constant sample size; use a p chart instead')
+
+    limits = _attribute_limits(chart_type, sizes, counts.sum(), sizes.sum(), counts.size)
+    charts = {chart_type: _chart(_attribute_points(chart_type, counts, sizes), *limits, rules, sizes)}
+    state = {
+        'mode': 'attribute',
+        'samples': int(counts.size),
+        'sum_counts': float(counts.sum()),
+        'sum_sizes': float(sizes.sum()),
+        'sizes': np.unique(sizes).tolist(),
+        'tail': {'counts': _tail(counts), 'sizes': _tail(sizes)}
+    }
+    return {'samples': int(counts.size)}, charts, state
+
+
+def _update_attribute(results, state, df, configuration, rules):
+    chart_type = results['chart_type']
+    counts, sizes = _attribute_inputs(df, configuration)
+    if counts.size == 0:
+        return
+    all_sizes = np.union1d(state['sizes'], sizes)
+    if chart_type == 'np' and all_sizes.size > 1:
+        raise ValueError('np charts need a constant sample size; use a p chart instead')
+
+    old_samples = state['samples']
+    state['samples'] += int(counts.size)
+    state['sum_counts'] += float(counts.sum())
+    state['sum_sizes'] += float(sizes.sum())
+    state['sizes'] = all_sizes.tolist()
+    totals = (state['sum_counts'], state['sum_sizes'], state['samples'])
+
+    window_counts = np.concatenate([np.asarray(state['tail']['counts'], dtype='float64'), counts])
+    window_sizes = np.concatenate([np.asarray(state['tail']['sizes'], dtype='float64'), sizes])
+    center, ucl, lcl, error = _attribute_limits(chart_type, window_sizes, *totals)
+    stored_limits = _limits(*_attribute_limits(chart_type, all_sizes, *totals)[:3], all_sizes)
+    _extend_chart(results['charts'][chart_type], _attribute_points(chart_type, window_counts, window_sizes),
+                  center, ucl, lcl, error, rules, len(state['tail']['counts']), old_samples, stored_limits)
+
+    state['tail'] = {'counts': _tail(window_counts), 'sizes': _tail(window_sizes)}
+    results['samples'] = state['samples']
+
+
+def required_columns(configuration):
+    """Dataset columns a control chart configuration reads"""
+    keys = ['column', 'subgroup_column', 'sample_size_column']
+    return [configuration[key] for key in keys if configuration.get(key)]
+
+
+def _validated_rules(configuration):
+    rules = [int(rule) for rule in configuration.get('rules') or RULES]
+    unknown = set(rules) - set(RULES)
+    if unknown:
+        raise ValueError(f"Unknown rules: {sorted(unknown)}")
+    return rules
+
+
+def control_chart(df, configuration):
+    """Compute control limits and rule violations for one chart configuration
+
+    Returns ``(results, state)``; ``state`` holds the running sufficient
+    statistics that ``update_control_chart`` needs to absorb appended data.
+    """
+    chart_type = configuration.get('chart_type')
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f"Unsupported chart type: {chart_type}")
+    column = configuration.get('column')
+    if not column or column not in df.columns:
+        raise ValueError(f"Unknown column: {column}")
+    rules = _validated_rules(configuration)
+
+    results = {'chart_type': chart_type, 'column': column, 'rules': rules}
+
+    if chart_type == 'imr':
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64')
+        summary, charts, state = _imr(values[~np.isnan(values)], rules)
+    elif chart_type in ('xbar_r', 'xbar_s'):
+        if not configuration.get('subgroup_column') and not configuration.get('subgroup_size'):
+            raise ValueError('subgroup_size or subgroup_column is required')
+        table = _subgroup_table(df, column, configuration.get('subgroup_size'),
+                                configuration.get('subgroup_column'))
+        summary, charts = _subgroup_charts(table, chart_type, rules)
+        state = _subgroup_state(table, chart_type)
+    else:
+        counts, sizes = _attribute_inputs(df, configuration)
+        summary, charts, state = _attribute_chart(chart_type, counts, sizes, rules)
+
+    results.update(summary)
+    results['charts'] = charts
+    results['in_control'] = all(chart['out_of_control_points'] == 0 for chart in charts.values())
+    return results, state
+
+
+def update_control_chart(results, state, df, configuration):
+    """Absorb appended rows into a chart in O(new rows)
+
+    Limits are re-derived from the running totals in ``state`` and rules are
+    checked on the new points with enough history for runs that span the
+    boundary. Charts subgrouped by a column are rebuilt from their per-label
+    statistics, which costs O(labels) rather than O(rows).
+    """
+    results = copy.deepcopy(results)
+    state = copy.deepcopy(state)
+    rules = _validated_rules(configuration)
+
+    if state['mode'] == 'grouped':
+        chart_type = results['chart_type']
+        new = _subgroup_table(df, configuration['column'], subgroup_column=configuration['subgroup_column'])
+        table = _merge_grouped(state, new)
+        table['pending'] = []
+        summary, charts = _subgroup_charts(table, chart_type, rules)
+        results.update(summary)
+        results['charts'] = charts
+        state = _subgroup_state(table, chart_type)
+    elif state['mode'] == 'fixed':
+        _update_fixed(results, state, df, configuration, rules)
+    elif state['mode'] == 'individuals':
+        _update_imr(results, state, df, configuration, rules)
+    else:
+        _update_attribute(results, state, df, configuration, rules)
+
+    results['in_control'] = all(chart['out_of_control_points'] == 0 for chart in results['charts'].values())
+    return results, state
+
+
+def run_control_chart(source, configuration):
+    """Load the needed columns of a DataUpload-like object and chart them"""
+    df = load_columns(source, required_columns(configuration))
+    return control_chart(df, configuration)
+
+
+def _point_limits(chart, sizes, count):
+    """Per-point (center, ucl, lcl) arrays from a chart's stored limits"""
+    if 'limits_by_size' not in chart:
+        return tuple(np.full(count, chart[key], dtype='float64') for key in ('center', 'ucl', 'lcl'))
+    by_size = chart['limits_by_size']
+    # Charts stored before keys were exact used six significant digits
+    limits = [by_size.get(_size_key(size)) or by_size[f'{size:g}'] for size in sizes]
+    return tuple(
+        np.array([entry[field] for entry in limits], dtype='float64')
+        for field in ('center', 'ucl', 'lcl')
+    )
+
+
+def chart_series(df, results, configuration):
+    """Plotted points of every chart of a computed control chart
+
+    Returns ``{chart: {'values', 'center', 'ucl', 'lcl', 'out_of_control', 'labels'}}``
+    with one array entry per point. Points are out of control if a rule was
+    recorded against them or they fall outside the current limits.
+    """
+    chart_type = results['chart_type']
+    column = configuration['column']
+    labels = None
+
+    if chart_type == 'imr':
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64')
+        values = values[~np.isnan(values)]
+        plotted = {'individuals': (values, None), 'moving_range': (np.abs(np.diff(values)), None)}
+    elif chart_type in ('xbar_r', 'xbar_s'):
+        table = _subgroup_table(df, column, configuration.get('subgroup_size'), configuration.get('subgroup_column'))
+        keep = table['n'] >= 2
+        if table['labels'] is not None:
+            labels = [label for label, kept in zip(table['labels'], keep) if kept]
+        charted = {key: table[key][keep] for key in ('n', 'mean', 'm2', 'min', 'max')}
+        plotted = {
+            'xbar': (charted['mean'], charted['n']),
+            _dispersion_name(chart_type): (_dispersion(charted, chart_type), charted['n'])
+        }
+    else:
+        counts, sizes = _attribute_inputs(df, configuration)
+        plotted = {chart_type: (_attribute_points(chart_type, counts, sizes), sizes)}
+
+    series = {}
+    for name, (values, sizes) in plotted.items():
+        chart = results['charts'][name]
+        center, ucl, lcl = _point_limits(chart, sizes, values.size)
+        out_of_control = (values > ucl) | (values < lcl)
+        for entry in chart['violations'].values():
+            points = np.asarray(entry['points'], dtype='int64')
+            out_of_control[points[points < values.size]] = True
+        series[name] = {
+            'values': values,
+            'center': center,
+            'ucl': ucl,
+            'lcl': lcl,
+            'out_of_control': out_of_control,
+            'labels': labels,
+            # Moving ranges start at the second individual value
+            'offset': 1 if name == 'moving_range' else 0
+        }
+    return series
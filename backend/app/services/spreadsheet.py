@@ -0,0 +1,253 @@
+"""Constant-memory Excel workbooks of datasets and analysis results
+
+xlsxwriter's ``constant_memory`` mode flushes each row to a temporary file
+as soon as the next one starts, so sheets are written strictly in row order
+and memory use does not depend on how many rows are exported.
+"""
+import json
+import re
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from app.services.column_types import apply_column_types
+from app.services.columnar import has_columnar_copy, iter_columnar_chunks, load_columns
+from app.services.readers import iter_chunks
+
+# Excel's limits
+MAX_ROWS = 1_048_576
+MAX_SHEET_NAME = 31
+
+INVALID_SHEET_CHARACTERS = re.compile(r'[\[\]:*?/\\]')
+
+EXPORT_CHUNK_ROWS = 50_000
+
+
+def dataset_chunks(source, chunksize=EXPORT_CHUNK_ROWS):
+    """DataFrame chunks of a DataUpload-like object, from its Parquet copy when there is one"""
+    if has_columnar_copy(source):
+        return iter_columnar_chunks(source, chunksize)
+    column_types = dict(getattr(source, 'column_types', None) or {})
+    return (apply_column_types(chunk, column_types)
+            for chunk in iter_chunks(source.file_path, source.file_type, chunksize=chunksize,
+                                    sheet=getattr(source, 'sheet_name', None)))
+
+
+def _cell_values(series):
+    """Python values of a column with missing entries as None, and the cell type to write"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    kind = dtype.kind
+    cell_type = {'i': 'number', 'u': 'number', 'f': 'number', 'b': 'boolean', 'M': 'datetime'}.get(kind, 'string')
+
+    values = series.astype(object).where(series.notna(), None).tolist()
+    if cell_type == 'string':
+        values = [None if value is None else str(value) for value in values]
+    return cell_type, values
+
+
+class WorkbookWriter:
+    """Write dataset and analysis sheets to an .xlsx file, listing them on a contents sheet"""
+
+    def __init__(self, path, tmpdir=None):
+        self.workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'tmpdir': tmpdir,
+            'nan_inf_to_errors': True,
+            'remove_timezone': True,
+            # Write text cells as given, never reinterpreted as numbers, formulas or links
+            'strings_to_numbers': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False
+        })
+        self.workbook.use_zip64()
+        self.bold = self.workbook.add_format({'bold': True})
+        self.datetime_format = self.workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+        self._names = set()
+        self.contents, _ = self._add_sheet('Contents')
+        self.contents.set_column(0, 0, 32)
+        self.contents.set_column(1, 1, 60)
+        self.contents.write_row(0, 0, ['Sheet', 'Contents'], self.bold)
+        self._contents_row = 1
+
+    def _add_sheet(self, title, description=None):
+        name = INVALID_SHEET_CHARACTERS.sub('_', str(title)).strip("'") or 'Sheet'
+        name = name[:MAX_SHEET_NAME]
+        candidate, number = name, 2
+        while candidate.lower() in self._names:
+            suffix = f' ({number})'
+            candidate = name[:MAX_SHEET_NAME - len(suffix)] + suffix
+            number += 1
+        self._names.add(candidate.lower())
+        sheet = self.workbook.add_worksheet(candidate)
+
+        if description is not None:
+            quoted = candidate.replace("'", "''")
+            self.contents.write_url(self._contents_row, 0, f"internal:'{quoted}'!A1", string=candidate)
+            self.contents.write_string(self._contents_row, 1, description)
+            self._contents_row += 1
+        return sheet, candidate
+
+    def _write_frame(self, sheet, frame, first_row):
+        writers = {'number': sheet.write_number, 'boolean': sheet.write_boolean,
+                   'datetime': sheet.write_datetime, 'string': sheet.write_string}
+        columns = []
+        for position in range(frame.shape[1]):
+            cell_type, values = _cell_values(frame.iloc[:, position])
+            cell_format = self.datetime_format if cell_type == 'datetime' else None
+            columns.append((position, writers[cell_type], values, cell_format))
+
+        # Row-major: constant_memory mode requires each row to be complete before the next
+        for offset in range(frame.shape[0]):
+            row = first_row + offset
+            for position, write, values, cell_format in columns:
+                value = values[offset]
+                if value is not None:
+                    write(row, position, value, cell_format)
+
+    def add_dataset(self, title, chunks, description=None, progress=None):
+        """Stream DataFrame chunks into one or more sheets; returns the rows written
+
+        Rows beyond Excel's limit continue on further sheets with the same header.
+        """
+        sheet, header, row, part, total = None, None, 0, 0, 0
+        for chunk in chunks:
+            if header is None:
+                header = [str(column) for column in chunk.columns]
+            start = 0
+            while start < len(chunk) or sheet is None:
+                if sheet is None or row >= MAX_ROWS:
+                    part += 1
+                    suffix = '' if part == 1 else f' (rows from {total + 1})'
+                    sheet, _ = self._add_sheet(title if part == 1 else f'{title} {part}',
+                                               (description or title) + suffix)
+                    sheet.write_row(0, 0, header, self.bold)
+                    sheet.freeze_panes(1, 0)
+                    row = 1
+                take = min(len(chunk) - start, MAX_ROWS - row)
+                self._write_frame(sheet, chunk.iloc[start:start + take], row)
+                row += take
+                start += take
+                total += take
+            if progress is not None:
+                progress(total)
+
+        if sheet is None:
+            sheet, _ = self._add_sheet(title, description or title)
+        return total
+
+    def add_table_sheet(self, title, details, tables, description=None):
+        """A sheet of label/value details followed by titled tables
+
+        ``tables`` is an iterable of ``(title, header, rows)``. Rows are tuples
+        or DataFrame blocks and may come from a generator, so long tables are
+        never held in memory.
+        """
+        sheet, _ = self._add_sheet(title, description or title)
+        sheet.set_column(0, 0, 24)
+        row = 0
+        for label, value in details:
+            sheet.write_string(row, 0, label, self.bold)
+            if value is not None:
+                sheet.write(row, 1, value)
+            row += 1
+
+        for table_title, header, rows in tables:
+            row += 1
+            sheet.write_string(row, 0, table_title, self.bold)
+            row += 1
+            sheet.write_row(row, 0, header, self.bold)
+            row += 1
+            # The last row is kept for a truncation note
+            limit = MAX_ROWS - 1
+            for cells in rows:
+                if row >= limit:
+                    sheet.write_string(row, 0, 'Truncated at the Excel row limit')
+                    break
+                if isinstance(cells, pd.DataFrame):
+                    cells = cells.iloc[:limit - row]
+                    self._write_frame(sheet, cells, row)
+                    row += len(cells)
+                    continue
+                for column, value in enumerate(cells):
+                    if value is not None:
+                        sheet.write(row, column, value)
+                row += 1
+        return sheet
+
+    def close(self):
+        self.workbook.close()
+
+
+def _control_chart_tables(analysis, source):
+    results = analysis.results
+    yield 'Limits', ['Chart', 'Center', 'LCL', 'UCL', 'Points', 'Out of control points'], [
+        (name, chart.get('center'), chart.get('lcl'), chart.get('ucl'), chart['points'], chart['out_of_control_points'])
+        for name, chart in results['charts'].items()
+    ]
+    yield 'Rule violations', ['Chart', 'Rule', 'Description', 'Points'], [
+        (name, rule, violation['description'], violation['count'])
+        for name, chart in results['charts'].items()
+        for rule, violation in chart['violations'].items()
+    ]
+
+    if source is None:
+        return
+    from app.services.spc import chart_series, required_columns
+    df = load_columns(source, required_columns(analysis.configuration))
+    series = chart_series(df, results, analysis.configuration)
+    del df
+
+    def points():
+        # Whole blocks of points go through the typed frame writer
+        for name, chart in series.items():
+            count = chart['values'].size
+            for start in range(0, count, EXPORT_CHUNK_ROWS):
+                window = slice(start, min(start + EXPORT_CHUNK_ROWS, count))
+                yield pd.DataFrame({
+                    'chart': name,
+                    'point': np.arange(window.start, window.stop) + chart['offset'] + 1,
+                    'subgroup': None if chart['labels'] is None else [str(label) for label in chart['labels'][window]],
+                    'value': chart['values'][window],
+                    'center': chart['center'][window],
+                    'lcl': chart['lcl'][window],
+                    'ucl': chart['ucl'][window],
+                    'out_of_control': chart['out_of_control'][window]
+                })
+
+    yield 'Points', ['Chart', 'Point', 'Subgroup', 'Value', 'Center', 'LCL', 'UCL', 'Out of control'], points()
+
+
+def _hypothesis_tables(analysis):
+    results = analysis.results
+    yield 'Tests', ['Test', 'Factor', 'Response', 'Statistic', 'p-value', 'Adjusted p-value', 'Significant', 'Note'], (
+        (test['test'], test['factor'], test['response'], test.get('statistic'), test.get('p_value'),
+         test.get('p_adjusted'), test.get('significant'), test.get('error'))
+        for test in results['tests']
+    )
+
+
+def add_analysis_sheet(writer, analysis, source):
+    """One sheet with an analysis's configuration and result tables"""
+    title = analysis.analysis_name or f"{analysis.analysis_type.replace('_', ' ').capitalize()} {analysis.id}"
+    details = [
+        ('Analysis', title),
+        ('Type', analysis.analysis_type),
+        ('DMAIC stage', analysis.dmaic_stage),
+        ('Created', analysis.created_at.strftime('%Y-%m-%d %H:%M')),
+        ('Summary', analysis.summary),
+    ]
+    details += [(f'Setting: {key}', value if isinstance(value, (int, float, str)) else json.dumps(value))
+                for key, value in sorted((analysis.configuration or {}).items()) if value is not None]
+
+    if analysis.analysis_type == 'control_chart':
+        tables = _control_chart_tables(analysis, source)
+    elif analysis.analysis_type == 'hypothesis_tests':
+        tables = _hypothesis_tables(analysis)
+    else:
+        tables = [('Results', ['Field', 'Value'], [
+            (key, json.dumps(value, default=str)) for key, value in (analysis.results or {}).items()
+        ])]
+    writer.add_table_sheet(title, details, tables, description=f"{analysis.analysis_type} analysis #{analysis.id}")
@@ -0,0 +1,40 @@
+"""Helpers for the on-disk caches under the upload folder"""
+import os
+import threading
+
+
+def atomic_write(path, data):
+    """Write bytes so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(data)
+    os.replace(temporary, path)
+
+
+def evict_least_recently_used(folder, max_bytes):
+    """Remove the oldest files (by modification time) until a folder fits its size bound
+
+    Readers touch files on use, so modification time tracks last use.
+    """
+    entries = []
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= max_bytes:
+            break
@@ -0,0 +1,141 @@
+"""Single-pass receipt of uploaded files from a multipart request body
+
+The body is decoded as it arrives. Each block of the file part is written
+to its destination and hashed, then handed to whoever is reading the
+receiver, so a CSV can be parsed and profiled while the rest is still on
+the wire. The file is read from the network once, written to disk once
+and held in memory one block at a time.
+"""
+import hashlib
+import os
+import uuid
+from collections import deque
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+# Bytes pulled from the request body at a time
+RECEIVE_BLOCK_BYTES = 1024 * 1024
+
+# Form fields (not files) are small; bound what is held for them
+FIELD_MAX_BYTES = 64 * 1024
+MAX_PARTS = 100
+
+
+class UploadReceiver:
+    """Readable view of one file in a multipart body, saved and hashed as it is read
+
+    ``start()`` reads up to the file part; reading the receiver then yields
+    the file's bytes. ``finish()`` consumes the rest of the body. The file is
+    saved in ``folder`` under a unique name with the uploaded file's
+    extension. Form fields found before or after the file are collected in
+    ``fields``.
+    """
+
+    def __init__(self, stream, boundary, folder, field='file'):
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary, max_parts=MAX_PARTS)
+        self._field = field
+        self._handle = None
+        self._part = None
+        self._field_data = bytearray()
+        self._pending = deque()
+        self._in_file = False
+        self._reading = True
+        self._done = False
+        self._folder = folder
+        self.file_path = None
+        self.filename = None
+        self.fields = {}
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def _receive(self):
+        """Decode the next block of the body; False once the body is exhausted"""
+        if self._done:
+            return False
+        data = self._stream.read(RECEIVE_BLOCK_BYTES)
+        self._decoder.receive_data(data or None)
+        try:
+            event = self._decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, Epilogue):
+                    self._done = True
+                    break
+                if isinstance(event, (Field, File)):
+                    self._start_part(event)
+                elif isinstance(event, Data):
+                    self._part_data(event)
+                event = self._decoder.next_event()
+        except ValueError as e:
+            raise BadRequest(f'Malformed form data: {str(e)}')
+        if not data and not self._done:
+            raise BadRequest('Upload ended before the end of the form data')
+        return True
+
+    def _start_part(self, event):
+        self._part = event
+        self._field_data = bytearray()
+        if isinstance(event, File) and event.name == self._field and self.filename is None:
+            self.filename = event.filename
+            extension = os.path.splitext(event.filename)[1].lower()
+            self.file_path = os.path.join(self._folder, f'{uuid.uuid4()}{extension}')
+            self._handle = open(self.file_path, 'wb')
+            self._in_file = True
+
+    def _part_data(self, event):
+        if self._in_file and self._part.name == self._field:
+            if event.data:
+                self._handle.write(event.data)
+                self.digest.update(event.data)
+                self.size += len(event.data)
+                if self._reading:
+                    self._pending.append(event.data)
+            if not event.more_data:
+                self._handle.close()
+                self._in_file = False
+                # Another part named like the file is ignored from here on
+                self._field = None
+        elif isinstance(self._part, Field):
+            self._field_data += event.data
+            if len(self._field_data) > FIELD_MAX_BYTES:
+                raise RequestEntityTooLarge(f'Form field {self._part.name} is too large')
+            if not event.more_data:
+                self.fields[self._part.name] = self._field_data.decode('utf-8', 'replace')
+
+    def start(self):
+        """Read up to the start of the file part; returns its filename, or None without one"""
+        while self.filename is None and self._receive():
+            pass
+        return self.filename
+
+    def read(self, size=-1):
+        while not self._pending and self._in_file and self._receive():
+            pass
+        if not self._pending:
+            return b''
+        block = self._pending.popleft()
+        if 0 <= size < len(block):
+            self._pending.appendleft(block[size:])
+            block = block[:size]
+        return block
+
+    def __iter__(self):
+        return iter(lambda: self.read(RECEIVE_BLOCK_BYTES), b'')
+
+    def finish(self):
+        """Consume the rest of the body, saving any unread part of the file"""
+        self._reading = False
+        self._pending.clear()
+        while self._receive():
+            pass
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+    def abort(self):
+        """Stop receiving and remove what was saved"""
+        if self._handle is not None:
+            self._handle.close()
+        if self.file_path and os.path.exists(self.file_path):
+            os.remove(self.file_path)
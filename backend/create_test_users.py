@@ -6,6 +6,7 @@ import sys
 import os
 sys.path.append('/app')
 
+from flask_migrate import upgrade
 from app import create_app, db
 from app.models import User
 from werkzeug.security import generate_password_hash
@@ -14,8 +15,8 @@ def create_test_users():
     app = create_app()
     
     with app.app_context():
-        # Create tables if they don't exist
-        db.create_all()
+        # Create or update the tables through the migrations
+        upgrade(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
         
         # Check if admin user already exists
         existing_user = User.query.filter_by(email='admin@dmaic.com').first()
@@ -0,0 +1,117 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16 23:37:48.798335
+
+The tables as the first release created them with db.create_all(); such
+databases already have this schema, so mark them with `flask db stamp 0001`
+before upgrading.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password_hash', sa.String(length=256), nullable=False),
+    sa.Column('first_name', sa.String(length=50), nullable=False),
+    sa.Column('last_name', sa.String(length=50), nullable=False),
+    sa.Column('company', sa.String(length=100), nullable=True),
+    sa.Column('role', sa.String(length=50), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+
+    op.create_table('projects',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('current_stage', sa.String(length=20), nullable=True),
+    sa.Column('problem_statement', sa.Text(), nullable=True),
+    sa.Column('project_goals', sa.Text(), nullable=True),
+    sa.Column('project_scope', sa.Text(), nullable=True),
+    sa.Column('stakeholders', sa.Text(), nullable=True),
+    sa.Column('sipoc_data', sa.JSON(), nullable=True),
+    sa.Column('success_metrics', sa.Text(), nullable=True),
+    sa.Column('baseline_data', sa.JSON(), nullable=True),
+    sa.Column('root_causes', sa.JSON(), nullable=True),
+    sa.Column('hypothesis_results', sa.JSON(), nullable=True),
+    sa.Column('improvement_ideas', sa.JSON(), nullable=True),
+    sa.Column('improvement_plan', sa.Text(), nullable=True),
+    sa.Column('control_plan', sa.Text(), nullable=True),
+    sa.Column('monitoring_metrics', sa.JSON(), nullable=True),
+    sa.Column('start_date', sa.Date(), nullable=True),
+    sa.Column('target_completion_date', sa.Date(), nullable=True),
+    sa.Column('actual_completion_date', sa.Date(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('data_uploads',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('original_filename', sa.String(length=255), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.Column('file_type', sa.String(length=50), nullable=True),
+    sa.Column('row_count', sa.Integer(), nullable=True),
+    sa.Column('column_count', sa.Integer(), nullable=True),
+    sa.Column('column_names', sa.JSON(), nullable=True),
+    sa.Column('column_types', sa.JSON(), nullable=True),
+    sa.Column('data_summary', sa.JSON(), nullable=True),
+    sa.Column('upload_stage', sa.String(length=20), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('is_primary', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('analyses',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('data_upload_id', sa.Integer(), nullable=True),
+    sa.Column('analysis_type', sa.String(length=50), nullable=False),
+    sa.Column('analysis_name', sa.String(length=100), nullable=True),
+    sa.Column('dmaic_stage', sa.String(length=20), nullable=True),
+    sa.Column('configuration', sa.JSON(), nullable=True),
+    sa.Column('results', sa.JSON(), nullable=True),
+    sa.Column('charts', sa.JSON(), nullable=True),
+    sa.Column('summary', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['data_upload_id'], ['data_uploads.id'], ),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('analyses')
+    op.drop_table('data_uploads')
+    op.drop_table('projects')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
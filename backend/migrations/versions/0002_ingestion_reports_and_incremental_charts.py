@@ -0,0 +1,85 @@
+"""Add ingestion state, reports and incremental charts
+
+Uploads record their ingestion job, content hash and columnar copy, report
+files get a table of their own, and control charts keep the running
+statistics appends update. Uploads made before ingestion ran as a job were
+profiled when they were received, so they are marked completed.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:40:12.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('columnar_path', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('columnar_schema', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('row_index_path', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('progress', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('job_id', sa.String(length=36), nullable=True))
+        batch_op.add_column(sa.Column('error_message', sa.Text(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_data_uploads_content_hash'), ['content_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_data_uploads_job_id'), ['job_id'], unique=False)
+
+    op.execute("UPDATE data_uploads SET status = 'completed', progress = 1.0")
+
+    op.create_table('reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('report_type', sa.String(length=20), nullable=False),
+    sa.Column('title', sa.String(length=200), nullable=True),
+    sa.Column('options', sa.JSON(), nullable=True),
+    sa.Column('file_path', sa.String(length=500), nullable=True),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.Column('page_count', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('progress', sa.Float(), nullable=True),
+    sa.Column('job_id', sa.String(length=36), nullable=True),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('reports', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reports_job_id'), ['job_id'], unique=False)
+
+    with op.batch_alter_table('analyses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('incremental_state', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('analyses', schema=None) as batch_op:
+        batch_op.drop_column('incremental_state')
+
+    with op.batch_alter_table('reports', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reports_job_id'))
+
+    op.drop_table('reports')
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_data_uploads_job_id'))
+        batch_op.drop_index(batch_op.f('ix_data_uploads_content_hash'))
+        batch_op.drop_column('error_message')
+        batch_op.drop_column('job_id')
+        batch_op.drop_column('progress')
+        batch_op.drop_column('status')
+        batch_op.drop_column('row_index_path')
+        batch_op.drop_column('columnar_schema')
+        batch_op.drop_column('columnar_path')
+        batch_op.drop_column('content_hash')
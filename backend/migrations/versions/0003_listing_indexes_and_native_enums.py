@@ -0,0 +1,102 @@
+"""Listing indexes and native enums
+
+Composite indexes matching the filters and sort order of every listing
+query, so pages are read in index order with no scan or sort, and native
+enum types for the stage and status columns on PostgreSQL.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 23:39:44.459685
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+dmaic_stage = postgresql.ENUM('define', 'measure', 'analyze', 'improve', 'control', name='dmaic_stage')
+project_status = postgresql.ENUM('active', 'completed', 'on_hold', 'cancelled', name='project_status')
+analysis_status = postgresql.ENUM('pending', 'running', 'completed', 'failed', 'cancelled', name='analysis_status')
+
+# (table, column, enum type)
+ENUM_COLUMNS = [
+    ('projects', 'current_stage', dmaic_stage),
+    ('projects', 'status', project_status),
+    ('analyses', 'status', analysis_status),
+]
+
+
+def create_enum_types():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    for _, _, enum_type in ENUM_COLUMNS:
+        enum_type.create(bind, checkfirst=True)
+    # Databases set up by the old init.sql have analysis_status without 'cancelled'.
+    # New enum values cannot be added inside a transaction on older PostgreSQL.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE analysis_status ADD VALUE IF NOT EXISTS 'cancelled'")
+
+
+def upgrade():
+    create_enum_types()
+    for table, column, enum_type in ENUM_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.VARCHAR(length=20),
+                   type_=sa.Enum(*enum_type.enums, name=enum_type.name),
+                   existing_nullable=True,
+                   postgresql_using=f'{column}::{enum_type.name}')
+
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.create_index('ix_projects_user_updated', ['user_id', 'updated_at', 'id'], unique=False)
+        batch_op.create_index('ix_projects_user_stage_updated', ['user_id', 'current_stage', 'updated_at', 'id'], unique=False)
+        batch_op.create_index('ix_projects_user_status_updated', ['user_id', 'status', 'updated_at', 'id'], unique=False)
+
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.create_index('ix_data_uploads_project_created', ['project_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('analyses', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_analyses_data_upload_id'), ['data_upload_id'], unique=False)
+        batch_op.create_index('ix_analyses_project_created', ['project_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_analyses_project_status_created', ['project_id', 'status', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('reports', schema=None) as batch_op:
+        batch_op.create_index('ix_reports_project_created', ['project_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reports', schema=None) as batch_op:
+        batch_op.drop_index('ix_reports_project_created')
+
+    with op.batch_alter_table('analyses', schema=None) as batch_op:
+        batch_op.drop_index('ix_analyses_project_status_created')
+        batch_op.drop_index('ix_analyses_project_created')
+        batch_op.drop_index(batch_op.f('ix_analyses_data_upload_id'))
+
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.drop_index('ix_data_uploads_project_created')
+
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.drop_index('ix_projects_user_status_updated')
+        batch_op.drop_index('ix_projects_user_stage_updated')
+        batch_op.drop_index('ix_projects_user_updated')
+
+    for table, column, enum_type in ENUM_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column,
+                   existing_type=sa.Enum(*enum_type.enums, name=enum_type.name),
+                   type_=sa.VARCHAR(length=20),
+                   existing_nullable=True,
+                   postgresql_using=f'{column}::text')
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for _, _, enum_type in ENUM_COLUMNS:
+            enum_type.drop(bind, checkfirst=True)
@@ -0,0 +1,50 @@
+"""Project version and jsonb documents
+
+Adds the version counter used for optimistic concurrency control, and on
+PostgreSQL stores the project's stage documents as jsonb so partial
+updates can be applied in the database with jsonb_set.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16 23:44:41.392096
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+DOCUMENT_COLUMNS = ['sipoc_data', 'baseline_data', 'root_causes', 'hypothesis_results',
+                    'improvement_ideas', 'monitoring_metrics']
+
+
+def upgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in DOCUMENT_COLUMNS:
+            op.alter_column('projects', column,
+                   existing_type=sa.JSON(),
+                   type_=postgresql.JSONB(),
+                   existing_nullable=True,
+                   postgresql_using=f'{column}::jsonb')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in DOCUMENT_COLUMNS:
+            op.alter_column('projects', column,
+                   existing_type=postgresql.JSONB(),
+                   type_=sa.JSON(),
+                   existing_nullable=True,
+                   postgresql_using=f'{column}::json')
+
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.drop_column('version')
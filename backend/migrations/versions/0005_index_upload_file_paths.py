@@ -0,0 +1,29 @@
+"""Index upload file paths
+
+Uploads with the same contents share one stored file; the index serves
+the count of uploads still using a file before it is changed or deleted.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16 23:59:56.499673
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_data_uploads_file_path'), ['file_path'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_data_uploads_file_path'))
@@ -0,0 +1,40 @@
+"""Add workbook sheets
+
+Each worksheet of a multi-sheet Excel upload is a data upload of its own,
+linked to the workbook's upload by parent_id and deleted along with it.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 00:21:42.269711
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('sheet_name', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('sheet_index', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('sheet_names', sa.JSON(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_data_uploads_parent_id'), ['parent_id'], unique=False)
+        batch_op.create_foreign_key('fk_data_uploads_parent_id', 'data_uploads', ['parent_id'], ['id'],
+                                    ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('data_uploads', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_data_uploads_parent_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_data_uploads_parent_id'))
+        batch_op.drop_column('sheet_names')
+        batch_op.drop_column('sheet_index')
+        batch_op.drop_column('sheet_name')
+        batch_op.drop_column('parent_id')
@@ -0,0 +1,48 @@
+"""An application on a temporary database and upload folder, with a signed-in user"""
+import os
+
+import pytest
+
+from app import create_app, db
+from app.config import Config, TestingConfig
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    upload_folder = str(tmp_path / 'uploads')
+    os.makedirs(upload_folder)
+    # The upload routes store files under Config.UPLOAD_FOLDER
+    monkeypatch.setattr(Config, 'UPLOAD_FOLDER', upload_folder)
+
+    class AppConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'app.db'}"
+        UPLOAD_FOLDER = upload_folder
+        REPORTS_FOLDER = os.path.join(upload_folder, 'reports')
+        CHART_CACHE_FOLDER = os.path.join(upload_folder, 'charts')
+
+    app = create_app(AppConfig)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post('/api/auth/signup', json={
+        'email': 'analyst@example.com', 'password': 'secret1', 'first_name': 'Ada', 'last_name': 'Analyst'
+    })
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+@pytest.fixture
+def project_id(client, auth_headers):
+    response = client.post('/api/projects', json={'title': 'Line 4 scrap'}, headers=auth_headers)
+    return response.get_json()['project']['id']
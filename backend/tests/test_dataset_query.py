@@ -0,0 +1,25 @@
+"""Dataset query pages"""
+from types import SimpleNamespace
+
+import pandas as pd
+
+from app.services.dataset_query import run_query
+
+
+def csv_source(tmp_path, df):
+    path = tmp_path / 'data.csv'
+    df.to_csv(path, index=False)
+    return SimpleNamespace(id=1, file_path=str(path), file_type='csv', sheet_name=None, columnar_path=None,
+                           column_names=list(df.columns), column_types=None)
+
+
+def test_sorted_pages_keep_rows_with_missing_keys_last(tmp_path):
+    source = csv_source(tmp_path, pd.DataFrame({'shift': ['B', None, 'A', None, 'C'], 'row': range(5)}))
+
+    for descending, expected in ((False, [2, 0, 4, 1, 3]), (True, [4, 0, 2, 1, 3])):
+        sort = [{'column': 'shift', 'descending': descending}]
+        df, total = run_query(source, sort=sort, limit=10)
+        assert total == 5
+        assert df['row'].tolist() == expected
+        df, _ = run_query(source, sort=sort, offset=3, limit=2)
+        assert df['row'].tolist() == expected[3:]
@@ -0,0 +1,67 @@
+"""Ingested uploads keep the file's values whatever chunk their types settle in"""
+import io
+
+import numpy as np
+import pandas as pd
+
+from app.services.readers import CHUNK_ROWS
+
+
+def upload_csv(client, headers, project_id, df, name='data.csv'):
+    body = io.BytesIO(df.to_csv(index=False).encode('utf-8'))
+    response = client.post(f'/api/data/upload/{project_id}', data={'file': (body, name)}, headers=headers,
+                           content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['data_upload']
+
+
+def query(client, headers, upload_id, **body):
+    response = client.post(f'/api/data/upload/{upload_id}/query', json=body, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_column_widened_after_first_chunk_keeps_source_text(client, auth_headers, project_id):
+    rows = CHUNK_ROWS + CHUNK_ROWS // 2
+    labels = np.where(np.arange(rows) % 3 == 2, 'Fail', 'Pass').astype(object)
+    dates = pd.date_range('2024-01-01', periods=rows, freq='min').strftime('%Y-%m-%d').to_numpy(dtype=object)
+    # Booleans cannot hold a gap, and the second chunk has a date in another format
+    labels[CHUNK_ROWS + 10] = None
+    dates[CHUNK_ROWS + 20] = 'not recorded'
+    df = pd.DataFrame({'Pass_Fail': labels, 'Day': dates, 'Value': np.arange(rows)})
+
+    upload = upload_csv(client, auth_headers, project_id, df)
+    assert upload['column_types']['Pass_Fail'] == 'object'
+    assert upload['column_types']['Day'] == 'object'
+
+    passed = query(client, auth_headers, upload['id'], filters=[{'column': 'Pass_Fail', 'op': '==', 'value': 'Pass'}],
+                   limit=1)
+    assert passed['total_rows'] == int((df['Pass_Fail'] == 'Pass').sum())
+
+    groups = query(client, auth_headers, upload['id'], group_by=['Pass_Fail'], aggregates=[{'function': 'count'}])
+    counts = {row['Pass_Fail']: row['count'] for row in groups['data']}
+    assert counts == {'Pass': int((labels == 'Pass').sum()), 'Fail': int((labels == 'Fail').sum()), None: 1}
+
+    first = query(client, auth_headers, upload['id'], columns=['Day'], limit=1)
+    assert first['data'][0]['Day'] == '2024-01-01'
+
+
+def test_append_profiles_every_row(client, auth_headers, project_id):
+    first = pd.DataFrame({'Shift': ['A', 'B'] * 25, 'Cycle_Time': np.linspace(10, 20, 50)})
+    upload = upload_csv(client, auth_headers, project_id, first)
+
+    appended = pd.DataFrame({'Shift': ['C'] * 50, 'Cycle_Time': [np.nan] * 10 + [30.0] * 40})
+    body = io.BytesIO(appended.to_csv(index=False).encode('utf-8'))
+    response = client.post(f"/api/data/upload/{upload['id']}/append", data={'file': (body, 'more.csv')},
+                           headers=auth_headers, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+
+    upload = response.get_json()['data_upload']
+    summary = upload['data_summary']
+    cycle_time = next(column for column in summary['numeric_columns'] if column['column'] == 'Cycle_Time')
+    shift = next(column for column in summary['categorical_columns'] if column['column'] == 'Shift')
+    assert upload['row_count'] == 100
+    assert cycle_time['count'] == 90
+    assert cycle_time['max'] == 30.0
+    assert summary['missing_values'] == {'Shift': 0, 'Cycle_Time': 10}
+    assert shift['unique_count'] == 3
@@ -0,0 +1,57 @@
+"""Every listing query is served by an index in order, on SQLite and PostgreSQL
+
+The schema is built by the migrations, so a listing query or index change
+that is not matched by a migration fails here. The PostgreSQL variant runs
+when TEST_DATABASE_URL names a PostgreSQL database it may upgrade.
+"""
+import os
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import create_engine
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.services.query_plans import check_plans
+
+MIGRATIONS = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+
+
+def postgresql_url():
+    url = os.environ.get('TEST_DATABASE_URL', '')
+    if not url.startswith('postgresql'):
+        return None
+    try:
+        create_engine(url).connect().close()
+    except Exception:
+        return None
+    return url
+
+
+def migrated_app(database_url, upload_folder):
+    class PlanConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+        UPLOAD_FOLDER = upload_folder
+        REPORTS_FOLDER = os.path.join(upload_folder, 'reports')
+
+    app = create_app(PlanConfig)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+    return app
+
+
+def assert_index_ordered(app):
+    with app.app_context():
+        failures = {name: problems for name, problems in check_plans(db.session) if problems}
+    assert failures == {}
+
+
+def test_listing_plans_sqlite(tmp_path):
+    app = migrated_app(f"sqlite:///{tmp_path / 'plans.db'}", str(tmp_path))
+    assert_index_ordered(app)
+
+
+@pytest.mark.skipif(postgresql_url() is None, reason='TEST_DATABASE_URL does not name a reachable PostgreSQL database')
+def test_listing_plans_postgresql(tmp_path):
+    app = migrated_app(postgresql_url(), str(tmp_path))
+    assert_index_ordered(app)
@@ -0,0 +1,19 @@
+"""Control chart limits"""
+import pandas as pd
+
+from app.services.spc import chart_series, control_chart
+
+
+def test_variable_size_limits_are_kept_per_exact_size():
+    # Sizes of a million and more differ beyond six significant digits
+    sizes = [1_000_000, 1_000_001, 2_500_000, 1_000_000, 1_000_001, 2_500_000] * 5
+    df = pd.DataFrame({'defects': [30, 45, 70, 25, 40, 80] * 5, 'units': sizes})
+    configuration = {'chart_type': 'u', 'column': 'defects', 'sample_size_column': 'units'}
+
+    results, _ = control_chart(df, configuration)
+    limits = results['charts']['u']['limits_by_size']
+    assert sorted(limits) == ['1000000', '1000001', '2500000']
+
+    series = chart_series(df, results, configuration)['u']
+    for position, size in enumerate(sizes):
+        assert series['ucl'][position] == limits[str(size)]['ucl']